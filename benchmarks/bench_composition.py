@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""CPU use & latency of silo nodes in separate processes vs composed in one process
+
+Frames are streamed to the image receiver over TCP as by the camera, a stand-in of YOLO
+answers every frame with fixed detections, and the age of each stage is collected from
+the traces of the nodes (trace:=True). Needs a sourced ROS 2 workspace with silo built.
+"""
+
+import argparse
+import glob
+import os
+import socket
+import struct
+import subprocess
+import threading
+import time
+from typing import Dict, List
+
+import rclpy
+from bench_decode import synthetic_jpeg
+from diagnostic_msgs.msg import DiagnosticArray
+from nav_msgs.msg import Odometry
+from rclpy.executors import SingleThreadedExecutor
+from rclpy.node import Node
+from rclpy.qos import QoSProfile, QoSReliabilityPolicy
+from sensor_msgs.msg import Image
+from yolov8_msgs.msg import Detection, DetectionArray
+
+from silo.image_receiver import PORT
+from silo.trace_collector import TRACE_TOPIC
+from silo.tracing import TraceStats, decode_span
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config")
+NAMESPACE = "/silo"
+LAYOUTS = {
+  "processes": [
+    "image_receiver_node",
+    "state_estimation_node",
+    "absolute_silo_state_node",
+    "silo_selection_node",
+    "silos_marker_node",
+    "target_node",
+    "static_tf_node",
+  ],
+  "composed": ["silo_composed_node"],
+}
+# x of silos & states of their balls from bottom
+SILOS = ((100, "RB"), (280, "B"), (460, ""), (640, "RBR"), (820, "R"))
+BALL_CLASSES = {"B": "blue-ball", "R": "red-ball"}
+
+
+def fake_detections() -> List[Detection]:
+  detections = []
+
+  def add(class_name: str, x: float, y: float, width: float, height: float):
+    detection = Detection()
+    detection.class_name = class_name
+    detection.score = 0.9
+    detection.bbox.center.position.x = float(x)
+    detection.bbox.center.position.y = float(y)
+    detection.bbox.size.x = float(width)
+    detection.bbox.size.y = float(height)
+    detections.append(detection)
+
+  for x, state in SILOS:
+    add("silo", x, 300, 120, 260)
+    for i, ball in enumerate(state):
+      add(BALL_CLASSES[ball], x, 400 - 70 * i, 60, 60)
+  return detections
+
+
+class PipelineDriver(Node):
+  def __init__(self):
+    """! Stand-ins of YOLO & odometry, collector of traces"""
+    super().__init__("composition_benchmark")
+    image_qos = QoSProfile(depth=1, reliability=QoSReliabilityPolicy.BEST_EFFORT)
+    self.detections = fake_detections()
+    self.frames = 0
+    self.stats = TraceStats()
+    self.lock = threading.Lock()
+
+    self.detections_pub = self.create_publisher(
+      DetectionArray, f"{NAMESPACE}/yolo/tracking", 10
+    )
+    self.create_subscription(
+      Image, f"{NAMESPACE}/image_raw", self.image_callback, image_qos
+    )
+    self.create_subscription(DiagnosticArray, TRACE_TOPIC, self.trace_callback, 100)
+    self.odometry_pub = self.create_publisher(Odometry, "/odometry/filtered", 10)
+    self.create_timer(0.02, self.publish_odometry)
+
+  def image_callback(self, msg: Image):
+    detections_msg = DetectionArray(header=msg.header, detections=self.detections)
+    self.detections_pub.publish(detections_msg)
+    with self.lock:
+      self.frames += 1
+
+  def trace_callback(self, msg: DiagnosticArray):
+    with self.lock:
+      for status in msg.status:
+        for key_value in status.values:
+          self.stats.add(status.name, decode_span(key_value.key, key_value.value))
+
+  def publish_odometry(self):
+    odometry = Odometry()
+    odometry.header.stamp = self.get_clock().now().to_msg()
+    odometry.header.frame_id = "map"
+    odometry.child_frame_id = "base_link"
+    odometry.pose.pose.orientation.w = 1.0
+    self.odometry_pub.publish(odometry)
+
+  def reset(self):
+    with self.lock:
+      self.frames = 0
+      self.stats = TraceStats()
+
+
+def stream_frames(frame: bytes, fps: float, stop: threading.Event):
+  """! Send frame to image receiver at fps until stopped, reconnecting as needed"""
+  packet = struct.pack(">L", len(frame)) + frame
+  while not stop.is_set():
+    try:
+      with socket.create_connection(("127.0.0.1", PORT), timeout=1.0) as client:
+        next_send = time.monotonic()
+        while not stop.is_set():
+          client.sendall(packet)
+          next_send += 1 / fps
+          time.sleep(max(0.0, next_send - time.monotonic()))
+    except OSError:
+      time.sleep(0.5)
+
+
+def process_tree(pid: int) -> List[int]:
+  pids = [pid]
+  for children in glob.glob(f"/proc/{pid}/task/*/children"):
+    try:
+      with open(children) as f:
+        for child in f.read().split():
+          pids.extend(process_tree(int(child)))
+    except OSError:
+      pass
+  return pids
+
+
+def cpu_seconds(pid: int) -> float:
+  try:
+    with open(f"/proc/{pid}/stat") as f:
+      fields = f.read().rsplit(")", 1)[1].split()
+  except OSError:
+    return 0.0
+  # utime & stime, fields 14 & 15 of stat
+  return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def rss_mib(pid: int) -> float:
+  try:
+    with open(f"/proc/{pid}/status") as f:
+      for line in f:
+        if line.startswith("VmRSS:"):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+  return 0.0
+
+
+def ros_args() -> List[str]:
+  args = ["--ros-args", "-r", f"__ns:={NAMESPACE}"]
+  for config in ("camera_info", "silo", "base2cam", "check_top"):
+    args += ["--params-file", os.path.join(CONFIG_PATH, f"{config}.yaml")]
+  # No journal of a previous run, no model for top check
+  args += ["-p", "trace:=True", "-p", "journal_path:=''", "-p", "use_model:=False"]
+  return args
+
+
+def run_layout(
+  layout: str, driver: PipelineDriver, args: argparse.Namespace
+) -> Dict[str, object]:
+  processes = [
+    subprocess.Popen(
+      ["ros2", "run", "silo", executable, *ros_args()],
+      stdout=subprocess.DEVNULL,
+      stderr=subprocess.DEVNULL,
+      start_new_session=True,
+    )
+    for executable in LAYOUTS[layout]
+  ]
+  stop = threading.Event()
+  frame = synthetic_jpeg(921, 518, 90)
+  sender = threading.Thread(target=stream_frames, args=(frame, args.fps, stop))
+  sender.start()
+  try:
+    time.sleep(args.warmup)
+    driver.reset()
+    pids = [pid for process in processes for pid in process_tree(process.pid)]
+    cpu_start = sum(map(cpu_seconds, pids))
+    start = time.monotonic()
+    time.sleep(args.duration)
+    elapsed = time.monotonic() - start
+    cpu = sum(map(cpu_seconds, pids)) - cpu_start
+    rss = sum(map(rss_mib, pids))
+    with driver.lock:
+      frames = driver.frames
+    # Last batches of spans
+    time.sleep(1.5)
+  finally:
+    stop.set()
+    sender.join()
+    for process in processes:
+      os.killpg(process.pid, 2)
+    for process in processes:
+      try:
+        process.wait(5.0)
+      except subprocess.TimeoutExpired:
+        os.killpg(process.pid, 9)
+
+  with driver.lock:
+    summary = driver.stats.summary()
+  return {
+    "processes": len(processes),
+    "cpu": 100 * cpu / elapsed,
+    "rss": rss,
+    "fps": frames / elapsed,
+    "stages": summary,
+  }
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+  parser.add_argument("--fps", type=float, default=30.0)
+  parser.add_argument("--warmup", type=float, default=8.0, help="seconds")
+  parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+  args = parser.parse_args()
+
+  rclpy.init()
+  driver = PipelineDriver()
+  executor = SingleThreadedExecutor()
+  executor.add_node(driver)
+  spinner = threading.Thread(target=executor.spin, daemon=True)
+  spinner.start()
+
+  results = {layout: run_layout(layout, driver, args) for layout in args.layouts}
+
+  print(f"{'layout':<10} {'processes':>9} {'CPU %':>7} {'RSS MiB':>8} {'fps out':>8}")
+  for layout, result in results.items():
+    print(
+      f"{layout:<10} {result['processes']:>9} {result['cpu']:7.1f}"
+      f" {result['rss']:8.1f} {result['fps']:8.1f}"
+    )
+  for layout, result in results.items():
+    print(f"\n{layout}: age of frame at end of stage p50/p95/p99 ms")
+    for stats in result["stages"]:
+      ages = "/".join(f"{age:.1f}" for age in stats.age)
+      print(f"  {stats.name:<48} {ages:>20} ({stats.count} spans)")
+
+  executor.shutdown()
+  driver.destroy_node()
+  rclpy.shutdown()
+
+
+if __name__ == "__main__":
+  main()
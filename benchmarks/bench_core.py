@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Import time of the pure core modules & throughput of the estimation loop"""
+
+import argparse
+import random
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from silo.absolute_state import AbsoluteStateTracker
+from silo.estimation import Detection, DetectionStateEstimator
+from silo.selection import SiloSelector
+from silo.stacks import STACKS
+from silo.travel_cost import TravelCost
+
+CORE_MODULES = (
+  "silo.estimation",
+  "silo.absolute_state",
+  "silo.selection",
+  "silo.hsv_estimation",
+  "silo.top_check",
+)
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+BALL_CLASSES = {"B": "blue-ball", "R": "red-ball"}
+
+
+def import_time(module: str, runs: int) -> float:
+  """! Best time to import module in a fresh interpreter, NaN if it fails"""
+  best = float("inf")
+  for _ in range(runs):
+    process = subprocess.run(
+      [sys.executable, "-c", IMPORT_SCRIPT.format(module=module)],
+      capture_output=True,
+      text=True,
+    )
+    if process.returncode != 0:
+      return float("nan")
+    best = min(best, float(process.stdout))
+  return best
+
+
+def random_frame(rng: random.Random):
+  """! Detections of 5 silos & their balls"""
+  detections = []
+  for i in range(5):
+    x = 100 + 170 * i
+    detections.append(Detection("silo", x, 300, 100, 240))
+    for j, ball in enumerate(rng.choice(STACKS)):
+      detections.append(Detection(BALL_CLASSES[ball], x, 380 - 70 * j, 60, 60))
+  rng.shuffle(detections)
+  return detections
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-n", "--iterations", type=int, default=50_000)
+  parser.add_argument("--import-runs", type=int, default=5)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  print("Import time (fresh interpreter, best of runs)")
+  for module in CORE_MODULES:
+    elapsed = import_time(module, args.import_runs)
+    if np.isnan(elapsed):
+      print(f"  {module:<22} not importable")
+    else:
+      print(f"  {module:<22} {elapsed * 1e3:8.1f} ms")
+
+  rng = random.Random(args.seed)
+  # Same frame repeated so that states are confirmed regularly
+  frames = [frame for frame in (random_frame(rng) for _ in range(64)) for _ in range(5)]
+  estimator = DetectionStateEstimator("blue", 921, 518)
+  tracker = AbsoluteStateTracker("B", 921)
+  travel_cost = TravelCost(
+    np.array([(x, 5.5) for x in (0.5, 1.25, 2.0, 2.75, 3.5)]), 0.5, 1.5, 2.0
+  )
+  selector = SiloSelector("B", "R", travel_cost)
+  selector.add_pose(0.0, 2.0, 2.0, 0.0)
+
+  times = np.zeros((3, args.iterations))
+  for i in range(args.iterations):
+    start = time.perf_counter()
+    observations = estimator.estimate(frames[i % len(frames)])
+    estimated = time.perf_counter()
+    tracker.update(observations)
+    tracked = time.perf_counter()
+    silos = list(enumerate(tracker.states, start=1))
+    selector.update_score(silos)
+    selector.select(silos, 0.0)
+    selected = time.perf_counter()
+    times[:, i] = estimated - start, tracked - estimated, selected - tracked
+
+  print(f"Estimation loop ({args.iterations} frames)")
+  for name, stage_times in zip(("estimate", "track", "select"), times):
+    print(
+      f"  {name:<8} mean {stage_times.mean() * 1e6:7.2f} us"
+      f" | p99 {np.percentile(stage_times, 99) * 1e6:7.2f} us"
+    )
+  print(f"  {args.iterations / times.sum():,.0f} frames/s")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""Time per decode of a JPEG frame: full vs reduced-scale decode of the top ROI"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from silo.jpeg_decode import SCALE_FLAGS, decode, scale_roi
+
+
+def synthetic_jpeg(width: int, height: int, quality: int) -> bytes:
+  """! JPEG of a smooth frame with a few balls, compresses like a camera frame"""
+  x = np.linspace(0, 255, width, dtype=np.float32)
+  y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+  img = np.dstack([(x + y) / 2, np.broadcast_to(x, (height, width)), 255 - (x + y) / 2])
+  img = img.astype(np.uint8)
+  rng = np.random.default_rng(0)
+  for _ in range(6):
+    center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+    color = (255, 0, 0) if rng.random() < 0.5 else (0, 0, 255)
+    cv2.circle(img, center, 40, color, -1)
+  return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--image", default="", help="JPEG frame, synthetic if empty")
+  parser.add_argument("--roi", type=int, nargs=4, default=[0, 0, 921, 275])
+  parser.add_argument("--quality", type=int, default=90)
+  parser.add_argument("-n", "--iterations", type=int, default=300)
+  args = parser.parse_args()
+
+  if args.image:
+    with open(args.image, "rb") as f:
+      data = f.read()
+  else:
+    data = synthetic_jpeg(921, 518, args.quality)
+  print(f"Frame of {len(data) / 1024:.1f} KiB, top ROI {args.roi}")
+
+  print(f"{'decode':<12} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'ROI size':>10}")
+  for scale in SCALE_FLAGS:
+    times = np.zeros(args.iterations)
+    for i in range(args.iterations):
+      start = time.perf_counter()
+      x1, y1, x2, y2 = scale_roi(args.roi, scale)
+      roi = decode(data, scale)[y1:y2, x1:x2]
+      times[i] = time.perf_counter() - start
+    p50, p99 = np.percentile(times, [50, 99]) * 1e3
+    label = "full" if scale == 1 else f"1/{scale} scale"
+    print(
+      f"{label:<12} {times.mean() * 1e3:8.2f} {p50:8.2f} {p99:8.2f}"
+      f" {roi.shape[1]:>5}x{roi.shape[0]:<4}"
+    )
+
+
+if __name__ == "__main__":
+  main()
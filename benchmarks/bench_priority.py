@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""Throughput of silo ranking over random silo states"""
+
+import argparse
+import random
+import time
+
+from silo.priority import build_priority_table, rank_silos
+from silo.stacks import STACKS
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-n", "--iterations", type=int, default=200_000)
+  parser.add_argument("-k", "--targets", type=int, default=2)
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  rng = random.Random(args.seed)
+  table = build_priority_table("B", "R")
+  samples = [
+    (
+      list(enumerate(rng.choices(STACKS, k=5), start=1)),
+      [rng.uniform(0.0, 5.0) for _ in range(5)],
+    )
+    for _ in range(1024)
+  ]
+
+  start = time.perf_counter()
+  for i in range(args.iterations):
+    silos, distances = samples[i & 1023]
+    rank_silos(silos, distances, table, args.targets)
+  elapsed = time.perf_counter() - start
+
+  print(f"rank_silos (k={args.targets})")
+  print(f"  {args.iterations / elapsed:,.0f} decisions/s")
+  print(f"  {elapsed / args.iterations * 1e6:.2f} us/decision")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""Import time & memory of the module of every console script of setup.py"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+SETUP_PATH = os.path.join(os.path.dirname(__file__), "..", "setup.py")
+ENTRY_POINT_PATTERN = re.compile(r'"\s*([\w-]+)\s*=\s*([\w.]+):(\w+)\s*"')
+IMPORT_SCRIPT = """
+import importlib, json, resource, time
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+try:
+  module = importlib.import_module({module!r})
+  getattr(module, {function!r})
+  error = ""
+except Exception as e:
+  error = f"{{type(e).__name__}}: {{e}}"
+elapsed = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{"time": elapsed, "rss": peak, "import_rss": peak - baseline,
+  "error": error}}))
+"""
+
+
+def console_scripts(setup_path: str):
+  """! (name, module, function) of console scripts"""
+  with open(setup_path) as f:
+    content = f.read()
+  section = content[content.index('"console_scripts"') :]
+  return ENTRY_POINT_PATTERN.findall(section[: section.index("]")])
+
+
+def measure(module: str, function: str) -> dict:
+  """! Import of module in a fresh interpreter, RSS in KiB"""
+  process = subprocess.run(
+    [sys.executable, "-c", IMPORT_SCRIPT.format(module=module, function=function)],
+    capture_output=True,
+    text=True,
+  )
+  if process.returncode != 0:
+    return {"time": 0.0, "rss": 0, "import_rss": 0, "error": process.stderr[-200:]}
+  return json.loads(process.stdout)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("-r", "--runs", type=int, default=3, help="best of runs")
+  parser.add_argument("--setup", default=SETUP_PATH, help="path of setup.py")
+  args = parser.parse_args()
+
+  print(f"{'console script':<32} {'import ms':>10} {'RSS MiB':>8} {'+import MiB':>12}")
+  for name, module, function in console_scripts(args.setup):
+    runs = [measure(module, function) for _ in range(args.runs)]
+    best = min(runs, key=lambda run: run["time"])
+    if best["error"]:
+      print(f"{name:<32} failed -> {best['error'].strip().splitlines()[-1]}")
+      continue
+    print(
+      f"{name:<32} {best['time'] * 1e3:10.1f} {best['rss'] / 1024:8.1f}"
+      f" {best['import_rss'] / 1024:12.1f}"
+    )
+
+
+if __name__ == "__main__":
+  main()
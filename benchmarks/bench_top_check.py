@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Latency of top check backends: PyTorch (ultralytics) vs ONNX on CPU"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from silo.top_check import make_top_check
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--pt", default="", help="YOLOv8 weights for yolo backend")
+  parser.add_argument("--onnx", default="", help="ONNX model for CPU backends")
+  parser.add_argument("--int8", default="", help="INT8 quantized ONNX model")
+  parser.add_argument("--image", default="", help="frame to check, random if empty")
+  parser.add_argument("--roi", type=int, nargs=4, default=[0, 0, 921, 275])
+  parser.add_argument("--input-size", type=int, default=320)
+  parser.add_argument("--device", default="cpu", help="device of yolo backend")
+  parser.add_argument("--threads", type=int, default=0)
+  parser.add_argument("-n", "--iterations", type=int, default=200)
+  args = parser.parse_args()
+
+  if args.image:
+    bgr_img = cv2.imread(args.image)
+  else:
+    bgr_img = np.random.default_rng(0).integers(0, 255, (518, 921, 3), dtype=np.uint8)
+
+  common = {"top_roi": args.roi, "input_size": args.input_size}
+  backends = []
+  if args.pt:
+    backends.append(("yolo", "yolo", {"model": args.pt, "device": args.device}))
+  for model, label in ((args.onnx, ""), (args.int8, " int8")):
+    if model:
+      for runtime in ("onnxruntime", "opencv"):
+        backends.append(
+          (runtime + label, runtime, {"model": model, "threads": args.threads})
+        )
+  if not backends:
+    parser.error("no model given")
+
+  print(f"{'backend':<18} {'startup s':>9} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+  for label, backend, kwargs in backends:
+    start = time.perf_counter()
+    try:
+      top_check = make_top_check(backend, **common, **kwargs)
+    except Exception as e:
+      print(f"{label:<18} unavailable -> {type(e).__name__}: {e}")
+      continue
+    startup = time.perf_counter() - start
+
+    times = np.zeros(args.iterations)
+    for i in range(args.iterations):
+      start = time.perf_counter()
+      top_check(bgr_img)
+      times[i] = time.perf_counter() - start
+    p50, p99 = np.percentile(times, [50, 99]) * 1e3
+    print(f"{label:<18} {startup:9.2f} {times.mean() * 1e3:8.2f} {p50:8.2f} {p99:8.2f}")
+
+
+if __name__ == "__main__":
+  main()
@@ -2,6 +2,8 @@ import rclpy
 from nav_msgs.msg import Odometry
 from rclpy.node import Node
 
+from silo.profiling import attach_profiler
+
 
 class OdometryPublisher(Node):
   def __init__(self):
@@ -28,6 +30,7 @@ class OdometryPublisher(Node):
 def main(args=None):
   rclpy.init(args=args)
   transform_publisher = OdometryPublisher()
+  attach_profiler(transform_publisher)
   rclpy.spin(transform_publisher)
   transform_publisher.destroy_node()
   rclpy.shutdown()
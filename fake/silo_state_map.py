@@ -2,6 +2,8 @@ import rclpy
 from rclpy.node import Node
 from silo_msgs.msg import Silo, SiloArray
 
+from silo.profiling import attach_profiler
+
 
 class FakeSiloStatePublisher(Node):
   def __init__(self):
@@ -41,6 +43,7 @@ def main(args=None):
   rclpy.init(args=args)
 
   fake_silo_state_publisher = FakeSiloStatePublisher()
+  attach_profiler(fake_silo_state_publisher)
 
   rclpy.spin(fake_silo_state_publisher)
 
@@ -12,6 +12,9 @@ def generate_launch_description():
   check_top_config = os.path.join(
     get_package_share_directory("silo"), "config", "check_top.yaml"
   )
+  camera_info_config = os.path.join(
+    get_package_share_directory("silo"), "config", "camera_info.yaml"
+  )
   #
   # ARGS
   #
@@ -60,7 +63,7 @@ def generate_launch_description():
       ("/silo_check_request", silo_check_request_topic),
       ("/silo_check_result", silo_check_result_topic),
     ],
-    parameters=[check_top_config],
+    parameters=[camera_info_config, check_top_config],
   )
 
   ld = LaunchDescription()
@@ -59,6 +59,13 @@ def generate_launch_description():
     ],
   )
 
+  trace_collector_node_cmd = Node(
+    package="silo",
+    namespace=namespace,
+    executable="trace_collector_node",
+    name="trace_collector_node",
+  )
+
   ld = LaunchDescription()
 
   ld.add_action(namespace_cmd)
@@ -67,4 +74,5 @@ def generate_launch_description():
 
   ld.add_action(capture_node_cmd)
   ld.add_action(broadcast_node_cmd)
+  ld.add_action(trace_collector_node_cmd)
   return ld
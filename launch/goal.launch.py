@@ -14,6 +14,9 @@ def generate_launch_description():
   common_config = os.path.join(
     get_package_share_directory("robot"), "config", "common.yaml"
   )
+  base2cam_config = os.path.join(
+    get_package_share_directory("silo"), "config", "base2cam.yaml"
+  )
 
   namespace = LaunchConfiguration("namespace")
   namespace_cmd = DeclareLaunchArgument(
@@ -49,7 +52,7 @@ def generate_launch_description():
       ("/silo_number", silo_number_topic),
       ("/is_game_over", game_over_topic),
     ],
-    parameters=[silo_config, common_config],
+    parameters=[silo_config, common_config, base2cam_config],
   )
 
   target_node_cmd = Node(
@@ -108,6 +108,7 @@ def generate_launch_description():
       "namespace": namespace,
       "tracking_topic": namespace + "/" + tracking_topic,
       "aligned_silo_topic": aligned_silo_topic,
+      "pose_topic": baselink_pose_topic,
     }.items(),
   )
 
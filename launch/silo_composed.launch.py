@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+import os
+
+from ament_index_python.packages import get_package_share_directory
+from launch import LaunchDescription
+from launch.actions import DeclareLaunchArgument, IncludeLaunchDescription
+from launch.launch_description_sources import PythonLaunchDescriptionSource
+from launch.substitutions import LaunchConfiguration
+from launch_ros.actions import Node
+
+
+# Layout of silo.launch.py with the silo nodes composed in one process
+def generate_launch_description():
+  namespace = "/silo"
+  input_image_topic = "image_raw"
+  tracking_topic = "yolo/tracking"
+  model = "silo_team_red.pt"
+  tracker = "custom_tracker.yaml"
+  baselink_pose_topic = "/odometry/filtered"
+  silo_number_topic = "/silo_number"
+  aligned_silo_topic = "/aligned_silo"
+  game_over_topic = "/is_game_over"
+  infer_on = "cuda:0"
+  iou = "0.25"
+  check_top_service = "/is_ball_at_top"
+  silo_check_request_topic = "/silo_check_request"
+  silo_check_result_topic = "/silo_check_result"
+
+  config_path = os.path.join(get_package_share_directory("silo"), "config")
+  common_config = os.path.join(
+    get_package_share_directory("robot"), "config", "common.yaml"
+  )
+
+  threads = LaunchConfiguration("threads")
+  threads_cmd = DeclareLaunchArgument(
+    "threads", default_value="0", description="Executor threads, 0 for CPU count"
+  )
+
+  # Parameters & remappings apply to every node of the process, so no node name is
+  # given: it would rename all of them
+  silo_nodes_cmd = Node(
+    package="silo",
+    namespace=namespace,
+    executable="silo_composed_node",
+    arguments=["--threads", threads],
+    remappings=[
+      ("image_raw", input_image_topic),
+      ("yolo/tracking", namespace + "/" + tracking_topic),
+      ("/is_ball_at_top", check_top_service),
+      ("/silo_check_request", silo_check_request_topic),
+      ("/silo_check_result", silo_check_result_topic),
+      ("/aligned_silo", aligned_silo_topic),
+      ("/odometry/filtered", baselink_pose_topic),
+      ("/silo_number", silo_number_topic),
+      ("/is_game_over", game_over_topic),
+    ],
+    parameters=[
+      common_config,
+      os.path.join(config_path, "camera_info.yaml"),
+      os.path.join(config_path, "silo.yaml"),
+      os.path.join(config_path, "base2cam.yaml"),
+      os.path.join(config_path, "check_top.yaml"),
+    ],
+  )
+
+  yolov8_bringup = IncludeLaunchDescription(
+    PythonLaunchDescriptionSource(
+      [
+        os.path.join(get_package_share_directory("yolov8_bringup"), "launch"),
+        "/yolov8.launch.py",
+      ]
+    ),
+    launch_arguments={
+      "namespace": namespace + "/yolo",
+      "input_image_topic": namespace + "/" + input_image_topic,
+      "model": os.path.join(get_package_share_directory("robot"), "models", f"{model}"),
+      "tracker": os.path.join(
+        get_package_share_directory("robot"), "config", f"{tracker}"
+      ),
+      "device": infer_on,
+      "iou": iou,
+    }.items(),
+  )
+
+  ld = LaunchDescription()
+
+  ld.add_action(threads_cmd)
+  ld.add_action(silo_nodes_cmd)
+  ld.add_action(yolov8_bringup)
+
+  return ld
@@ -17,6 +17,9 @@ def generate_launch_description():
   camera_info_config = os.path.join(
     get_package_share_directory("silo"), "config", "camera_info.yaml"
   )
+  base2cam_config = os.path.join(
+    get_package_share_directory("silo"), "config", "base2cam.yaml"
+  )
 
   namespace = LaunchConfiguration("namespace")
   namespace_cmd = DeclareLaunchArgument(
@@ -37,6 +40,13 @@ def generate_launch_description():
     default_value="/aligned_silo",
   )
 
+  pose_topic = LaunchConfiguration("pose_topic")
+  pose_topic_cmd = DeclareLaunchArgument(
+    "pose_topic",
+    default_value="/odometry/filtered",
+    description="Name of the pose topic of map2base transform",
+  )
+
   state_estimation_node_cmd = Node(
     package="silo",
     namespace=namespace,
@@ -66,8 +76,9 @@ def generate_launch_description():
     name="absolute_silo_state_node",
     remappings=[
       ("/aligned_silo", aligned_silo_topic),
+      ("/odometry/filtered", pose_topic),
     ],
-    parameters=[camera_info_config, common_config],
+    parameters=[camera_info_config, common_config, silo_config, base2cam_config],
   )
 
   silos_marker_node_cmd = Node(
@@ -83,6 +94,7 @@ def generate_launch_description():
   ld.add_action(namespace_cmd)
   ld.add_action(tracking_topic_cmd)
   ld.add_action(aligned_silo_topic_cmd)
+  ld.add_action(pose_topic_cmd)
 
   # ld.add_action(state_estimationHSV_node_cmd)
   ld.add_action(state_estimation_node_cmd)
@@ -19,25 +19,17 @@ def generate_launch_description():
     "namespace", default_value="", description="Name of the namespace"
   )
 
-  base2cam_optical_tf_node_cmd = Node(
+  static_tf_node_cmd = Node(
     package="silo",
     namespace=namespace,
-    executable="base2cam_optical_tf",
-    name="base2cam_optical_tf",
+    executable="static_tf_node",
+    name="static_tf_node",
     parameters=[base2cam_config],
   )
 
-  cam_optical2cam_ros_tf_node_cmd = Node(
-    package="silo",
-    namespace=namespace,
-    executable="cam_optical2cam_ros_tf",
-    name="cam_optical2cam_ros_tf",
-  )
-
   ld = LaunchDescription()
 
   ld.add_action(namespace_cmd)
-  ld.add_action(base2cam_optical_tf_node_cmd)
-  ld.add_action(cam_optical2cam_ros_tf_node_cmd)
+  ld.add_action(static_tf_node_cmd)
 
   return ld
@@ -4,10 +4,12 @@ from rclpy.node import Node
 from silo_msgs.msg import SiloArray
 from visualization_msgs.msg import Marker, MarkerArray
 
+from silo.profiling import attach_profiler
+
 
 class MarkerBroadcaster(Node):
   def __init__(self):
-    super().__init__("marker_node")
+    super().__init__("silos_marker_node")
 
     self.declare_parameter("team_color", "blue")
     self.declare_parameter("ball_diameter", 0.190)
@@ -16,6 +18,8 @@ class MarkerBroadcaster(Node):
     self.declare_parameter("silo_z_max", 0.0)
     self.declare_parameter("silo_y", 0.0)
     self.declare_parameter("silo_radius", 0.0)
+    # Period in seconds of republishing all markers, e.g. for late joining RViz
+    self.declare_parameter("full_refresh_period", 2.0)
 
     self.__height_offset = 0.2
 
@@ -38,6 +42,9 @@ class MarkerBroadcaster(Node):
     self.silo_radius = (
       self.get_parameter("silo_radius").get_parameter_value().double_value
     )
+    self.full_refresh_period = (
+      self.get_parameter("full_refresh_period").get_parameter_value().double_value
+    )
 
     self.silos_state_subscriber = self.create_subscription(
       SiloArray, "state_map", self.silos_state_callback, 10
@@ -50,34 +57,80 @@ class MarkerBroadcaster(Node):
     if self.team_color == "red":
       self.silos_xy = [(x, -self.silo_y) for x in self.silos_x]
 
+    ## Markers of every ball slot built once, id is silo_number * 10 + position
+    self.ball_markers = [
+      [
+        {color: self.create_ball_marker(position, color, silo_number) for color in "RB"}
+        for position in range(1, 4)
+      ]
+      for silo_number in range(1, 6)
+    ]
+    self.delete_markers = [
+      [
+        self.create_delete_marker(markers["R"].id)
+        for markers in self.ball_markers[silo_number - 1]
+      ]
+      for silo_number in range(1, 6)
+    ]
+    self.delete_all_marker = Marker()
+    self.delete_all_marker.ns = "silo"
+    self.delete_all_marker.action = Marker.DELETEALL
+
+    # Color of ball shown in each slot, "" if no ball
+    self.shown_balls = [[""] * 3 for _ in range(5)]
+
+    if self.full_refresh_period > 0:
+      self.create_timer(self.full_refresh_period, self.full_refresh_callback)
+
     self.get_logger().info("Silo balls marker node started")
 
   def silos_state_callback(self, silo_state_msg: SiloArray):
+    ## Publish only balls which changed since last message
     marker_array = MarkerArray()
 
     for silo in silo_state_msg.silos:
-      silos_marker_array = self.create_silo_markers(silo)
+      marker_array.markers.extend(self.create_changed_markers(silo))
+
+    if marker_array.markers:
+      self.publish_markers(marker_array)
+    return
+
+  def full_refresh_callback(self):
+    marker_array = MarkerArray()
+    marker_array.markers.append(self.delete_all_marker)
 
-      marker_array.markers.extend(silos_marker_array.markers)
+    for silo_number, shown in enumerate(self.shown_balls, start=1):
+      for position, color in enumerate(shown, start=1):
+        if color:
+          marker_array.markers.append(
+            self.ball_markers[silo_number - 1][position - 1][color]
+          )
 
     self.publish_markers(marker_array)
     return
 
-  def create_silo_markers(self, silo):
-    silos_marker_array = MarkerArray()
+  def create_changed_markers(self, silo):
+    markers = []
+    shown = self.shown_balls[silo.index - 1]
 
-    for i, color in enumerate(silo.state):
-      marker = self.create_ball_marker(i + 1, color, silo.index)
-      silos_marker_array.markers.append(marker)
+    for i in range(3):
+      color = silo.state[i] if i < len(silo.state) else ""
+      if color == shown[i]:
+        continue
+      shown[i] = color
+      if color in ("R", "B"):
+        markers.append(self.ball_markers[silo.index - 1][i][color])
+      else:
+        markers.append(self.delete_markers[silo.index - 1][i])
 
-    return silos_marker_array
+    return markers
 
   def create_ball_marker(self, position, color, silo_number):
     marker = Marker()
     marker.header.frame_id = "map"
 
     marker.ns = "silo"
-    marker.id = int(f"{silo_number}{position}")
+    marker.id = silo_number * 10 + position
     marker.type = Marker.SPHERE
     marker.action = Marker.ADD
 
@@ -132,7 +185,16 @@ class MarkerBroadcaster(Node):
     marker.color.b = marker_rgb["b"]
     marker.color.a = marker_rgb["a"]
 
-    marker.lifetime = Duration(seconds=0.50).to_msg()
+    # Persistent until deleted
+    marker.lifetime = Duration(seconds=0).to_msg()
+    return marker
+
+  def create_delete_marker(self, marker_id):
+    marker = Marker()
+    marker.header.frame_id = "map"
+    marker.ns = "silo"
+    marker.id = marker_id
+    marker.action = Marker.DELETE
     return marker
 
   def create_silo_text_marker(self, silo_number):
@@ -174,6 +236,7 @@ def main(args=None):
   rclpy.init(args=args)
 
   marker_node = MarkerBroadcaster()
+  attach_profiler(marker_node)
 
   rclpy.spin(marker_node)
 
@@ -1,14 +1,16 @@
 import rclpy
 from rclpy.duration import Duration
 from rclpy.node import Node
-from scipy.spatial.transform import Rotation as R
 from std_msgs.msg import UInt8MultiArray
 from visualization_msgs.msg import Marker, MarkerArray
 
+from silo.geometry import quaternion_from_ypr
+from silo.profiling import attach_profiler
+
 
 class MarkerBroadcaster(Node):
   def __init__(self):
-    super().__init__("marker_node")
+    super().__init__("target_node")
 
     self.declare_parameter("team_color", "blue")
     self.declare_parameter("ball_diameter", 0.190)
@@ -17,6 +19,10 @@ class MarkerBroadcaster(Node):
     self.declare_parameter("silo_z_max", 0.0)
     self.declare_parameter("silo_y", 0.0)
     self.declare_parameter("silo_radius", 0.0)
+    # Number of optimal silos published by silo_selection_node
+    self.declare_parameter("targets_num", 2)
+    # Period in seconds of republishing all markers, e.g. for late joining RViz
+    self.declare_parameter("full_refresh_period", 2.0)
 
     self.team_color = (
       self.get_parameter("team_color").get_parameter_value().string_value
@@ -37,6 +43,12 @@ class MarkerBroadcaster(Node):
     self.silo_radius = (
       self.get_parameter("silo_radius").get_parameter_value().double_value
     )
+    self.targets_num = (
+      self.get_parameter("targets_num").get_parameter_value().integer_value
+    )
+    self.full_refresh_period = (
+      self.get_parameter("full_refresh_period").get_parameter_value().double_value
+    )
 
     self.target_silo_subscriber = self.create_subscription(
       UInt8MultiArray, "/silo_number", self.target_received_callback, 10
@@ -50,39 +62,71 @@ class MarkerBroadcaster(Node):
     else:
       self.silos_xy = [(x, -self.silo_y) for x in self.silos_x]
 
+    ## Arrow markers built once, only x is patched when target changes
+    self.arrows = [
+      self.create_arrow_marker(priority) for priority in range(self.targets_num)
+    ]
+    self.delete_arrows = [
+      self.create_delete_marker(priority) for priority in range(self.targets_num)
+    ]
+    self.delete_all_marker = Marker()
+    self.delete_all_marker.ns = "silo"
+    self.delete_all_marker.action = Marker.DELETEALL
+    # Silo number shown by each arrow, 0 if none
+    self.targets = [0] * self.targets_num
+
+    if self.full_refresh_period > 0:
+      self.create_timer(self.full_refresh_period, self.full_refresh_callback)
+
     self.get_logger().info("Target silo marker node started")
 
   def target_received_callback(self, optimal_silos_msg: UInt8MultiArray):
+    ## Publish only arrows whose target changed
     arrow_markers = MarkerArray()
 
-    for i, silo_number in enumerate(optimal_silos_msg.data):
-      arrow = self.create_arrow_marker(priority=i, silo_number=silo_number)
+    for i, silo_number in enumerate(optimal_silos_msg.data[: self.targets_num]):
+      if silo_number == self.targets[i]:
+        continue
+      self.targets[i] = silo_number
+      if 1 <= silo_number <= len(self.silos_xy):
+        self.arrows[i].pose.position.x = self.silos_xy[silo_number - 1][0]
+        arrow_markers.markers.append(self.arrows[i])
+      else:
+        arrow_markers.markers.append(self.delete_arrows[i])
+
+    if arrow_markers.markers:
+      self.publish_markers(arrow_markers)
+    return
+
+  def full_refresh_callback(self):
+    arrow_markers = MarkerArray()
+    arrow_markers.markers.append(self.delete_all_marker)
 
-      arrow_markers.markers.append(arrow)
+    for i, silo_number in enumerate(self.targets):
+      if 1 <= silo_number <= len(self.silos_xy):
+        arrow_markers.markers.append(self.arrows[i])
 
     self.publish_markers(arrow_markers)
     return
 
-  def create_arrow_marker(self, priority, silo_number):
+  def create_arrow_marker(self, priority):
     arrow = Marker()
     arrow.header.frame_id = "map"
 
     arrow.ns = "silo"
-    arrow.id = int(f"{priority}")
+    arrow.id = priority
     arrow.type = Marker.ARROW
     arrow.action = Marker.ADD
 
-    arrow.pose.position.x = self.silos_xy[silo_number - 1][0]
+    # Arrow points to silo from field side
     if self.team_color == "blue":
-      arrow.pose.position.y = self.silos_xy[silo_number - 1][1] + 0.75
-      orientation = R.from_euler("ZYX", [-90.0, 0, 0], degrees=True)
+      arrow.pose.position.y = self.silos_xy[0][1] + 0.75
+      q_arrow = quaternion_from_ypr([-90.0, 0.0, 0.0])
     else:
-      arrow.pose.position.y = self.silos_xy[silo_number - 1][1] - 0.75
-      orientation = R.from_euler("ZYX", [90.0, 0, 0], degrees=True)
+      arrow.pose.position.y = self.silos_xy[0][1] - 0.75
+      q_arrow = quaternion_from_ypr([90.0, 0.0, 0.0])
     arrow.pose.position.z = self.silo_z_max / 2
 
-    q_arrow = orientation.as_quat()
-
     arrow.pose.orientation.x = q_arrow[0]
     arrow.pose.orientation.y = q_arrow[1]
     arrow.pose.orientation.z = q_arrow[2]
@@ -98,7 +142,7 @@ class MarkerBroadcaster(Node):
         arrow.scale.y = 0.1
         arrow.scale.z = 0.1
 
-      case 1:
+      case _:
         arrow.color.r = 0.988
         arrow.color.g = 0.988
         arrow.color.b = 0.0
@@ -109,7 +153,16 @@ class MarkerBroadcaster(Node):
 
     arrow.color.a = 1.0
 
-    arrow.lifetime = Duration(seconds=2.0).to_msg()
+    # Persistent until target changes or next full refresh
+    arrow.lifetime = Duration(seconds=0).to_msg()
+    return arrow
+
+  def create_delete_marker(self, priority):
+    arrow = Marker()
+    arrow.header.frame_id = "map"
+    arrow.ns = "silo"
+    arrow.id = priority
+    arrow.action = Marker.DELETE
     return arrow
 
   def publish_markers(self, marker_array):
@@ -121,6 +174,7 @@ def main(args=None):
   rclpy.init(args=args)
 
   marker_node = MarkerBroadcaster()
+  attach_profiler(marker_node)
 
   rclpy.spin(marker_node)
 
@@ -32,13 +32,13 @@ setup(
   tests_require=["pytest"],
   entry_points={
     "console_scripts": [
-      "cam_optical2cam_ros_tf = silo.cam_optical2cam_ros_tf:main",
-      "base2cam_optical_tf = silo.base2cam_optical_tf:main",
+      "static_tf_node = silo.static_tf:main",
       "state_estimation_node = silo.estimate_state:main",
-      "state_estimation_node_HSV = silo.estimate_state_HSV:main",
+      "state_estimation_node_HSV = silo.raw_estimate_hsv:main",
       "silo_selection_node = silo.select_silo:main",
       "absolute_silo_state_node = silo.absolute_silo_state:main",
       "image_receiver_node = silo.image_receiver:main",
+      "silo_composed_node = silo.composed:main",
       # Rviz visualizations
       "silos_marker_node = rviz.balls_silo:main",
       "target_node = rviz.target_silo:main",
@@ -48,6 +48,7 @@ setup(
       # Debug nodes
       "capture_node = silo.capture_dbg:main",
       "broadcast_node = silo.broadcast_img:main",
+      "trace_collector_node = silo.trace_collector:main",
     ],
   },
 )
@@ -1,14 +1,25 @@
-import copy
 from enum import Enum
 from typing import List
 
 import rclpy
+from nav_msgs.msg import Odometry
 from rcl_interfaces.msg import SetParametersResult
 from rclpy.node import Node
 from rclpy.parameter import Parameter
+from rclpy.qos import QoSProfile, QoSReliabilityPolicy
 from silo_msgs.msg import Silo, SiloArray
 from std_msgs.msg import UInt8
 
+from silo.absolute_state import AbsoluteStateTracker
+from silo.consistency import StateConsistency, max_new_balls
+from silo.estimation import SiloObservation
+from silo.geometry import yaw_from_quaternion
+from silo.profiling import attach_profiler
+from silo.projection import SiloProjector
+from silo.stacks import STACK_ID
+from silo.state_journal import StateJournal
+from silo.trace_collector import create_tracer
+
 
 class RobotState(Enum):
   SEARCHING_BALL = 0
@@ -18,13 +29,38 @@ class RobotState(Enum):
 
 class AbsoluteStateEstimation(Node):
   def __init__(self):
-    super().__init__("absolute_state_estimation")
+    super().__init__("absolute_silo_state_node")
 
     self.declare_parameter("width", 921)
+    self.declare_parameter("height", 518)
     self.declare_parameter("consistency_threshold", 5)
     self.declare_parameter("silos_state", [""] * 5)
     self.declare_parameter("team_color", "blue")
 
+    ## Parameters for projection of silos into image
+    self.declare_parameter("silos_x", [0.0] * 5)
+    self.declare_parameter("silo_z_min", 0.0)
+    self.declare_parameter("silo_z_max", 0.0)
+    self.declare_parameter("silo_y", 0.0)
+    self.declare_parameter("silo_radius", 0.0)
+    # Camera optical frame w.r.t. base_link, shared with static_tf_node
+    self.declare_parameter("base2cam_optical.translation", [0.0, 0.0, 0.0])
+    self.declare_parameter("base2cam_optical.ypr", [0.0, 0.0, 0.0])
+    self.declare_parameter("k", [0.0] * 9)
+    self.declare_parameter("min_projection_iou", 0.3)
+
+    # Maximum balls added across all silos in a single update, 0 for no limit
+    self.declare_parameter("max_new_balls", 0)
+
+    ## Journal of confirmed states to recover after a crash during a match, disabled by
+    ## default as a restart between matches would restore the previous match
+    self.declare_parameter("journal_path", "")
+    self.declare_parameter("journal_sync", False)
+    # Journaled state older than this (seconds) is from another match
+    self.declare_parameter("journal_max_age", 180.0)
+    # Publish spans of callbacks for trace_collector_node
+    self.declare_parameter("trace", False)
+
     self.team_color = (
       self.get_parameter("team_color").get_parameter_value().string_value
     )
@@ -49,6 +85,15 @@ class AbsoluteStateEstimation(Node):
       UInt8, "/robot_state", self.robot_state_callback, 10
     )
     self.robot_state_subscriber
+
+    qos_profile = QoSProfile(depth=10)
+    qos_profile.reliability = QoSReliabilityPolicy.BEST_EFFORT
+    self.baselink_pose_subscriber = self.create_subscription(
+      Odometry,
+      "/odometry/filtered",
+      self.baselink_pose_callback,
+      qos_profile=qos_profile,
+    )
     self.received_state = 0
 
     ## Mapping of robot state to enum
@@ -60,11 +105,6 @@ class AbsoluteStateEstimation(Node):
 
     self.robot_state = self.robot_state_mapping[0]
     self.silos_absolute_state_msg = SiloArray()
-    self.silos_absolute_state = [
-      {"index": i + 1, "state": "", "bbox": [None] * 4} for i in range(5)
-    ]
-    self.update_silos_absolute_state_msg()
-    self.silos_relative_state_received = None
     self.__aligned_silo = 0
 
     self.__image_width = self.get_parameter("width").get_parameter_value().integer_value
@@ -72,11 +112,38 @@ class AbsoluteStateEstimation(Node):
       self.get_parameter("consistency_threshold").get_parameter_value().integer_value
     )
 
-    self.x_center_image = self.__image_width / 2
-    self.received_msg_consistency_counter = 0
+    self.__image_height = (
+      self.get_parameter("height").get_parameter_value().integer_value
+    )
+
+    # x, y, yaw of base_link w.r.t. map
+    self.map2base_pose = None
+
+    # Per silo repair never removes balls, only new balls are checked jointly
+    joint_constraints = []
+    max_balls = self.get_parameter("max_new_balls").get_parameter_value().integer_value
+    if max_balls > 0:
+      joint_constraints.append(max_new_balls(max_balls))
+    self.state_consistency = StateConsistency(joint_constraints)
+
+    self.tracker = AbsoluteStateTracker(
+      self.TEAM_REPR,
+      self.__image_width,
+      consistency_threshold=self.__consistency_threshold,
+      projector=self.create_silo_projector(),
+      min_projection_iou=self.get_parameter("min_projection_iou")
+      .get_parameter_value()
+      .double_value,
+      consistency=self.state_consistency,
+    )
+    self.update_silos_absolute_state_msg()
+
+    self.tracer = create_tracer(
+      self, self.get_parameter("trace").get_parameter_value().bool_value
+    )
 
-    self.known_state = None
-    self.__is_known_state_set = False
+    self.journal = self.open_journal()
+    self.restore_from_journal()
 
     self.get_logger().info("Absolute silo state estimation node started.")
 
@@ -86,28 +153,95 @@ class AbsoluteStateEstimation(Node):
         parameter.name == "silos_state"
         and parameter.type_ == Parameter.Type.STRING_ARRAY
       ):
-        self.silos_absolute_state = [
-          {"index": i + 1, "state": state, "bbox": [None] * 4}
-          for i, state in enumerate(parameter.get_parameter_value().string_array_value)
-        ]
-        self.known_state = copy.deepcopy(self.silos_absolute_state)
-        self.__is_known_state_set = True
+        silos_state = parameter.get_parameter_value().string_array_value
+        if len(silos_state) != 5 or any(state not in STACK_ID for state in silos_state):
+          return SetParametersResult(
+            successful=False, reason=f"Invalid silos state: {list(silos_state)}"
+          )
+        self.tracker.set_known_state(silos_state)
         self.update_silos_absolute_state_msg()
-        return SetParametersResult(successful=True)
-    return SetParametersResult(successful=False)
+        self.record_state()
+    # Other parameters, e.g. profile_* declared by attach_profiler, are accepted as is
+    return SetParametersResult(successful=True)
+
+  def open_journal(self):
+    journal_path = self.get_parameter("journal_path").get_parameter_value().string_value
+    if not journal_path:
+      return None
+    try:
+      return StateJournal(
+        journal_path,
+        sync=self.get_parameter("journal_sync").get_parameter_value().bool_value,
+      )
+    except (OSError, ValueError) as e:
+      self.get_logger().error(f"Silo state journal disabled: {e}")
+      return None
+
+  def restore_from_journal(self):
+    if self.journal is None:
+      return
+    last_record = self.journal.last()
+    if last_record is None:
+      return
+
+    max_age = self.get_parameter("journal_max_age").get_parameter_value().double_value
+    age = (self.get_clock().now().nanoseconds - last_record.stamp) / 1e9
+    if age > max_age:
+      self.get_logger().info(f"Journaled silos state is {age:.1f}s old, ignoring")
+      return
+
+    self.tracker.set_known_state(last_record.states)
+    self.update_silos_absolute_state_msg()
+    self.get_logger().info(f"Restored silos state from journal: {last_record.states}")
+
+  def record_state(self):
+    if self.journal is None:
+      return
+    self.journal.append(self.get_clock().now().nanoseconds, self.tracker.states)
+
+  def create_silo_projector(self) -> SiloProjector:
+    silos_x = self.get_parameter("silos_x").get_parameter_value().double_array_value
+    silo_y = self.get_parameter("silo_y").get_parameter_value().double_value
+    if self.team_color == "red":
+      silo_y = -silo_y
+    silos_xy = [(x, silo_y) for x in silos_x]
+
+    return SiloProjector(
+      silos_xy=silos_xy,
+      silo_z_min=self.get_parameter("silo_z_min").get_parameter_value().double_value,
+      silo_z_max=self.get_parameter("silo_z_max").get_parameter_value().double_value,
+      silo_radius=self.get_parameter("silo_radius").get_parameter_value().double_value,
+      translation_base2cam=self.get_parameter("base2cam_optical.translation")
+      .get_parameter_value()
+      .double_array_value,
+      ypr_base2cam=self.get_parameter("base2cam_optical.ypr")
+      .get_parameter_value()
+      .double_array_value,
+      camera_matrix=self.get_parameter("k").get_parameter_value().double_array_value,
+      image_size=(self.__image_width, self.__image_height),
+    )
+
+  def baselink_pose_callback(self, pose_msg: Odometry):
+    orientation = pose_msg.pose.pose.orientation
+    self.map2base_pose = (
+      pose_msg.pose.pose.position.x,
+      pose_msg.pose.pose.position.y,
+      yaw_from_quaternion(orientation.x, orientation.y, orientation.z, orientation.w),
+    )
 
   def robot_state_callback(self, robot_state_msg: UInt8):
     self.received_state = robot_state_msg.data
     self.robot_state = self.robot_state_mapping[self.received_state]
 
-    if self.robot_state == RobotState.BALL_STORED and self.__aligned_silo != 0:
-      if len(self.silos_absolute_state[self.__aligned_silo - 1]["state"] < 2):
-        self.silos_absolute_state[self.__aligned_silo - 1]["state"] += self.TEAM_REPR
+    if self.robot_state == RobotState.BALL_STORED:
+      if self.tracker.ball_stored(self.__aligned_silo):
+        self.update_silos_absolute_state_msg()
+        self.record_state()
     return
 
   def timer_callback(self):
     self.silos_absolute_state_publisher.publish(self.silos_absolute_state_msg)
-    # self.display_state(self.silos_absolute_state)
+    # self.display_state(self.tracker.states)
     return
 
   def aligned_info_callback(self, aligned_silo_msg: UInt8):
@@ -115,146 +249,43 @@ class AbsoluteStateEstimation(Node):
     return
 
   def silo_state_image_callback(self, silos_detected_state_msg: SiloArray):
-    ## parse state from message
-    # List of dictionaries
-    silos_received_state = self.parse_state(silos_detected_state_msg.silos)
-
-    if self.silos_relative_state_received is None:
-      self.silos_relative_state_received = silos_received_state
-      return
-
-    ## check for consistency in 5 frames
-    if not self.is_state_consistent_across_frames(silos_received_state):
-      # self.get_logger().warn("Messages across frames are inconsistent")
-      return
-
-    ## check if all 5 states are visible
-    # if YES, proceed
-    # if NO, yet to implement...
-    if len(silos_received_state) > 5 or len(silos_received_state) == 0:
-      # self.get_logger().warn(f"{len(silos_received_state)} silos are visible.....")
-      return
+    with self.tracer.span("absolute_state"):
+      ## parse state from message
+      observations = self.parse_state(silos_detected_state_msg.silos)
 
-    if len(silos_received_state) < 5:
-      silos_received_state = self.predict_full_state(partial_state=silos_received_state)
-      if silos_received_state is None:
+      previous_state = list(self.tracker.states)
+      if not self.tracker.update(observations, self.map2base_pose, self.__aligned_silo):
         return
 
-    if self.__is_known_state_set or len(silos_received_state) != 5:
-      ## Get consistent state from received state
-      silos_received_state = self.compute_consistent_state(silos_received_state)
-
-    # ## check consistency for state of each silo state
-    # # if additive, update state
-    # # if conflicts with previous state, warn and pass
-    # if not self.is_consistent_with_previous_state(silos_received_state):
-    #   self.get_logger().warn("Received state is inconsistent with previous state")
-    #   self.get_logger().warn(f"Received state: {silos_received_state}")
-    #   self.get_logger().warn(f"Previous state: {self.silos_absolute_state}")
-    #   return
-
-    self.set_silos_absolute_state(silos_received_state)
-    self.update_silos_absolute_state_msg()
-    return
-
-  def parse_state(self, silos):
-    silos_state = []
-
-    for silo in silos:
-      silo_state = {}
-      silo_state["index"] = silo.index
-      silo_state["state"] = silo.state
-      silo_state["bbox"] = silo.xyxy
-      silos_state.append(silo_state)
-
-    return silos_state
-
-  def is_state_consistent_across_frames(self, silos_received_state):
-    previous_received_state = copy.deepcopy(self.silos_relative_state_received)
-    self.silos_relative_state_received = silos_received_state
-    if len(silos_received_state) != len(previous_received_state):
-      self.received_msg_consistency_counter = 0
-      return False
-    for received, previous in zip(silos_received_state, previous_received_state):
-      if received["state"] != previous["state"]:
-        self.received_msg_consistency_counter = 0
-        return False
-
-    self.received_msg_consistency_counter += 1
-    if self.received_msg_consistency_counter == self.__consistency_threshold:
-      self.received_msg_consistency_counter = 0
-      return True
-    return False
-
-  def is_consistent_with_previous_state(self, silos_received_state):
-    for silo_received, silo_previous in zip(
-      silos_received_state, self.silos_absolute_state
-    ):
-      if len(silo_received["state"]) < len(silo_previous["state"]):
-        return False
-      prev_len = len(silo_previous["state"])
-      if silo_received["state"][:prev_len] != silo_previous["state"]:
-        return False
-    return True
-
-  def compute_consistent_state(self, silos_received_state):
-    consistent_state = copy.deepcopy(self.silos_absolute_state)
-    for silo_received, silo_previous in zip(
-      silos_received_state, self.silos_absolute_state
-    ):
-      # breakpoint()
-      if len(silo_received["state"]) < len(silo_previous["state"]):
+      if self.tracker.last_repair is not None:
+        previous, received = self.tracker.last_repair
         self.get_logger().warn(
-          f"Silo-{silo_received['index']} -> Previous: {silo_previous['state']} balls | Received: {silo_received['state']}"
+          f"Repaired silos state: {dict(self.state_consistency.repairs)} | "
+          f"Previous: {previous} | Received: {received}",
+          throttle_duration_sec=2.0,
         )
-        continue
-      prev_state_len = len(silo_previous["state"])
-      if not silo_received["state"][:prev_state_len] == silo_previous["state"]:
-        continue
-      consistent_state[silo_received["index"] - 1]["state"] = silo_received["state"]
-    return consistent_state
-
-  def predict_full_state(self, partial_state):
-    if self.__aligned_silo == 0:
-      return None
-    aligned_index_relative = self.get_relative_index_aligned_silo(partial_state)
-    predicted_state = copy.deepcopy(self.silos_absolute_state)
-    for silo in partial_state:
-      offset = aligned_index_relative - silo["index"]
-      predicted_state[self.__aligned_silo - offset - 1]["state"] = silo["state"]
-    # self.display_state(predicted_state)
-    return predicted_state
-
-  def get_relative_index_aligned_silo(self, partial_state):
-    closest_center_x = 1000
-    closest_index = 0
-    for silo in partial_state:
-      bbox = silo["bbox"]
-      center_x = (bbox[0] + bbox[2]) / 2
-      if abs(center_x - self.x_center_image) < abs(
-        self.x_center_image - closest_center_x
-      ):
-        closest_center_x = center_x
-        closest_index = silo["index"]
-    return closest_index
 
-  def set_silos_absolute_state(self, silos_received_state):
-    self.silos_absolute_state = copy.deepcopy(silos_received_state)
-    return
+      if self.tracker.states != previous_state:
+        self.record_state()
+      self.update_silos_absolute_state_msg()
+      return
+
+  def parse_state(self, silos) -> List[SiloObservation]:
+    return [SiloObservation(silo.index, silo.state, tuple(silo.xyxy)) for silo in silos]
 
   def update_silos_absolute_state_msg(self):
     self.silos_absolute_state_msg = SiloArray()
-    for silo in self.silos_absolute_state:
+    for i, state in enumerate(self.tracker.states):
       silo_msg = Silo()
-      silo_msg.index = silo["index"]
-      silo_msg.state = silo["state"]
+      silo_msg.index = i + 1
+      silo_msg.state = state
       self.silos_absolute_state_msg.silos.append(silo_msg)
     return
 
-  def display_state(self, silos_state):
+  def display_state(self, silos_state: List[str]):
     log = ""
-    for silo in silos_state:
-      log += f"Silo{silo['index']}: {silo['state']} | "
+    for i, state in enumerate(silos_state):
+      log += f"Silo{i + 1}: {state} | "
     self.get_logger().info(log)
 
 
@@ -262,6 +293,7 @@ def main(args=None):
   rclpy.init(args=args)
 
   absolute_state_node = AbsoluteStateEstimation()
+  attach_profiler(absolute_state_node)
 
   rclpy.spin(absolute_state_node)
 
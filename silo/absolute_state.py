@@ -0,0 +1,164 @@
+"""
+Absolute state of the 5 silos from states observed in images.
+
+An observation is only trusted once the same states are observed in
+consistency_threshold consecutive frames. A partial view (less than 5 silos) is
+associated to absolute silo indexes by projecting the silos with the robot pose, or
+else relative to the silo the robot is aligned with. Once the state has been known,
+every update is repaired by the consistency rules so that balls are never removed.
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from silo.consistency import StateConsistency
+from silo.estimation import SILOS_NUM, SiloObservation
+from silo.projection import SiloProjector
+
+# x, y, yaw of base_link w.r.t. map
+Pose = Tuple[float, float, float]
+
+
+class AbsoluteStateTracker:
+  def __init__(
+    self,
+    team_repr: str,
+    image_width: int,
+    consistency_threshold: int = 5,
+    projector: Optional[SiloProjector] = None,
+    min_projection_iou: float = 0.3,
+    consistency: Optional[StateConsistency] = None,
+  ):
+    self.team_repr = team_repr
+    self.x_center_image = image_width / 2
+    self.consistency_threshold = consistency_threshold
+    self.projector = projector
+    self.min_projection_iou = min_projection_iou
+    self.consistency = consistency or StateConsistency()
+
+    self.states: List[str] = [""] * SILOS_NUM
+    self.is_known_state_set = False
+    self.previous_observations: Optional[List[SiloObservation]] = None
+    self.consistency_counter = 0
+    # (previous, received) states of last update which needed repair, else None
+    self.last_repair: Optional[Tuple[List[str], List[Optional[str]]]] = None
+
+  def set_known_state(self, states: Sequence[str]):
+    """! Known state of silos, e.g. set by an operator or restored after restart"""
+    self.states = list(states)
+    self.is_known_state_set = True
+
+  def ball_stored(self, aligned_silo: int) -> bool:
+    """! Add ball of team on top of silo robot is aligned with
+    @return True if state changed
+    """
+    if aligned_silo == 0 or len(self.states[aligned_silo - 1]) >= 2:
+      return False
+    self.states[aligned_silo - 1] += self.team_repr
+    return True
+
+  def update(
+    self,
+    observations: Sequence[SiloObservation],
+    pose: Optional[Pose] = None,
+    aligned_silo: int = 0,
+  ) -> bool:
+    """! Update with silos observed in a frame
+    @param observations silos in order of image
+    @param pose x, y, yaw of base_link w.r.t. map, None if unknown
+    @param aligned_silo absolute index of silo robot is aligned with, 0 if none
+    @return True if state was confirmed in this frame (it may be unchanged)
+    """
+    self.last_repair = None
+    observations = list(observations)
+    if self.previous_observations is None:
+      self.previous_observations = observations
+      return False
+
+    if not self.is_consistent_across_frames(observations):
+      return False
+    if len(observations) > SILOS_NUM or len(observations) == 0:
+      return False
+
+    if len(observations) < SILOS_NUM:
+      received = self.predict_full_state(observations, pose, aligned_silo)
+      if received is None:
+        return False
+    else:
+      received = [silo.state for silo in observations]
+
+    if self.is_known_state_set or len(observations) != SILOS_NUM:
+      received = self.compute_consistent_state(received)
+
+    self.states = received
+    return True
+
+  def is_consistent_across_frames(self, observations: List[SiloObservation]) -> bool:
+    previous = self.previous_observations
+    self.previous_observations = observations
+    if len(observations) != len(previous) or any(
+      received.state != silo.state for received, silo in zip(observations, previous)
+    ):
+      self.consistency_counter = 0
+      return False
+
+    self.consistency_counter += 1
+    if self.consistency_counter == self.consistency_threshold:
+      self.consistency_counter = 0
+      return True
+    return False
+
+  def compute_consistent_state(self, received: List[Optional[str]]) -> List[str]:
+    state = self.consistency.repair(self.states, received)
+    if self.consistency.last_repairs:
+      self.last_repair = (list(self.states), list(received))
+    return state
+
+  def predict_full_state(
+    self, observations: List[SiloObservation], pose: Optional[Pose], aligned_silo: int
+  ) -> Optional[List[Optional[str]]]:
+    ## Prefer projection of known silos using current pose
+    predicted = self.predict_state_from_projection(observations, pose)
+    if predicted is not None:
+      return predicted
+
+    ## Fallback to silo aligned with robot
+    if aligned_silo == 0:
+      return None
+    aligned_index_relative = self.get_relative_index_aligned_silo(observations)
+    predicted = list(self.states)
+    for silo in observations:
+      offset = aligned_index_relative - silo.index
+      predicted[aligned_silo - offset - 1] = silo.state
+    return predicted
+
+  def predict_state_from_projection(
+    self, observations: List[SiloObservation], pose: Optional[Pose]
+  ) -> Optional[List[Optional[str]]]:
+    if self.projector is None or pose is None:
+      return None
+    bboxes_xyxy = np.array([silo.xyxy for silo in observations], dtype=float)
+    absolute_indexes = self.projector.assign(
+      bboxes_xyxy, *pose, min_iou=self.min_projection_iou
+    )
+    # Every visible silo must be associated for the prediction to be trusted
+    if np.any(absolute_indexes == 0):
+      return None
+
+    predicted = list(self.states)
+    for silo, absolute_index in zip(observations, absolute_indexes):
+      predicted[absolute_index - 1] = silo.state
+    return predicted
+
+  def get_relative_index_aligned_silo(self, observations: List[SiloObservation]) -> int:
+    closest_center_x = 1000
+    closest_index = 0
+    for silo in observations:
+      center_x = (silo.xyxy[0] + silo.xyxy[2]) / 2
+      if abs(center_x - self.x_center_image) < abs(
+        self.x_center_image - closest_center_x
+      ):
+        closest_center_x = center_x
+        closest_index = silo.index
+    return closest_index
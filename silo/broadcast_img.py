@@ -15,6 +15,8 @@ from rclpy.qos import (
 )
 from sensor_msgs.msg import Image
 
+from silo.profiling import attach_profiler
+
 
 class ImagePublisher(Node):
   def __init__(self):
@@ -76,6 +78,7 @@ class ImagePublisher(Node):
 def main(args=None):
   rclpy.init(args=args)
   image_publisher = ImagePublisher()
+  attach_profiler(image_publisher)
   rclpy.spin(image_publisher)
   for client in image_publisher.clients:
     client.close()
@@ -1,11 +1,12 @@
 import os
 import random
 import time
+from datetime import datetime
 
-import cv2
 import message_filters
 import rclpy
 from cv_bridge import CvBridge
+from nav_msgs.msg import Odometry
 from rcl_interfaces.msg import SetParametersResult
 from rclpy.node import Node
 from rclpy.parameter import Parameter
@@ -15,7 +16,14 @@ from rclpy.qos import (
   QoSProfile,
   QoSReliabilityPolicy,
 )
-from sensor_msgs.msg import Image
+from rclpy.serialization import serialize_message
+from sensor_msgs.msg import CompressedImage, Image
+from silo_msgs.msg import SiloArray
+from yolov8_msgs.msg import DetectionArray
+
+from silo.disk_writer import DiskWriter, ensure_directory, jpeg_encoder
+from silo.profiling import attach_profiler
+from silo.recording import RecordingWriter
 
 
 class CaptureNode(Node):
@@ -25,9 +33,27 @@ class CaptureNode(Node):
     self.declare_parameter("enable_capture", True)
     self.declare_parameter("capture_interval", 1.0)
     self.declare_parameter("sync", True)
+    self.declare_parameter("raw_images_path", "~/.ros/capture/silo/raw")
+    self.declare_parameter("debug_images_path", "~/.ros/capture/silo/debug")
+    # Images are encoded & written by background threads through a bounded queue
+    self.declare_parameter("writer_threads", 2)
+    self.declare_parameter("writer_queue_size", 16)
+    self.declare_parameter("drop_policy", "drop_newest")
+    self.declare_parameter("jpeg_quality", 95)
+    # Period in seconds of logging writer metrics, 0 to disable
+    self.declare_parameter("metrics_period", 30.0)
+    # Record frames, detections, silo states & odometry in a chunked recording
+    self.declare_parameter("record", False)
+    self.declare_parameter("recording_path", "~/.ros/recordings/silo")
+    self.declare_parameter("recording_chunk_mb", 256)
+    self.declare_parameter("recording_queue_size", 64)
 
-    self.raw_images_path = "/home/apil/work/robocon2024/cv/live_capture/silo/raw"
-    self.debug_images_path = "/home/apil/work/robocon2024/cv/live_capture/silo/debug"
+    self.raw_images_path = ensure_directory(
+      self.get_parameter("raw_images_path").get_parameter_value().string_value
+    )
+    self.debug_images_path = ensure_directory(
+      self.get_parameter("debug_images_path").get_parameter_value().string_value
+    )
 
     image_qos_profile = QoSProfile(
       reliability=QoSReliabilityPolicy.BEST_EFFORT,
@@ -64,6 +90,28 @@ class CaptureNode(Node):
     self.__sync = self.get_parameter("sync").get_parameter_value().bool_value
 
     self.bridge = CvBridge()
+    self.encode_jpeg = jpeg_encoder(
+      self.get_parameter("jpeg_quality").get_parameter_value().integer_value
+    )
+    self.writer = DiskWriter(
+      threads=self.get_parameter("writer_threads").get_parameter_value().integer_value,
+      queue_size=self.get_parameter("writer_queue_size")
+      .get_parameter_value()
+      .integer_value,
+      drop_policy=self.get_parameter("drop_policy").get_parameter_value().string_value,
+      encode=self.encode_image,
+    )
+    metrics_period = (
+      self.get_parameter("metrics_period").get_parameter_value().double_value
+    )
+    if metrics_period > 0:
+      self.create_timer(metrics_period, self.log_writer_metrics)
+
+    self.recording = None
+    self.recorder = None
+    if self.get_parameter("record").get_parameter_value().bool_value:
+      self.start_recording()
+
     self.last_captured_time_raw = time.time()
     self.last_captured_time_dbg = time.time()
     self.last_captured_time = time.time()
@@ -75,14 +123,93 @@ class CaptureNode(Node):
   def on_set_parameters_callback(self, params):
     for param in params:
       if param.name == "enable_capture" and param.type_ == Parameter.Type.BOOL:
-        self.__enable_capture = param.value.bool_value
+        self.__enable_capture = param.value
         # self.get_logger().info(
         #   f"Capture is now {'enabled' if self.__enable_capture else 'disabled'}"
         # )
-        return SetParametersResult(successful=True)
-    return SetParametersResult(successful=False)
+    # Other parameters, e.g. profile_* declared by attach_profiler, are accepted as is
+    return SetParametersResult(successful=True)
+
+  def start_recording(self):
+    directory = os.path.join(
+      os.path.expanduser(
+        self.get_parameter("recording_path").get_parameter_value().string_value
+      ),
+      datetime.now().strftime("%Y%m%d_%H%M%S"),
+    )
+    self.recording = RecordingWriter(
+      directory,
+      chunk_size=self.get_parameter("recording_chunk_mb")
+      .get_parameter_value()
+      .integer_value
+      * 2**20,
+    )
+    ## Images are recorded JPEG compressed, other messages as they are
+    channels = [
+      ("image_raw", "sensor_msgs/msg/CompressedImage"),
+      ("dbg_image", "sensor_msgs/msg/CompressedImage"),
+      ("yolo/tracking", "yolov8_msgs/msg/DetectionArray"),
+      ("state_image", "silo_msgs/msg/SiloArray"),
+      ("state_map", "silo_msgs/msg/SiloArray"),
+      ("/odometry/filtered", "nav_msgs/msg/Odometry"),
+    ]
+    for name, type_name in channels:
+      self.recording.add_channel(name, type_name)
+
+    # Single thread keeps records in order of arrival
+    self.recorder = DiskWriter(
+      threads=1,
+      queue_size=self.get_parameter("recording_queue_size")
+      .get_parameter_value()
+      .integer_value,
+      drop_policy=self.get_parameter("drop_policy").get_parameter_value().string_value,
+      encode=self.serialize_record,
+      write=self.write_record,
+    )
+
+    self.create_subscription(
+      DetectionArray,
+      "yolo/tracking",
+      lambda msg: self.record("yolo/tracking", msg),
+      10,
+    )
+    self.create_subscription(
+      SiloArray, "state_image", lambda msg: self.record("state_image", msg), 10
+    )
+    self.create_subscription(
+      SiloArray, "state_map", lambda msg: self.record("state_map", msg), 10
+    )
+    self.create_subscription(
+      Odometry,
+      "/odometry/filtered",
+      lambda msg: self.record("/odometry/filtered", msg),
+      10,
+    )
+    self.create_timer(1.0, self.recording.flush)
+    self.get_logger().info(f"Recording to {directory}")
+
+  def record(self, channel: str, msg):
+    ## Stamp of arrival, same clock for all channels
+    self.recorder.submit((channel, self.get_clock().now().nanoseconds), msg)
+
+  def serialize_record(self, msg) -> bytes:
+    ## Runs in recorder thread
+    if isinstance(msg, Image):
+      compressed = CompressedImage()
+      compressed.header = msg.header
+      compressed.format = "jpeg"
+      compressed.data = self.encode_image(msg)
+      msg = compressed
+    return serialize_message(msg)
+
+  def write_record(self, key, data: bytes):
+    channel, stamp = key
+    self.recording.write(channel, stamp, data)
 
   def rect_img_callback(self, msg: Image):
+    if self.recorder is not None:
+      self.record("image_raw", msg)
+
     current_time = time.time()
     if current_time - self.last_captured_time_raw < self.capture_interval:
       return
@@ -95,14 +222,16 @@ class CaptureNode(Node):
       stamp = msg.header.stamp
       file_name = f"{stamp.sec}_{stamp.nanosec}.jpg"
 
-      img = self.bridge.imgmsg_to_cv2(msg, "bgr8")
       img_path = os.path.join(self.raw_images_path, file_name)
       # self.get_logger().info(f"Rect. Img saving - {img_path}")
-      cv2.imwrite(img_path, img)
+      self.writer.submit(img_path, msg)
 
       self.last_captured_time_raw = current_time
 
   def debug_img_callback(self, msg: Image):
+    if self.recorder is not None:
+      self.record("dbg_image", msg)
+
     current_time = time.time()
     # self.get_logger().info("Debug image callback")
     if current_time - self.last_captured_time_dbg < self.capture_interval:
@@ -113,10 +242,9 @@ class CaptureNode(Node):
       stamp = msg.header.stamp
       file_name = f"{stamp.sec}_{stamp.nanosec}.jpg"
 
-      img = self.bridge.imgmsg_to_cv2(msg, "bgr8")
       img_path = os.path.join(self.debug_images_path, file_name)
       # self.get_logger().info(f"Debug Img saving - {img_path}")
-      cv2.imwrite(img_path, img)
+      self.writer.submit(img_path, msg)
 
       self.last_captured_time_dbg = current_time
 
@@ -129,9 +257,6 @@ class CaptureNode(Node):
       stamp = rect_img_msg.header.stamp
       file_name = f"{stamp.sec}_{stamp.nanosec}.jpg"
 
-      rect_img = self.bridge.imgmsg_to_cv2(rect_img_msg, "bgr8")
-      debug_img = self.bridge.imgmsg_to_cv2(debug_img_msg, "bgr8")
-
       # resized_raw_img = cv2.resize(
       #   rect_img, (rect_img_msg.width // 2, rect_img_msg.height // 2)
       # )
@@ -145,16 +270,44 @@ class CaptureNode(Node):
       debug_img_path = os.path.join(self.debug_images_path, file_name)
 
       # self.get_logger().info(f"Saving images to {rect_img_path} and {debug_img_path}")
-      cv2.imwrite(rect_img_path, rect_img)
-      cv2.imwrite(debug_img_path, debug_img)
+      self.writer.submit(rect_img_path, rect_img_msg)
+      self.writer.submit(debug_img_path, debug_img_msg)
       # cv2.imwrite(debug_img_path, combined_img)
 
       self.last_captured_time = current_time
 
+  def encode_image(self, msg: Image) -> bytes:
+    ## Runs in writer threads
+    return self.encode_jpeg(self.bridge.imgmsg_to_cv2(msg, "bgr8"))
+
+  def log_writer_metrics(self):
+    writers = [("Images", self.writer)]
+    if self.recorder is not None:
+      writers.append(("Recording", self.recorder))
+    for name, writer in writers:
+      metrics = writer.metrics()
+      self.get_logger().info(
+        f"{name} -> Written: {metrics['written']} | Dropped: {metrics['dropped']} | "
+        f"Failed: {metrics['failed']} | Pending: {metrics['pending']} | "
+        f"{metrics['writes_per_sec']:.2f} writes/s, {metrics['mb_per_sec']:.2f} MB/s, "
+        f"{metrics['ms_per_write']:.1f} ms/write"
+      )
+      if writer.last_error:
+        self.get_logger().warn(f"{name} -> Last write error: {writer.last_error}")
+
+  def destroy_node(self):
+    self.writer.close()
+    if self.recorder is not None:
+      if not self.recorder.close():
+        self.get_logger().warn("Recorder still writing, recording may be truncated")
+      self.recording.close()
+    super().destroy_node()
+
 
 def main(args=None):
   rclpy.init(args=args)
   node = CaptureNode()
+  attach_profiler(node)
   rclpy.spin(node)
   node.destroy_node()
   rclpy.shutdown()
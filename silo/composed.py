@@ -0,0 +1,73 @@
+"""
+Silo nodes composed in a single process on a multi-threaded executor.
+
+Nodes keep their own callback groups, so callbacks of a node never run concurrently
+while different nodes run in parallel. Parameters, remappings & namespace of the
+command line apply to every node of the process, and node names are the defaults of
+their classes (a __node remapping would rename all of them). Defaults are the names
+given by the launch files, so services, parameters & traces keep their names.
+
+rclpy offers no intra-process communication, messages between composed nodes are still
+delivered through the middleware, which skips the network transport within a process.
+The gain is one interpreter & middleware participant instead of one per node.
+"""
+
+import argparse
+import importlib
+import sys
+
+import rclpy
+from rclpy.executors import MultiThreadedExecutor
+from rclpy.utilities import remove_ros_args
+
+from silo.profiling import attach_profiler
+
+# Name -> module, class of node
+NODES = {
+  "image_receiver": ("silo.image_receiver", "ImageReceiverNode"),
+  "state_estimation": ("silo.estimate_state", "StateEstimation"),
+  "state_estimation_hsv": ("silo.raw_estimate_hsv", "StateEstimationHSV"),
+  "absolute_state": ("silo.absolute_silo_state", "AbsoluteStateEstimation"),
+  "selection": ("silo.select_silo", "SiloSelection"),
+  "silos_marker": ("rviz.balls_silo", "MarkerBroadcaster"),
+  "target_marker": ("rviz.target_silo", "MarkerBroadcaster"),
+  "static_tf": ("silo.static_tf", "StaticTransformPublisher"),
+}
+# As in silo.launch.py, HSV estimation is disabled
+DEFAULT_NODES = [name for name in NODES if name != "state_estimation_hsv"]
+# Nodes which profile themselves
+SELF_PROFILED = {"image_receiver"}
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument("--nodes", nargs="+", choices=NODES, default=DEFAULT_NODES)
+  parser.add_argument(
+    "--threads", type=int, default=0, help="threads of executor, 0 for CPU count"
+  )
+  options = parser.parse_args(remove_ros_args(sys.argv if args is None else args)[1:])
+
+  rclpy.init(args=args)
+  executor = MultiThreadedExecutor(num_threads=options.threads or None)
+  nodes = []
+  for name in options.nodes:
+    module, class_name = NODES[name]
+    node = getattr(importlib.import_module(module), class_name)()
+    if name not in SELF_PROFILED:
+      attach_profiler(node)
+    executor.add_node(node)
+    nodes.append(node)
+
+  try:
+    executor.spin()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    executor.shutdown()
+    for node in nodes:
+      node.destroy_node()
+    rclpy.try_shutdown()
+
+
+if __name__ == "__main__":
+  main()
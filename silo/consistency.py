@@ -0,0 +1,90 @@
+"""
+Validation of received silos state using the precomputed legal stack transitions.
+
+Repair kinds:
+1. invalid -> received state is not a possible stack e.g. "RRRB", "X"
+2. regression -> received state is a prefix of previous state (top balls occluded)
+3. conflict -> received state contradicts balls already in silo
+4. joint -> received state of all silos violates a joint constraint
+"""
+
+from collections import Counter
+from typing import Callable, List, Optional, Sequence
+
+from silo.stacks import (
+  INVALID_STACK,
+  IS_LEGAL_TRANSITION,
+  STACK_ID,
+  STACK_LENGTH,
+  STACKS,
+)
+
+INVALID = "invalid"
+REGRESSION = "regression"
+CONFLICT = "conflict"
+JOINT = "joint"
+
+# Joint constraint on stack ids of all silos: (previous, current) -> is valid
+JointConstraint = Callable[[Sequence[int], Sequence[int]], bool]
+
+
+def total_balls(stack_ids: Sequence[int]) -> int:
+  return sum(STACK_LENGTH[i] for i in stack_ids)
+
+
+def max_new_balls(balls: int) -> JointConstraint:
+  """Joint constraint limiting number of balls added in a single update"""
+
+  def constraint(previous: Sequence[int], current: Sequence[int]) -> bool:
+    return total_balls(current) - total_balls(previous) <= balls
+
+  return constraint
+
+
+class StateConsistency:
+  def __init__(self, joint_constraints: Optional[List[JointConstraint]] = None):
+    """! Validation of received silos state against previous state
+    @param joint_constraints constraints on state of all silos checked after per silo
+    repair, none by default
+    """
+    self.joint_constraints = joint_constraints or []
+
+    # Number of repairs by kind since start
+    self.repairs = Counter()
+    # Number of repairs in last update
+    self.last_repairs = Counter()
+
+  def repair(
+    self, previous: Sequence[str], received: Sequence[Optional[str]]
+  ) -> List[str]:
+    """! Consistent state of silos from previous and received state
+    @param previous previous state of each silo, must be valid stacks
+    @param received received state of each silo, None if silo is not observed
+    @return state of each silo where impossible observations keep previous state
+    """
+    self.last_repairs.clear()
+    previous_ids = [STACK_ID[stack] for stack in previous]
+    next_ids = list(previous_ids)
+
+    for i, stack in enumerate(received):
+      if stack is None:
+        continue
+      received_id = STACK_ID.get(stack, INVALID_STACK)
+      previous_id = previous_ids[i]
+      if received_id == INVALID_STACK:
+        self.last_repairs[INVALID] += 1
+      elif IS_LEGAL_TRANSITION[previous_id][received_id]:
+        next_ids[i] = received_id
+      elif IS_LEGAL_TRANSITION[received_id][previous_id]:
+        self.last_repairs[REGRESSION] += 1
+      else:
+        self.last_repairs[CONFLICT] += 1
+
+    for constraint in self.joint_constraints:
+      if not constraint(previous_ids, next_ids):
+        self.last_repairs[JOINT] += 1
+        next_ids = previous_ids
+        break
+
+    self.repairs.update(self.last_repairs)
+    return [STACKS[i] for i in next_ids]
@@ -0,0 +1,185 @@
+"""
+Background writer of images (or any payload) to disk.
+
+Callers only put jobs in a bounded queue, a pool of threads encodes and writes them so
+that a slow disk never blocks a ROS callback. Jobs are written to a file each by
+default, or handed to a custom sink such as a recording. When the queue is full, the
+job is dropped as per the drop policy:
+- drop_newest -> new job is dropped
+- drop_oldest -> oldest queued job is dropped to make room for new job
+Once closing, new jobs are dropped and every thread is sent a stop sentinel after the
+pending jobs.
+"""
+
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import cv2
+
+DROP_POLICIES = ("drop_newest", "drop_oldest")
+
+
+def jpeg_encoder(quality: int = 95) -> Callable[[Any], bytes]:
+  """! Encoder of BGR images to JPEG bytes"""
+  params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+  def encode(image) -> bytes:
+    is_encoded, buffer = cv2.imencode(".jpg", image, params)
+    if not is_encoded:
+      raise ValueError("Image not encoded")
+    return buffer.tobytes()
+
+  return encode
+
+
+class DiskWriter:
+  def __init__(
+    self,
+    threads: int = 2,
+    queue_size: int = 16,
+    drop_policy: str = "drop_newest",
+    encode: Optional[Callable[[Any], bytes]] = None,
+    write: Optional[Callable[[Any, bytes], None]] = None,
+  ):
+    """! Bounded queue & pool of writer threads
+    @param threads number of encoder/writer threads
+    @param queue_size maximum number of pending jobs
+    @param drop_policy one of DROP_POLICIES
+    @param encode converts a payload to bytes in writer threads, JPEG by default,
+    bytes payloads are written as they are
+    @param write sink called with (key, data) of each job, writes data to file at
+    path key by default. Use a single thread to keep jobs in order
+    """
+    if drop_policy not in DROP_POLICIES:
+      raise ValueError(f"Unknown drop policy: {drop_policy}")
+    self.drop_policy = drop_policy
+    self.encode = encode or jpeg_encoder()
+    self.write = write or write_file
+    self.jobs = queue.Queue(maxsize=queue_size)
+
+    self.lock = threading.Lock()
+    self.closing = False
+    self.submitted = 0
+    self.written = 0
+    self.dropped = 0
+    self.failed = 0
+    self.bytes_written = 0
+    self.busy_time = 0.0
+    self.start_time = time.monotonic()
+    self.last_error = ""
+
+    self.threads = [
+      threading.Thread(target=self.__work, name=f"disk_writer_{i}", daemon=True)
+      for i in range(threads)
+    ]
+    for thread in self.threads:
+      thread.start()
+
+  def submit(self, path, payload) -> bool:
+    """! Queue payload to be written at path (or key of sink) without blocking
+    @return False if a job was dropped because queue was full or writer is closing
+    """
+    # Queue is only touched without blocking, under lock so that close cannot queue
+    # sentinels meanwhile: drop_oldest never drops a sentinel
+    with self.lock:
+      self.submitted += 1
+      if self.closing:
+        self.dropped += 1
+        return False
+      try:
+        self.jobs.put_nowait((path, payload))
+        return True
+      except queue.Full:
+        pass
+
+      if self.drop_policy == "drop_oldest":
+        try:
+          self.jobs.get_nowait()
+          self.jobs.task_done()
+        except queue.Empty:
+          pass
+        try:
+          self.jobs.put_nowait((path, payload))
+        except queue.Full:
+          pass
+      self.dropped += 1
+      return False
+
+  def metrics(self) -> Dict[str, float]:
+    """! Counters & write throughput since start"""
+    with self.lock:
+      elapsed = time.monotonic() - self.start_time
+      return {
+        "submitted": self.submitted,
+        "written": self.written,
+        "dropped": self.dropped,
+        "failed": self.failed,
+        "pending": self.jobs.qsize(),
+        "writes_per_sec": self.written / elapsed if elapsed > 0 else 0.0,
+        "mb_per_sec": self.bytes_written / elapsed / 1e6 if elapsed > 0 else 0.0,
+        "ms_per_write": 1e3 * self.busy_time / self.written if self.written else 0.0,
+      }
+
+  def flush(self):
+    """! Wait until all queued jobs are written"""
+    self.jobs.join()
+
+  def close(self, timeout: float = 5.0) -> bool:
+    """! Stop accepting jobs, write pending jobs & stop threads
+    @param timeout seconds to wait in total, threads still writing after it are left
+    to finish as daemons
+    @return True if all threads stopped
+    """
+    with self.lock:
+      if self.closing:
+        return not any(thread.is_alive() for thread in self.threads)
+      self.closing = True
+
+    deadline = time.monotonic() + timeout
+    for _ in self.threads:
+      try:
+        self.jobs.put(None, timeout=max(0.0, deadline - time.monotonic()))
+      except queue.Full:
+        break
+    for thread in self.threads:
+      thread.join(max(0.0, deadline - time.monotonic()))
+    return not any(thread.is_alive() for thread in self.threads)
+
+  def __work(self):
+    while True:
+      job = self.jobs.get()
+      if job is None:
+        self.jobs.task_done()
+        return
+      path, payload = job
+      start = time.monotonic()
+      try:
+        data = payload if isinstance(payload, bytes) else self.encode(payload)
+        self.write(path, data)
+      # Any failure of a job must not stop the worker
+      except Exception as e:
+        with self.lock:
+          self.failed += 1
+          self.last_error = f"{path}: {e}"
+      else:
+        with self.lock:
+          self.written += 1
+          self.bytes_written += len(data)
+          self.busy_time += time.monotonic() - start
+      finally:
+        self.jobs.task_done()
+
+
+def write_file(path: str, data: bytes):
+  with open(path, "wb") as file:
+    file.write(data)
+
+
+def ensure_directory(path: str) -> str:
+  """! Expand user & create directory if missing"""
+  path = os.path.expanduser(path)
+  os.makedirs(path, exist_ok=True)
+  return path
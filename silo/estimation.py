@@ -0,0 +1,134 @@
+"""
+State of silos visible in an image from object detections.
+
+Silos are sorted from left to right in the field of view of the team (descending x
+in image for red team), and each ball is assigned to the first silo whose bounding box,
+widened by a tolerance, contains the ball. Balls of a silo are sorted from bottom to
+top.
+"""
+
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+SILOS_NUM = 5
+MAX_BALLS = 3
+
+BALL_REPRS = {"red": "R", "red-ball": "R", "blue": "B", "blue-ball": "B"}
+
+
+class Detection(NamedTuple):
+  class_name: str
+  # Center, width & height of bounding box in pixels
+  x: float
+  y: float
+  width: float
+  height: float
+
+
+class SiloObservation(NamedTuple):
+  # Index starting from 1, in order of silos in image or absolute
+  index: int
+  state: str
+  xyxy: Tuple[int, int, int, int]
+
+
+def detections_from_msgs(detections: Iterable) -> List[Detection]:
+  """! Plain detections from yolov8_msgs Detection messages"""
+  return [
+    Detection(
+      detection.class_name,
+      detection.bbox.center.position.x,
+      detection.bbox.center.position.y,
+      detection.bbox.size.x,
+      detection.bbox.size.y,
+    )
+    for detection in detections
+  ]
+
+
+def parse_bbox(detection: Detection) -> List[int]:
+  """! Integer center_x, center_y, width, height of bounding box"""
+  return [
+    int(detection.x),
+    int(detection.y),
+    int(detection.width),
+    int(detection.height),
+  ]
+
+
+def xywh2xyxy(xywh: Sequence[int]) -> List[int]:
+  """Converts bbox xywh format into xyxy format"""
+  return [
+    xywh[0] - int(xywh[2] / 2),
+    xywh[1] - int(xywh[3] / 2),
+    xywh[0] + int(xywh[2] / 2),
+    xywh[1] + int(xywh[3] / 2),
+  ]
+
+
+def sort_silos(silos: Iterable[Detection], team_color: str) -> List[Detection]:
+  """! Silos from left to right as seen by the team"""
+  return sorted(silos, key=lambda silo: silo.x, reverse=team_color != "blue")
+
+
+class DetectionStateEstimator:
+  def __init__(
+    self,
+    team_color: str,
+    image_width: int,
+    image_height: int,
+    tolerance: float = 0.05,
+  ):
+    """! Estimator of silos state from detections of silos & balls
+    @param tolerance widening of silo bounding boxes as a fraction of image width
+    """
+    self.team_color = team_color
+    self.image_width = image_width
+    self.image_height = image_height
+    self.tolerance = tolerance
+    # Warnings of last estimate
+    self.warnings: List[str] = []
+
+  def estimate(
+    self, detections: Sequence[Detection]
+  ) -> Optional[List[SiloObservation]]:
+    """! State of visible silos
+    @return silos in order of image, None if more than 5 silos are detected
+    """
+    self.warnings = []
+    silos = [detection for detection in detections if detection.class_name == "silo"]
+    balls = [detection for detection in detections if detection.class_name != "silo"]
+    if len(silos) > SILOS_NUM:
+      self.warnings.append("Too many silos detected")
+      return None
+
+    silo_bboxes_xyxy = [
+      xywh2xyxy(parse_bbox(silo)) for silo in sort_silos(silos, self.team_color)
+    ]
+
+    ## Assign balls to silos
+    x_margin = self.tolerance * self.image_width
+    balls_in_silos: List[List[Detection]] = [[] for _ in silo_bboxes_xyxy]
+    for ball in balls:
+      ball_xyxy = xywh2xyxy(parse_bbox(ball))
+      for i, silo_xyxy in enumerate(silo_bboxes_xyxy):
+        if (
+          ball_xyxy[0] >= max(0, silo_xyxy[0] - x_margin)
+          and ball_xyxy[2] <= min(self.image_width, silo_xyxy[2] + x_margin)
+          and ball_xyxy[1] >= max(0, silo_xyxy[1] - 100)
+          and ball_xyxy[3] <= min(self.image_height, silo_xyxy[3] + 10)
+        ):
+          balls_in_silos[i].append(ball)
+          break
+
+    ## Balls from bottom to top
+    observations = []
+    for i, silo_balls in enumerate(balls_in_silos):
+      silo_balls.sort(key=lambda ball: ball.y, reverse=True)
+      if len(silo_balls) > MAX_BALLS:
+        self.warnings.append(
+          f"Too many balls detected in silo-{i + 1} i.e. {len(silo_balls)} balls"
+        )
+        silo_balls = silo_balls[:MAX_BALLS]
+      state = "".join(BALL_REPRS.get(ball.class_name, "") for ball in silo_balls)
+      observations.append(SiloObservation(i + 1, state, tuple(silo_bboxes_xyxy[i])))
+    return observations
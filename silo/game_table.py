@@ -0,0 +1,242 @@
+"""
+Game value table for storing balls in the 5 silos.
+
+The joint state of the silos has only 15^5 = 759375 possibilities, so the whole game
+is solved offline by backward induction over the number of stored balls. For every
+joint state and silo where the team stores its next ball, the table holds:
+- value -> expected captured silos of team minus opponent at end of game, with Mua Vang
+  (3 captured silos) worth +/- mua_vang_value
+- capture probability -> probability that team wins by Mua Vang
+
+The opponent stores a ball between two balls of the team with probability
+opponent_rate, choosing a silo according to the opponent model:
+- uniform -> any silo which is not full, with equal probability
+- greedy -> best silo in priority order of SiloSelection from opponent's view
+- adversarial -> silo which minimizes value for team
+
+With strict alternation (opponent_rate 1.0) the team storing the first ball can force
+Mua Vang under every opponent model, so the empty board is worth +mua_vang_value and
+up to half of the states have the same value for every silo, where the table ranks
+as priority only. Below 1.0 the opponent may fall behind or catch up, which makes
+values discriminate (a quarter of states stay tied at 0.9), so the default is 0.9
+against the greedy opponent of silo_selection_node. A table only helps if its
+opponent model fits the opponent: against priority in silo.simulator (20000 games)
+no table wins measurably more than priority itself (0.50), greedy 0.9 wins 0.49,
+uniform 0.8 0.44, so check a table there before loading it in silo_selection_node.
+
+The table is solved from the view of blue team and saved as a .npy file of shape
+(759375, 5, 2) which is memory-mapped at runtime, red team looks up color swapped
+stacks.
+"""
+
+import argparse
+import sys
+import time
+from typing import Optional, Sequence
+
+import numpy as np
+
+from silo.priority import FULL_PRIORITY, build_priority_table
+from silo.stacks import (
+  CAPTURED_BY,
+  INVALID_STACK,
+  MAX_BALLS,
+  PUSH_BALL,
+  STACK_ID,
+  STACK_LENGTH,
+  STACKS,
+  STACKS_NUM,
+  SWAPPED_STACK,
+)
+
+SILOS_NUM = 5
+STATES_NUM = STACKS_NUM**SILOS_NUM
+CAPTURED_SILOS_TO_WIN = 3
+# State id is the number with stack id of silo i as its i-th base 15 digit
+PLACE_VALUES = STACKS_NUM ** np.arange(SILOS_NUM)
+
+TEAM_REPR = "B"
+OPPONENT_REPR = "R"
+OPPONENT_MODELS = ("uniform", "greedy", "adversarial")
+
+# Index of quantities in last axis of table
+VALUE = 0
+CAPTURE_PROBABILITY = 1
+
+
+def solve(
+  opponent_model: str = "greedy",
+  opponent_rate: float = 0.9,
+  mua_vang_value: float = 10.0,
+) -> np.ndarray:
+  """! Solve game for all joint states of silos
+  @param opponent_model one of OPPONENT_MODELS
+  @param opponent_rate probability that opponent stores a ball after each team ball
+  @param mua_vang_value value of winning by Mua Vang
+  @return (STATES_NUM, SILOS_NUM, 2) value & capture probability of storing team ball in
+  each silo, NaN if silo is full or game is over
+  """
+  if opponent_model not in OPPONENT_MODELS:
+    raise ValueError(f"Unknown opponent model: {opponent_model}")
+
+  states = np.arange(STATES_NUM)
+  digits = (states[:, None] // PLACE_VALUES) % STACKS_NUM
+
+  ## Terminal states & their outcome
+  balls = np.asarray(STACK_LENGTH)[digits].sum(axis=1)
+  captured_by = np.asarray(CAPTURED_BY)[digits]
+  team_captured = (captured_by == TEAM_REPR).sum(axis=1)
+  opponent_captured = (captured_by == OPPONENT_REPR).sum(axis=1)
+  is_win = team_captured >= CAPTURED_SILOS_TO_WIN
+  is_loss = opponent_captured >= CAPTURED_SILOS_TO_WIN
+  is_terminal = is_win | is_loss | (balls == SILOS_NUM * MAX_BALLS)
+  outcome = np.where(
+    is_win,
+    mua_vang_value,
+    np.where(is_loss, -mua_vang_value, team_captured - opponent_captured),
+  )
+  win_probability = is_win.astype(float)
+
+  team_next = _next_states(states, digits, TEAM_REPR)
+  opponent_next = _next_states(states, digits, OPPONENT_REPR)
+
+  # Silo chosen by greedy opponent, lowest index among equal priorities
+  opponent_priority = build_priority_table(OPPONENT_REPR, TEAM_REPR)
+  priorities = np.array([opponent_priority[stack] for stack in STACKS])
+  priorities[priorities == FULL_PRIORITY] = len(STACKS)
+  greedy_choice = np.argmin(priorities[digits], axis=1)
+
+  # Value at turn of team (W) and opponent (U) with probabilities of capture
+  team_value = np.zeros(STATES_NUM)
+  team_probability = np.zeros(STATES_NUM)
+  opponent_value = np.zeros(STATES_NUM)
+  opponent_probability = np.zeros(STATES_NUM)
+  table = np.full((STATES_NUM, SILOS_NUM, 2), np.nan, dtype=np.float32)
+
+  for level in range(SILOS_NUM * MAX_BALLS, -1, -1):
+    level_states = states[balls == level]
+    terminal = level_states[is_terminal[level_states]]
+    live = level_states[~is_terminal[level_states]]
+    rows = np.arange(len(live))
+
+    team_value[terminal] = outcome[terminal]
+    team_probability[terminal] = win_probability[terminal]
+    opponent_value[terminal] = outcome[terminal]
+    opponent_probability[terminal] = win_probability[terminal]
+    if len(live) == 0:
+      continue
+
+    ## Team stores a ball, best silo by value
+    next_states = team_next[live]
+    valid = next_states >= 0
+    next_states = np.where(valid, next_states, 0)
+    values = np.where(valid, opponent_value[next_states], -np.inf)
+    probabilities = opponent_probability[next_states]
+    best = np.argmax(values, axis=1)
+    team_value[live] = values[rows, best]
+    team_probability[live] = probabilities[rows, best]
+    table[live, :, VALUE] = np.where(valid, values, np.nan)
+    table[live, :, CAPTURE_PROBABILITY] = np.where(valid, probabilities, np.nan)
+
+    ## Opponent stores a ball as per opponent model
+    next_states = opponent_next[live]
+    valid = next_states >= 0
+    next_states = np.where(valid, next_states, 0)
+    values = team_value[next_states]
+    probabilities = team_probability[next_states]
+    match opponent_model:
+      case "uniform":
+        choices = valid.sum(axis=1)
+        placed_value = np.where(valid, values, 0.0).sum(axis=1) / choices
+        placed_probability = np.where(valid, probabilities, 0.0).sum(axis=1) / choices
+      case "greedy":
+        choice = greedy_choice[live]
+        placed_value = values[rows, choice]
+        placed_probability = probabilities[rows, choice]
+      case "adversarial":
+        choice = np.argmin(np.where(valid, values, np.inf), axis=1)
+        placed_value = values[rows, choice]
+        placed_probability = probabilities[rows, choice]
+
+    opponent_value[live] = (
+      opponent_rate * placed_value + (1 - opponent_rate) * team_value[live]
+    )
+    opponent_probability[live] = (
+      opponent_rate * placed_probability + (1 - opponent_rate) * team_probability[live]
+    )
+
+  return table
+
+
+def _next_states(states: np.ndarray, digits: np.ndarray, color: str) -> np.ndarray:
+  ## State after storing a ball of color in each silo, -1 if silo is full
+  push = np.array([PUSH_BALL[i][color] for i in range(STACKS_NUM)])
+  pushed = push[digits]
+  next_states = states[:, None] + (pushed - digits) * PLACE_VALUES
+  return np.where(pushed == INVALID_STACK, -1, next_states)
+
+
+class GameTable:
+  def __init__(self, path: str, team_repr: str):
+    """! Memory-mapped game value table solved by this module
+    @param path path of .npy file
+    @param team_repr "B" or "R"
+    """
+    self.table = np.load(path, mmap_mode="r")
+    if self.table.shape != (STATES_NUM, SILOS_NUM, 2):
+      raise ValueError(f"{path} has shape {self.table.shape}, not a game table")
+
+    if team_repr == TEAM_REPR:
+      self.stack_ids = dict(STACK_ID)
+    else:
+      self.stack_ids = {stack: SWAPPED_STACK[i] for stack, i in STACK_ID.items()}
+    self.place_values = PLACE_VALUES.tolist()
+
+  def lookup(self, states: Sequence[str]) -> Optional[np.ndarray]:
+    """! Value & capture probability of storing ball in each silo
+    @param states state of each of 5 silos in order of index
+    @return (SILOS_NUM, 2) array, None if states are not possible
+    """
+    state_id = 0
+    for state, place_value in zip(states, self.place_values):
+      stack_id = self.stack_ids.get(state, INVALID_STACK)
+      if stack_id == INVALID_STACK:
+        return None
+      state_id += stack_id * place_value
+    return self.table[state_id]
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Solve game value table of silos")
+  parser.add_argument("-o", "--output", default="game_table.npy")
+  parser.add_argument("--opponent-model", choices=OPPONENT_MODELS, default="greedy")
+  parser.add_argument("--opponent-rate", type=float, default=0.9)
+  parser.add_argument("--mua-vang-value", type=float, default=10.0)
+  args = parser.parse_args(args)
+
+  start = time.perf_counter()
+  table = solve(args.opponent_model, args.opponent_rate, args.mua_vang_value)
+  np.save(args.output, table.astype(np.float16))
+  print(f"Solved {STATES_NUM} states in {time.perf_counter() - start:.1f}s")
+
+  empty = table[0]
+  print(f"Empty silos -> value: {np.nanmax(empty[:, VALUE]):.3f}", end=" | ")
+  print(f"capture probability: {empty[np.nanargmax(empty[:, VALUE]), 1]:.3f}")
+  ## States where the table can choose, but every silo has the same value
+  values = table[:, :, VALUE]
+  values = values[(~np.isnan(values)).sum(axis=1) > 1]
+  is_tied = np.nanmax(values, axis=1) - np.nanmin(values, axis=1) < 1e-6
+  is_saturated = np.nanmin(np.abs(values), axis=1) >= args.mua_vang_value
+  print(f"Tied states (same value for every silo): {is_tied.mean():.1%}", end=" | ")
+  print(f"saturated at +/- Mua Vang: {is_saturated.mean():.1%}")
+  if is_tied.mean() > 0.5:
+    print(
+      f"WARNING: most states are tied, the table ranks as priority there, lower"
+      f" --opponent-rate ({args.opponent_rate})",
+      file=sys.stderr,
+    )
+  print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
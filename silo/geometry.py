@@ -0,0 +1,80 @@
+from math import atan2, cos, radians, sin
+from typing import Sequence, Tuple
+
+import numpy as np
+
+
+def rotation_from_ypr(ypr: Sequence[float], degrees: bool = True) -> np.ndarray:
+  """! Rotation matrix for intrinsic ZYX (yaw, pitch, roll) Euler angles
+  Same convention as scipy's Rotation.from_euler("ZYX", ypr)
+  @param ypr yaw, pitch, roll
+  @param degrees whether angles are in degrees
+  @return 3x3 rotation matrix
+  """
+  yaw, pitch, roll = ypr
+  if degrees:
+    yaw, pitch, roll = radians(yaw), radians(pitch), radians(roll)
+
+  cy, sy = cos(yaw), sin(yaw)
+  cp, sp = cos(pitch), sin(pitch)
+  cr, sr = cos(roll), sin(roll)
+
+  return np.array(
+    [
+      [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+      [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+      [-sp, cp * sr, cp * cr],
+    ]
+  )
+
+
+def quaternion_from_ypr(
+  ypr: Sequence[float], degrees: bool = True
+) -> Tuple[float, float, float, float]:
+  """! Quaternion for intrinsic ZYX (yaw, pitch, roll) Euler angles
+  Same convention as scipy's Rotation.from_euler("ZYX", ypr).as_quat()
+  @param ypr yaw, pitch, roll
+  @param degrees whether angles are in degrees
+  @return x, y, z, w
+  """
+  yaw, pitch, roll = ypr
+  if degrees:
+    yaw, pitch, roll = radians(yaw), radians(pitch), radians(roll)
+
+  cy, sy = cos(yaw / 2), sin(yaw / 2)
+  cp, sp = cos(pitch / 2), sin(pitch / 2)
+  cr, sr = cos(roll / 2), sin(roll / 2)
+
+  return (
+    sr * cp * cy - cr * sp * sy,
+    cr * sp * cy + sr * cp * sy,
+    cr * cp * sy - sr * sp * cy,
+    cr * cp * cy + sr * sp * sy,
+  )
+
+
+def rotation_from_quaternion(x: float, y: float, z: float, w: float) -> np.ndarray:
+  """Rotation matrix of a (x, y, z, w) quaternion"""
+  return np.array(
+    [
+      [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+      [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+      [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ]
+  )
+
+
+def yaw_from_quaternion(x: float, y: float, z: float, w: float) -> float:
+  """Heading (rotation about Z) of a (x, y, z, w) quaternion"""
+  return atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+
+
+def optical_axis_heading(ypr_base2cam: Sequence[float], degrees: bool = True) -> float:
+  """Heading w.r.t. base_link of the optical (Z) axis of a camera optical frame"""
+  rotation = rotation_from_ypr(ypr_base2cam, degrees)
+  return atan2(rotation[1, 2], rotation[0, 2])
+
+
+def wrap_angle(angle):
+  """Wrap angle(s) in radians into [-pi, pi)"""
+  return (angle + np.pi) % (2 * np.pi) - np.pi
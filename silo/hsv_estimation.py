@@ -0,0 +1,199 @@
+"""
+State of silos visible in an image from HSV color masks.
+
+Silos are located by object detection, then each silo is split into 3 ROIs from
+bottom to top at fractions of its height (y_divisions). A ROI holds a ball of a color
+if more than half of its pixels match the dilated HSV mask of that color.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from silo.estimation import (
+  SILOS_NUM,
+  Detection,
+  SiloObservation,
+  parse_bbox,
+  sort_silos,
+  xywh2xyxy,
+)
+
+HSVRange = Tuple[Tuple[int, int, int], Tuple[int, int, int]]
+HSVRanges = Dict[str, List[HSVRange]]
+
+# HSV ranges of each color, a pixel matches if it is inside any range
+HSV_RANGES: HSVRanges = {
+  "red": [((0, 120, 50), (10, 255, 235)), ((170, 120, 60), (180, 255, 220))],
+  "blue": [((80, 130, 30), (110, 170, 90)), ((100, 100, 50), (115, 230, 230))],
+}
+MATCH_THRESHOLD = 0.5
+# Masks are dilated by an elliptic kernel of this size, this many times
+DILATION_KERNEL = 5
+DILATION_ITERATIONS = 2
+
+
+def get_mask(
+  hsv_img: np.ndarray, color: str, ranges: Optional[HSVRanges] = None
+) -> np.ndarray:
+  """! Pixels inside any HSV range of color
+  @param ranges HSV ranges of each color, HSV_RANGES if None
+  """
+  mask = None
+  for low, high in (ranges or HSV_RANGES)[color]:
+    range_mask = cv2.inRange(hsv_img, low, high)
+    mask = range_mask if mask is None else cv2.bitwise_or(mask, range_mask)
+  return mask
+
+
+def preprocess_mask(
+  mask: np.ndarray,
+  kernel_size: int = DILATION_KERNEL,
+  iterations: int = DILATION_ITERATIONS,
+) -> np.ndarray:
+  if kernel_size < 2 or iterations < 1:
+    return mask
+  kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+  return cv2.dilate(mask, kernel, iterations=iterations)
+
+
+def scaled_dilation(scale: int) -> Tuple[int, int]:
+  """! Kernel size & iterations growing masks of images at 1/scale of their size by
+  1/scale of the distance of the default dilation
+  """
+  radius = (DILATION_KERNEL // 2) * DILATION_ITERATIONS / scale
+  if radius >= DILATION_KERNEL // 2:
+    return DILATION_KERNEL, round(radius / (DILATION_KERNEL // 2))
+  # A 3x3 kernel grows masks by 1 pixel per iteration
+  return 3, round(radius)
+
+
+def compute_match_percent(
+  hsv_img: np.ndarray, roi: Tuple[int, int, int, int], mask: np.ndarray
+) -> float:
+  x1, y1, x2, y2 = roi
+  roi_img = hsv_img[y1:y2, x1:x2]
+  roi_mask = mask[y1:y2, x1:x2]
+
+  roi_mask = cv2.bitwise_and(roi_img, roi_img, mask=roi_mask)
+  roi_mask = cv2.cvtColor(roi_mask, cv2.COLOR_HSV2BGR)
+  roi_mask = cv2.cvtColor(roi_mask, cv2.COLOR_BGR2GRAY)
+
+  return cv2.countNonZero(roi_mask) / (roi_mask.shape[0] * roi_mask.shape[1])
+
+
+def get_rois(
+  bbox_xyxy: Sequence[int], y_divisions: Sequence[int]
+) -> Tuple[Tuple[int, int, int, int], ...]:
+  """! ROIs of balls from bottom to top"""
+  roi_1 = (
+    bbox_xyxy[0],
+    bbox_xyxy[1] + y_divisions[2],
+    bbox_xyxy[2],
+    bbox_xyxy[1] + y_divisions[3],
+  )
+  roi_2 = (
+    bbox_xyxy[0],
+    bbox_xyxy[1] + y_divisions[1],
+    bbox_xyxy[2],
+    bbox_xyxy[1] + y_divisions[2],
+  )
+  roi_3 = (
+    bbox_xyxy[0],
+    max(0, bbox_xyxy[1] + y_divisions[0]),
+    bbox_xyxy[2],
+    bbox_xyxy[1] + y_divisions[1],
+  )
+  return roi_1, roi_2, roi_3
+
+
+def draw_rois(img: np.ndarray, rois) -> np.ndarray:
+  img_copy = img.copy()
+  for roi in rois:
+    cv2.rectangle(img_copy, (roi[0], roi[1]), (roi[2], roi[3]), (0, 255, 0), 2)
+  return img_copy
+
+
+class HSVStateEstimator:
+  def __init__(
+    self,
+    team_color: str,
+    min_silo_area: int = 1500,
+    y_divisions: Sequence[float] = (-0.10, 0.20, 0.60, 0.95),
+  ):
+    self.team_color = team_color
+    self.opponent_color = "red" if team_color == "blue" else "blue"
+    self.TEAM_REPR = "B" if team_color == "blue" else "R"
+    self.OPPONENT_REPR = "R" if team_color == "blue" else "B"
+    self.min_silo_area = min_silo_area
+    self.y_divisions = y_divisions
+
+  def estimate(
+    self, bgr_img: np.ndarray, detections: Sequence[Detection], debug: bool = False
+  ) -> Tuple[Optional[List[SiloObservation]], Optional[np.ndarray]]:
+    """! State of visible silos
+    @param debug whether to draw debug image
+    @return silos in order of image (None if more than 5 silos are detected) & debug
+    image (None if not drawn)
+    """
+    hsv_img = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2HSV)
+    team_mask = preprocess_mask(get_mask(hsv_img, self.team_color))
+    opponent_mask = preprocess_mask(get_mask(hsv_img, self.opponent_color))
+
+    debug_img = None
+    if debug:
+      combined_mask = cv2.bitwise_or(team_mask, opponent_mask)
+      colored_mask = cv2.bitwise_and(bgr_img, bgr_img, mask=combined_mask)
+      debug_img = bgr_img.copy()
+
+    silos = [
+      detection
+      for detection in detections
+      if detection.class_name == "silo"
+      and detection.width * detection.height > self.min_silo_area
+    ]
+    if len(silos) > SILOS_NUM:
+      return None, debug_img
+
+    observations = []
+    for i, silo in enumerate(sort_silos(silos, self.team_color)):
+      silo_xywh = parse_bbox(silo)
+      silo_xyxy = xywh2xyxy(silo_xywh)
+      silo_w = silo_xywh[2] - silo_xywh[0]
+      silo_h = silo_xywh[3] - silo_xywh[1]
+
+      y_divisions = [int(y * silo_h) for y in self.y_divisions]
+      rois = get_rois(silo_xyxy, y_divisions)
+      state = self.estimate_silo_state(hsv_img, rois, team_mask, opponent_mask)
+      observations.append(SiloObservation(i + 1, state, tuple(silo_xyxy)))
+
+      if debug:
+        debug_img = draw_rois(colored_mask, rois)
+        cv2.putText(
+          debug_img,
+          f"{state}",
+          (silo_xyxy[0] + int(0.1 * silo_w), silo_xyxy[3] - int(0.1 * silo_h)),
+          cv2.FONT_HERSHEY_SIMPLEX,
+          1,
+          (0, 255, 0),
+          1,
+        )
+    return observations, debug_img
+
+  def estimate_silo_state(
+    self,
+    hsv_img: np.ndarray,
+    rois,
+    team_mask: np.ndarray,
+    opponent_mask: np.ndarray,
+  ) -> str:
+    state = ""
+    for roi in rois:
+      if compute_match_percent(hsv_img, roi, team_mask) > MATCH_THRESHOLD:
+        state += self.TEAM_REPR
+      elif compute_match_percent(hsv_img, roi, opponent_mask) > MATCH_THRESHOLD:
+        state += self.OPPONENT_REPR
+      else:
+        break
+    return state
@@ -1,14 +1,13 @@
 #!/usr/bin/env python3
 
-import os
 import socket
+import threading
 import time
-from typing import List, Optional, Tuple
+from typing import Optional
 
-import cv2
-import numpy as np
 import rclpy
 from cv_bridge import CvBridge
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from rclpy.node import Node
 from rclpy.qos import (
   QoSDurabilityPolicy,
@@ -16,16 +15,29 @@ from rclpy.qos import (
   QoSProfile,
   QoSReliabilityPolicy,
 )
+from rclpy.time import Time
 from sensor_msgs.msg import Image
 from std_msgs.msg import Bool, Header, UInt8
 from std_srvs.srv import Trigger
-from ultralytics import YOLO
-from ultralytics.engine.results import Results
-from ultralytics.utils.plotting import Annotator
+
+from silo.disk_writer import DiskWriter, ensure_directory
+from silo.hsv_estimation import HSVRange, HSVRanges, scaled_dilation
+from silo.jpeg_decode import decode, downscale, reduced_decoder, scale_roi
+from silo.profiling import attach_profiler
+from silo.top_check import encode_debug_img, make_top_check
+from silo.top_check_worker import TopCheckStatus, TopCheckWorker
+from silo.trace_collector import create_tracer
+from silo.undistort import FrameUndistorter
 
 PORT = 12345
 
 
+def describe_top_check(status: TopCheckStatus) -> str:
+  if status.color is None:
+    return "Top spot is vacant"
+  return f"{status.color} is at top"
+
+
 class ImageReceiverNode(Node):
   def __init__(self):
     super().__init__("image_receiver_node")
@@ -34,6 +46,36 @@ class ImageReceiverNode(Node):
     self.declare_parameter("model", "check_top.pt")
     self.declare_parameter("device", "cuda:0")
     self.declare_parameter("threshold", 0.7)
+    # yolo (ultralytics) or CPU backends of ONNX model: onnxruntime, opencv
+    self.declare_parameter("model_backend", "yolo")
+    # CPU threads of ONNX backends, 0 for default of runtime
+    self.declare_parameter("inference_threads", 0)
+    # Class names of ONNX model, empty to read from model metadata (onnxruntime)
+    self.declare_parameter("class_names", [""])
+    # Model infers on top_roi grown by roi_padding pixels, at model_input_size
+    self.declare_parameter("roi_padding", 32)
+    self.declare_parameter("model_input_size", 320)
+    # Ball is at top if its top edge is within max_top_y pixels of top of frame
+    self.declare_parameter("max_top_y", 50.0)
+    # Save crops annotated with detections in background, for debugging
+    self.declare_parameter("save_debug_images", False)
+    self.declare_parameter("debug_images_path", "~/.ros/capture/top_check")
+    # Top check runs in background on every nth received frame, requests are answered
+    # from the latest result if its frame is at most max_result_age (s) old, else wait
+    # up to result_timeout (s) for a recent frame to be checked
+    self.declare_parameter("check_every_n_frames", 1)
+    self.declare_parameter("max_result_age", 0.5)
+    self.declare_parameter("result_timeout", 0.2)
+    # Top check runs on frames decoded at 1/scale (1, 2, 4 or 8) of their size
+    self.declare_parameter("top_check_decode_scale", 1)
+    # Remap published frames to compensate lens distortion of camera_info
+    self.declare_parameter("undistort", False)
+    self.declare_parameter("width", 921)
+    self.declare_parameter("height", 518)
+    self.declare_parameter("k", [0.0] * 9)
+    self.declare_parameter("d", [0.0] * 5)
+    # Publish spans of receive, decode, publish & top check for trace_collector_node
+    self.declare_parameter("trace", False)
 
     self.declare_parameter("top_roi", [0] * 4)  # XYXY format
     self.declare_parameter("match_fraction", 0.50)
@@ -66,82 +108,6 @@ class ImageReceiverNode(Node):
     self.declare_parameter("blue2_s_high", 230)
     self.declare_parameter("blue2_v_high", 230)
 
-    self.red1_h_low = (
-      self.get_parameter("red1_h_low").get_parameter_value().integer_value
-    )
-    self.red1_s_low = (
-      self.get_parameter("red1_s_low").get_parameter_value().integer_value
-    )
-    self.red1_v_low = (
-      self.get_parameter("red1_v_low").get_parameter_value().integer_value
-    )
-    self.red1_h_high = (
-      self.get_parameter("red1_h_high").get_parameter_value().integer_value
-    )
-    self.red1_s_high = (
-      self.get_parameter("red1_s_high").get_parameter_value().integer_value
-    )
-    self.red1_v_high = (
-      self.get_parameter("red1_v_high").get_parameter_value().integer_value
-    )
-
-    self.red2_h_low = (
-      self.get_parameter("red2_h_low").get_parameter_value().integer_value
-    )
-    self.red2_s_low = (
-      self.get_parameter("red2_s_low").get_parameter_value().integer_value
-    )
-    self.red2_v_low = (
-      self.get_parameter("red2_v_low").get_parameter_value().integer_value
-    )
-    self.red2_h_high = (
-      self.get_parameter("red2_h_high").get_parameter_value().integer_value
-    )
-    self.red2_s_high = (
-      self.get_parameter("red2_s_high").get_parameter_value().integer_value
-    )
-    self.red2_v_high = (
-      self.get_parameter("red2_v_high").get_parameter_value().integer_value
-    )
-
-    self.blue1_h_low = (
-      self.get_parameter("blue1_h_low").get_parameter_value().integer_value
-    )
-    self.blue1_s_low = (
-      self.get_parameter("blue1_s_low").get_parameter_value().integer_value
-    )
-    self.blue1_v_low = (
-      self.get_parameter("blue1_v_low").get_parameter_value().integer_value
-    )
-    self.blue1_h_high = (
-      self.get_parameter("blue1_h_high").get_parameter_value().integer_value
-    )
-    self.blue1_s_high = (
-      self.get_parameter("blue1_s_high").get_parameter_value().integer_value
-    )
-    self.blue1_v_high = (
-      self.get_parameter("blue1_v_high").get_parameter_value().integer_value
-    )
-
-    self.blue2_h_low = (
-      self.get_parameter("blue1_h_low").get_parameter_value().integer_value
-    )
-    self.blue2_s_low = (
-      self.get_parameter("blue1_s_low").get_parameter_value().integer_value
-    )
-    self.blue2_v_low = (
-      self.get_parameter("blue1_v_low").get_parameter_value().integer_value
-    )
-    self.blue2_h_high = (
-      self.get_parameter("blue1_h_high").get_parameter_value().integer_value
-    )
-    self.blue2_s_high = (
-      self.get_parameter("blue1_s_high").get_parameter_value().integer_value
-    )
-    self.blue2_v_high = (
-      self.get_parameter("blue1_v_high").get_parameter_value().integer_value
-    )
-
     self.top_roi = (
       self.get_parameter("top_roi").get_parameter_value().double_array_value
     )
@@ -150,20 +116,101 @@ class ImageReceiverNode(Node):
       self.get_parameter("match_fraction").get_parameter_value().double_value
     )
     self.__use_model = self.get_parameter("use_model").get_parameter_value().bool_value
+    self.decode_scale = (
+      self.get_parameter("top_check_decode_scale").get_parameter_value().integer_value
+    )
+    # Top check sees frames at 1/decode_scale of their size
+    top_check_roi = scale_roi(self.top_roi, self.decode_scale)
 
+    # Heavy inference backend is only imported when enabled
+    self.debug_writer = None
     if self.__use_model:
-      self.model = self.get_parameter("model").get_parameter_value().string_value
-      self.device = self.get_parameter("device").get_parameter_value().string_value
-      self.threshold = (
-        self.get_parameter("threshold").get_parameter_value().double_value
+      debug_img_dir = ""
+      if self.get_parameter("save_debug_images").get_parameter_value().bool_value:
+        debug_img_dir = ensure_directory(
+          self.get_parameter("debug_images_path").get_parameter_value().string_value
+        )
+        self.debug_writer = DiskWriter(threads=1, queue_size=8, encode=encode_debug_img)
+      model_backend = (
+        self.get_parameter("model_backend").get_parameter_value().string_value
+      )
+      if model_backend == "yolo":
+        backend_kwargs = {
+          "device": self.get_parameter("device").get_parameter_value().string_value
+        }
+      else:
+        class_names = (
+          self.get_parameter("class_names").get_parameter_value().string_array_value
+        )
+        backend_kwargs = {
+          "threads": self.get_parameter("inference_threads")
+          .get_parameter_value()
+          .integer_value,
+          "class_names": [name for name in class_names if name],
+        }
+      self.top_check = make_top_check(
+        model_backend,
+        model=self.get_parameter("model").get_parameter_value().string_value,
+        threshold=self.get_parameter("threshold").get_parameter_value().double_value,
+        top_roi=top_check_roi,
+        roi_padding=self.get_parameter("roi_padding")
+        .get_parameter_value()
+        .integer_value
+        // self.decode_scale,
+        input_size=self.get_parameter("model_input_size")
+        .get_parameter_value()
+        .integer_value,
+        max_top_y=self.get_parameter("max_top_y").get_parameter_value().double_value
+        / self.decode_scale,
+        debug_writer=self.debug_writer,
+        debug_img_dir=debug_img_dir,
+        **backend_kwargs,
+      )
+      self.get_logger().info(f"Top check by {model_backend} backend")
+    else:
+      # Masks are dilated by the same fraction of the frame at any decode scale
+      dilation_kernel, dilation_iterations = scaled_dilation(self.decode_scale)
+      self.top_check = make_top_check(
+        "hsv",
+        ranges=self.get_hsv_ranges(),
+        top_roi=top_check_roi,
+        match_fraction=self.match_fraction,
+        dilation_kernel=dilation_kernel,
+        dilation_iterations=dilation_iterations,
+      )
+
+    self.max_result_age = int(
+      self.get_parameter("max_result_age").get_parameter_value().double_value * 1e9
+    )
+    self.result_timeout = (
+      self.get_parameter("result_timeout").get_parameter_value().double_value
+    )
+    self.tracer = create_tracer(
+      self, self.get_parameter("trace").get_parameter_value().bool_value
+    )
+    # Latest result with stamp of its frame
+    self.top_check_pub = self.create_publisher(DiagnosticArray, "/top_check", 10)
+    self.top_check_worker = TopCheckWorker(
+      self.top_check,
+      self.get_parameter("check_every_n_frames").get_parameter_value().integer_value,
+      on_result=self.publish_top_check,
+      decode=reduced_decoder(self.decode_scale),
+    )
+
+    self.undistorter = None
+    if self.get_parameter("undistort").get_parameter_value().bool_value:
+      self.undistorter = FrameUndistorter(
+        self.get_parameter("k").get_parameter_value().double_array_value,
+        self.get_parameter("d").get_parameter_value().double_array_value,
+        (
+          self.get_parameter("width").get_parameter_value().integer_value,
+          self.get_parameter("height").get_parameter_value().integer_value,
+        ),
       )
-      self.yolo = YOLO(self.model)
-      self.debug_img_dir = "/home/apil/work/robocon2024/cv/live_capture/close_silo"
 
     self.srv = self.create_service(
       srv_type=Trigger, srv_name="/is_ball_at_top", callback=self.is_ball_at_top
     )
-    self.last_received_img = None
 
     image_qos_profile = QoSProfile(
       reliability=QoSReliabilityPolicy.BEST_EFFORT,
@@ -188,22 +235,35 @@ class ImageReceiverNode(Node):
     self.server_socket.listen(1)
     self.get_logger().info(f"Listening on port {PORT}")
 
-    # Run receive loop in constructor
-    self.receive_loop()
+    # Top check runs outside ROS callbacks, so node profiles it along with callbacks
+    self.profiler = attach_profiler(self)
+    if self.profiler is not None:
+      self.top_check_worker.top_check = self.profiler.wrap(
+        "top_check", self.top_check_worker.top_check
+      )
+
+    # Receive loop runs in its own thread, node is spun like any other
+    self.is_receiving = True
+    self.receive_thread = threading.Thread(
+      target=self.receive_loop, name="image_receiver", daemon=True
+    )
+    self.receive_thread.start()
 
   def receive_loop(self):
-    while True:
+    while self.is_receiving:
       try:
         client_socket, addr = self.server_socket.accept()
         self.get_logger().info(f"Connection from {addr}")
 
-        while True:
+        while self.is_receiving:
           # Receive image size
           size_bytes = client_socket.recv(4)
           if not size_bytes:
             self.get_logger().warn("No size data received, closing connection.")
             break
 
+          # Sender transmits no capture stamp, first byte is the earliest known time
+          receive_start = time.time_ns()
           size = int.from_bytes(size_bytes, byteorder="big")
 
           # Receive image data
@@ -220,18 +280,37 @@ class ImageReceiverNode(Node):
             )
             raise Exception("Incomplete img_data received")
 
+          stamp = self.get_clock().now()
+          self.tracer.record("receive", receive_start, receive_start)
+
+          ## Without subscribers of image_raw, only the top check decodes frames
+          if self.publisher_.get_subscription_count() == 0:
+            self.top_check_worker.submit(img_data, stamp.nanoseconds)
+            continue
+
           # Decode image
-          np_arr = np.frombuffer(img_data, dtype=np.uint8)
-          cv_image = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+          with self.tracer.span("decode", stamp.nanoseconds):
+            cv_image = decode(img_data)
 
           if cv_image is None:
             self.get_logger().warn("Failed to decode frame.")
             continue
 
-          self.last_received_img = cv_image
+          self.top_check_worker.submit(
+            downscale(cv_image, self.decode_scale), stamp.nanoseconds
+          )
+          publish_start = time.time_ns()
+          # Top check is tuned on distorted frames, only published frames are remapped
+          if self.undistorter is not None:
+            try:
+              cv_image = self.undistorter(cv_image)
+            except ValueError as e:
+              self.get_logger().warn(
+                f"Publishing distorted frame: {e}", throttle_duration_sec=5.0
+              )
 
           msg_header = Header()
-          msg_header.stamp = self.get_clock().now().to_msg()
+          msg_header.stamp = stamp.to_msg()
           msg_header.frame_id = "picam_link_optical"
 
           # Publish image as ROS message
@@ -239,8 +318,11 @@ class ImageReceiverNode(Node):
             cv_image, encoding="bgr8", header=msg_header
           )
           self.publisher_.publish(ros_image_msg)
+          self.tracer.record("publish", stamp.nanoseconds, publish_start)
 
       except Exception as e:
+        if not self.is_receiving:
+          return
         self.get_logger().error(f"Error receiving image: {str(e)}")
 
   def silo_check_callback(self, msg: UInt8):
@@ -248,177 +330,83 @@ class ImageReceiverNode(Node):
     if msg.data != 0xA5:
       return
     response = Bool()
-    response.data = False
-    if self.last_received_img is None:
-      self.get_logger().warn("No image to compare")
-      self.silo_check_publisher.publish(response)
-      return response
-
-    if self.__use_model:
-      result, color = self.query_model()
+    status = self.get_top_check_status()
+    if status is None:
+      self.get_logger().warn("No recent top check result")
+      response.data = False
     else:
-      result, color = self.query_in_hsv()
-
-    response.data = result
+      response.data = status.is_on_top
     self.silo_check_publisher.publish(response)
 
   def is_ball_at_top(
     self, request: Trigger.Request, response: Trigger.Response
   ) -> Trigger.Response:
-    if self.last_received_img is None:
+    status = self.get_top_check_status()
+    if status is None:
       response.success = False
-      response.message = "No image to compare"
+      response.message = "No recent top check result"
       return response
 
-    if self.__use_model:
-      result, color = self.query_model()
-    else:
-      result, color = self.query_in_hsv()
-
-    response.success = result
-    if color is None:
-      response.message = "Top spot is vacant"
-    else:
-      response.message = f"{color} is at top"
+    response.success = status.is_on_top
+    response.message = describe_top_check(status)
     return response
 
-  def query_in_hsv(self) -> Tuple[bool, Optional[str]]:
-    # Convert image to HSV for color filtering
-    hsv_frame = cv2.cvtColor(self.last_received_img, cv2.COLOR_BGR2HSV)
-
-    red_mask = self.get_mask(hsv_frame, "red")
-    blue_mask = self.get_mask(hsv_frame, "blue")
-
-    red_mask = self.preprocess_mask(red_mask)
-    blue_mask = self.preprocess_mask(blue_mask)
-
-    red_match_percent = self.compute_match_percent(hsv_frame, self.top_roi, red_mask)
-    blue_match_percent = self.compute_match_percent(hsv_frame, self.top_roi, blue_mask)
-
-    if (red_match_percent > self.match_fraction) or (
-      blue_match_percent > self.match_fraction
-    ):
-      dominant_color = ""
-      if red_match_percent > blue_match_percent:
-        dominant_color = "red"
-      else:
-        dominant_color = "blue"
-      return True, dominant_color
-    return False, None
-
-  def query_model(self) -> Tuple[bool, Optional[str]]:
-    img_copy = self.last_received_img.copy()
-
-    results = self.yolo.predict(
-      source=self.last_received_img,
-      verbose=False,
-      stream=False,
-      conf=self.threshold,
-      device=self.device,
+  def get_top_check_status(self) -> Optional[TopCheckStatus]:
+    return self.top_check_worker.result(
+      self.get_clock().now().nanoseconds, self.max_result_age, self.result_timeout
     )
 
-    annotator = Annotator(img_copy)
-    r = results[0].boxes
-    for box in r:
-      b = box.xyxy[0]
-      c = box.cls
-      annotator.box_label(b, self.yolo.names[int(c)])
-    annotated_img = annotator.result()
-    now = time.time()
-    cv2.imwrite(os.path.join(self.debug_img_dir, str(now)), annotated_img)
-
-    results: Results = results[0].cpu()
-
-    hypothesis = self.parse_hypothesis(results)
-    boxes = self.parse_boxes(results)
-
-    is_on_top, index = self.check_on_top(boxes)
-    if index is None:
-      return (is_on_top, None)
-    return is_on_top, hypothesis[index]["class_name"]
-
-  def parse_hypothesis(self, results: Results) -> List:
-    hypothesis_list = []
-
-    for box_data in results.boxes:
-      hypothesis = {
-        "class_id": int(box_data.cls),
-        "class_name": self.yolo.names[int(box_data.cls)],
-        "score": float(box_data.conf),
-      }
-      hypothesis_list.append(hypothesis)
-
-    return hypothesis_list
-
-  def parse_boxes(self, results: Results) -> List:
-    boxes_list = []
-
-    for box_data in results.boxes:
-      box = box_data.xyxy[0]
-      boxes_list.append(box)
-
-    return boxes_list
-
-  def check_on_top(self, boxes: List[List]):
-    for i, xyxy in boxes:
-      if xyxy[1] <= 50:
-        return True, i
-    return False, None
-
-  def get_mask(self, hsv_frame: cv2.Mat, color: str) -> cv2.Mat:
-    match color:
-      case "red":
-        red1_hsv_low = np.array([self.red1_h_low, self.red1_s_low, self.red1_v_low])
-        red1_hsv_high = np.array([self.red1_h_high, self.red1_s_high, self.red1_v_high])
-
-        red2_hsv_low = np.array([self.red2_h_low, self.red2_s_low, self.red2_v_low])
-        red2_hsv_high = np.array([self.red2_h_high, self.red2_s_high, self.red2_v_high])
-
-        red1_mask = cv2.inRange(hsv_frame, red1_hsv_low, red1_hsv_high)
-        red2_mask = cv2.inRange(hsv_frame, red2_hsv_low, red2_hsv_high)
-        mask = cv2.bitwise_or(red1_mask, red2_mask)
-
-      case "blue":
-        blue1_hsv_low = np.array([self.blue1_h_low, self.blue1_s_low, self.blue1_v_low])
-        blue1_hsv_high = np.array(
-          [self.blue1_h_high, self.blue1_s_high, self.blue1_v_high]
-        )
-
-        blue2_hsv_low = np.array([self.blue2_h_low, self.blue2_s_low, self.blue2_v_low])
-        blue2_hsv_high = np.array(
-          [self.blue2_h_high, self.blue2_s_high, self.blue2_v_high]
+  def publish_top_check(self, status: TopCheckStatus):
+    exit = time.time_ns()
+    self.tracer.record(
+      "top_check", status.stamp, exit - int(status.duration * 1e9), exit
+    )
+    top_check_status = DiagnosticStatus(
+      level=DiagnosticStatus.OK,
+      name="top_check",
+      message=describe_top_check(status),
+      values=[
+        KeyValue(key="is_on_top", value=str(status.is_on_top)),
+        KeyValue(key="color", value=status.color or ""),
+        KeyValue(key="duration", value=f"{status.duration:.4f}"),
+      ],
+    )
+    msg = DiagnosticArray(status=[top_check_status])
+    msg.header.stamp = Time(nanoseconds=status.stamp).to_msg()
+    msg.header.frame_id = "picam_link_optical"
+    self.top_check_pub.publish(msg)
+
+  def get_hsv_ranges(self) -> HSVRanges:
+    def get_range(name: str) -> HSVRange:
+      return tuple(
+        tuple(
+          self.get_parameter(f"{name}_{channel}_{bound}")
+          .get_parameter_value()
+          .integer_value
+          for channel in "hsv"
         )
+        for bound in ("low", "high")
+      )
 
-        blue1_mask = cv2.inRange(hsv_frame, blue1_hsv_low, blue1_hsv_high)
-        mask = blue1_mask
-        # blue2_mask = cv2.inRange(hsv_frame, blue2_hsv_low, blue2_hsv_high)
-        # mask = cv2.bitwise_or(blue1_mask, blue2_mask)
-
-    return mask
-
-  def compute_match_percent(self, hsv_img: cv2.Mat, roi: Tuple, mask: cv2.Mat) -> float:
-    x1, y1, x2, y2 = roi
-    roi_img = hsv_img[y1:y2, x1:x2]
-    roi_mask = mask[y1:y2, x1:x2]
-
-    roi_mask = cv2.bitwise_and(roi_img, roi_img, mask=roi_mask)
-    roi_mask = cv2.cvtColor(roi_mask, cv2.COLOR_HSV2BGR)
-    roi_mask = cv2.cvtColor(roi_mask, cv2.COLOR_BGR2GRAY)
-
-    match_percent = cv2.countNonZero(roi_mask) / (roi_mask.shape[0] * roi_mask.shape[1])
-    return match_percent
-
-  def preprocess_mask(self, mask: cv2.Mat) -> cv2.Mat:
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-    processed_mask = cv2.dilate(mask, kernel, iterations=2)
-    return processed_mask
-
-  def combine_masks(self, mask1: cv2.Mat, mask2: cv2.Mat) -> cv2.Mat:
-    combined_mask = cv2.bitwise_or(mask1, mask2)
-    return combined_mask
+    # blue2 range is not used
+    return {
+      "red": [get_range("red1"), get_range("red2")],
+      "blue": [get_range("blue1")],
+    }
 
   def destroy_node(self):
+    self.is_receiving = False
+    # Closing alone does not wake a blocked accept, the port would stay bound
+    try:
+      self.server_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
     self.server_socket.close()
+    self.receive_thread.join(timeout=1.0)
+    self.top_check_worker.close()
+    if self.debug_writer is not None:
+      self.debug_writer.close()
+    self.tracer.flush()
     super().destroy_node()
 
 
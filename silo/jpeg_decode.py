@@ -0,0 +1,47 @@
+"""
+Reduced-scale decoding of JPEG frames.
+
+libjpeg can scale down by 1/2, 1/4 or 1/8 while decoding (IMREAD_REDUCED_COLOR_*),
+skipping most of the inverse DCT & color conversion work. Decoding cannot stop at a
+scanline through OpenCV, so a ROI is decoded at reduced scale & cropped instead. The
+ROI is scaled with the image, and so must be every pixel size of a check on it: the
+padding of the ROI & maximum top edge of model checks, dilation of HSV masks.
+"""
+
+from typing import Callable, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+SCALE_FLAGS = {
+  1: cv2.IMREAD_COLOR,
+  2: cv2.IMREAD_REDUCED_COLOR_2,
+  4: cv2.IMREAD_REDUCED_COLOR_4,
+  8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+def decode(data: bytes, scale: int = 1) -> np.ndarray:
+  """! BGR image of JPEG data at 1/scale of its size
+  @param scale one of SCALE_FLAGS
+  @return None if data can't be decoded
+  """
+  return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), SCALE_FLAGS[scale])
+
+
+def reduced_decoder(scale: int) -> Callable[[bytes], np.ndarray]:
+  """! Decoder of JPEG data at 1/scale of its size"""
+  if scale not in SCALE_FLAGS:
+    raise ValueError(f"Decode scale must be one of {sorted(SCALE_FLAGS)}")
+  flags = SCALE_FLAGS[scale]
+  return lambda data: cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+
+def downscale(bgr_img: np.ndarray, scale: int) -> np.ndarray:
+  """! Already decoded image at 1/scale of its size, a view without interpolation"""
+  return bgr_img if scale == 1 else bgr_img[::scale, ::scale]
+
+
+def scale_roi(roi: Sequence[int], scale: int) -> Tuple[int, ...]:
+  """! x1, y1, x2, y2 of ROI in image at 1/scale of its size"""
+  return tuple(int(v) // scale for v in roi)
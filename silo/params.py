@@ -0,0 +1,31 @@
+"""
+ROS parameter files (config/*.yaml) read outside of ROS by offline tools.
+"""
+
+from typing import Any, Dict, Sequence
+
+
+def load_params_files(paths: Sequence[str]) -> Dict[str, Any]:
+  """! Parameters of all nodes in parameter files, later files override earlier ones
+  @param paths parameter files in "node_name: ros__parameters: ..." format
+  @return parameter name -> value, nested names joined by dots as by ROS
+  """
+  import yaml
+
+  params = {}
+  for path in paths:
+    with open(path) as file:
+      content = yaml.safe_load(file) or {}
+    for node_params in content.values():
+      params.update(flatten(node_params.get("ros__parameters", {})))
+  return params
+
+
+def flatten(params: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+  flat = {}
+  for name, value in params.items():
+    if isinstance(value, dict):
+      flat.update(flatten(value, f"{prefix}{name}."))
+    else:
+      flat[f"{prefix}{name}"] = value
+  return flat
@@ -0,0 +1,134 @@
+"""
+Recent poses of the base to query the pose at any time.
+
+Poses and twists are stored in a preallocated ring buffer in order of stamp. The pose
+at a time within the history is interpolated between the two surrounding poses found
+by binary search, the pose after the latest one is extrapolated with the latest twist
+at constant velocity.
+"""
+
+from math import cos, sin
+from typing import Optional
+
+import numpy as np
+
+from silo.geometry import wrap_angle
+
+
+class PoseHistory:
+  def __init__(self, capacity: int = 256, max_extrapolation: float = 0.5):
+    """! Ring buffer of poses
+    @param capacity number of poses kept
+    @param max_extrapolation time in seconds beyond latest pose after which the pose is
+    no longer extrapolated
+    """
+    self.capacity = capacity
+    self.max_extrapolation = max_extrapolation
+    self.stamps = np.zeros(capacity)
+    # x, y, yaw w.r.t. map
+    self.poses = np.zeros((capacity, 3))
+    # vx, vy w.r.t. base & yaw rate
+    self.twists = np.zeros((capacity, 3))
+    # Physical index of oldest pose
+    self.start = 0
+    self.size = 0
+
+  def __len__(self) -> int:
+    return self.size
+
+  def append(
+    self,
+    stamp: float,
+    x: float,
+    y: float,
+    yaw: float,
+    vx: float = 0.0,
+    vy: float = 0.0,
+    yaw_rate: float = 0.0,
+  ) -> bool:
+    """! Add latest pose
+    @param stamp time of pose in seconds
+    @return False if pose is older than latest pose & was dropped
+    """
+    if self.size > 0 and stamp < self.stamps[self.__physical(self.size - 1)]:
+      return False
+
+    if self.size < self.capacity:
+      i = self.__physical(self.size)
+      self.size += 1
+    else:
+      i = self.start
+      self.start = (self.start + 1) % self.capacity
+    self.stamps[i] = stamp
+    self.poses[i] = x, y, yaw
+    self.twists[i] = vx, vy, yaw_rate
+    return True
+
+  def pose_at(
+    self, stamp: float, out: Optional[np.ndarray] = None
+  ) -> Optional[np.ndarray]:
+    """! Pose at a time
+    Pose before oldest pose is the oldest pose, pose after latest pose is extrapolated
+    up to max_extrapolation
+    @param stamp time in seconds
+    @param out optional (3,) array to write the pose into
+    @return x, y, yaw w.r.t. map, None if history is empty
+    """
+    if self.size == 0:
+      return None
+    if out is None:
+      out = np.zeros(3)
+
+    latest = self.__physical(self.size - 1)
+    if stamp >= self.stamps[latest]:
+      return self.__extrapolate(latest, stamp - self.stamps[latest], out)
+
+    oldest = self.start
+    if stamp <= self.stamps[oldest]:
+      out[:] = self.poses[oldest]
+      return out
+
+    ## Binary search for first pose after stamp
+    low, high = 0, self.size - 1
+    while low < high:
+      middle = (low + high) // 2
+      if self.stamps[self.__physical(middle)] > stamp:
+        high = middle
+      else:
+        low = middle + 1
+    after = self.__physical(low)
+    before = self.__physical(low - 1)
+
+    ratio = (stamp - self.stamps[before]) / (self.stamps[after] - self.stamps[before])
+    out[:2] = self.poses[before, :2] + ratio * (
+      self.poses[after, :2] - self.poses[before, :2]
+    )
+    out[2] = wrap_angle(
+      self.poses[before, 2]
+      + ratio * wrap_angle(self.poses[after, 2] - self.poses[before, 2])
+    )
+    return out
+
+  def latest(self, out: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """! Latest pose, None if history is empty"""
+    if self.size == 0:
+      return None
+    if out is None:
+      out = np.zeros(3)
+    out[:] = self.poses[self.__physical(self.size - 1)]
+    return out
+
+  def __physical(self, i: int) -> int:
+    return (self.start + i) % self.capacity
+
+  def __extrapolate(self, i: int, dt: float, out: np.ndarray) -> np.ndarray:
+    ## Constant twist, rotated to map at mid heading
+    dt = min(dt, self.max_extrapolation)
+    x, y, yaw = self.poses[i]
+    vx, vy, yaw_rate = self.twists[i]
+    mid_yaw = yaw + 0.5 * yaw_rate * dt
+    cos_yaw, sin_yaw = cos(mid_yaw), sin(mid_yaw)
+    out[0] = x + (vx * cos_yaw - vy * sin_yaw) * dt
+    out[1] = y + (vx * sin_yaw + vy * cos_yaw) * dt
+    out[2] = wrap_angle(yaw + yaw_rate * dt)
+    return out
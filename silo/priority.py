@@ -0,0 +1,76 @@
+"""
+Priority of silos for storing a ball, from best to worst:
+0. Team | Opponent or Opponent | Team
+1. Team | Team
+2. Opponent | Opponent
+3. Empty
+4. Team
+5. Opponent
+
+Priority of every possible stack is precomputed once for a team color, so ranking
+silos is a dictionary lookup per silo followed by a bounded heap selection.
+"""
+
+import heapq
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from silo.stacks import STACKS
+
+FULL_PRIORITY = -1
+
+# (priority, distance, silo index)
+RankedSilo = Tuple[int, float, int]
+
+
+def priority_order(team_repr: str, opponent_repr: str) -> List[List[str]]:
+  return [
+    [team_repr + opponent_repr, opponent_repr + team_repr],
+    [team_repr * 2],
+    [opponent_repr * 2],
+    [""],
+    [team_repr],
+    [opponent_repr],
+  ]
+
+
+def build_priority_table(team_repr: str, opponent_repr: str) -> Dict[str, int]:
+  """! Priority of every possible stack for a team
+  @return stack -> priority, FULL_PRIORITY for stacks where no ball can be stored
+  """
+  table = {stack: FULL_PRIORITY for stack in STACKS}
+  for priority, stacks in enumerate(priority_order(team_repr, opponent_repr)):
+    for stack in stacks:
+      table[stack] = priority
+  return table
+
+
+def rank_silos(
+  silos: Iterable[Tuple[int, str]],
+  distances: Sequence[float],
+  priority_table: Dict[str, int],
+  k: int = 2,
+  values: Optional[Sequence[float]] = None,
+) -> Tuple[List[RankedSilo], List[int]]:
+  """! Best k silos to store a ball in a single pass
+  @param silos (index, state) of silos, index starting from 1
+  @param distances distance (or cost) to each silo, indexed by silo index - 1
+  @param priority_table priority of stacks from build_priority_table
+  @param k number of silos to select
+  @param values optional value of storing a ball in each silo, ranked before priority
+  @return (priority, distance, index) of best silos in ranked order & indexes of full silos
+  """
+  candidates = []
+  full_silos = []
+  for index, state in silos:
+    priority = priority_table.get(state, FULL_PRIORITY)
+    if priority == FULL_PRIORITY:
+      full_silos.append(index)
+      continue
+    candidates.append((priority, distances[index - 1], index))
+
+  if values is not None:
+    ranked = heapq.nsmallest(
+      k, candidates, key=lambda candidate: (-values[candidate[2] - 1], candidate)
+    )
+    return ranked, full_silos
+  return heapq.nsmallest(k, candidates), full_silos
@@ -0,0 +1,317 @@
+"""
+On-demand profiling of node callbacks.
+
+Profiling is enabled by the SILO_PROFILE environment variable or the profile parameter
+of a node, as a comma separated list of modes:
+- wall -> count, total & maximum wall time of every callback
+- cprofile -> cProfile of callbacks during a window of every period, stats of each
+  window are dumped to a .prof file (snakeviz, pstats)
+- tracemalloc -> snapshot of allocations every period, differences from the previous
+  snapshot are dumped to a .alloc.txt file. Tracing is process wide, it is shared by
+  the profilers of composed nodes and stops when the last of them closes
+
+Files are rotated in the profile directory, only the most recent ones are kept. When
+disabled, callbacks are left untouched so profiling costs nothing.
+"""
+
+import cProfile
+import glob
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Set
+
+MODES = ("wall", "cprofile", "tracemalloc")
+ENV_VAR = "SILO_PROFILE"
+
+
+def parse_modes(spec: str) -> Set[str]:
+  """! Modes of a comma separated list, "all" for every mode"""
+  modes = {mode.strip().lower() for mode in spec.split(",") if mode.strip()}
+  if "all" in modes:
+    return set(MODES)
+  unknown = modes - set(MODES)
+  if unknown:
+    raise ValueError(f"Unknown profile modes {sorted(unknown)}, expected {MODES}")
+  return modes
+
+
+class WallCounter:
+  __slots__ = ("count", "total", "max")
+
+  def __init__(self):
+    self.count = 0
+    self.total = 0.0
+    self.max = 0.0
+
+  def add(self, duration: float):
+    self.count += 1
+    self.total += duration
+    if duration > self.max:
+      self.max = duration
+
+
+class SharedTracemalloc:
+  def __init__(self):
+    """! Process wide tracemalloc, traced while any profiler uses it"""
+    self.lock = threading.Lock()
+    self.users = 0
+    # Tracing started outside of profilers (PYTHONTRACEMALLOC) is never stopped
+    self.is_owned = False
+
+  def acquire(self):
+    with self.lock:
+      if self.users == 0 and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        self.is_owned = True
+      self.users += 1
+
+  def release(self):
+    with self.lock:
+      self.users -= 1
+      if self.users == 0 and self.is_owned:
+        self.is_owned = False
+        if tracemalloc.is_tracing():
+          tracemalloc.stop()
+
+
+SHARED_TRACEMALLOC = SharedTracemalloc()
+
+
+class CallbackProfiler:
+  def __init__(
+    self,
+    modes: Set[str],
+    directory: str,
+    prefix: str = "node",
+    window: float = 5.0,
+    period: float = 60.0,
+    keep: int = 5,
+    top: int = 20,
+  ):
+    """! Profiler of wrapped callbacks
+    @param modes subset of MODES
+    @param directory directory of rotated profile files
+    @param prefix prefix of profile files, e.g. name of node
+    @param window seconds of each cProfile window
+    @param period seconds between starts of cProfile windows & tracemalloc snapshots
+    @param keep number of most recent files kept per mode
+    @param top number of entries in summaries of cProfile & tracemalloc
+    """
+    self.modes = modes
+    self.directory = os.path.expanduser(directory)
+    os.makedirs(self.directory, exist_ok=True)
+    self.prefix = prefix
+    self.window = window
+    self.period = period
+    self.keep = keep
+    self.top = top
+
+    self.lock = threading.Lock()
+    self.counters: Dict[str, WallCounter] = {}
+    self.last_profile = ""
+    self.last_allocations = ""
+
+    now = time.monotonic()
+    # cProfile profiles one callback at a time, concurrent callbacks are skipped
+    self.profile_lock = threading.Lock()
+    self.profile: Optional[cProfile.Profile] = None
+    self.window_end = now + window
+    self.next_window = now
+    self.snapshot = None
+    self.next_snapshot = now + period
+    self.is_tracing = "tracemalloc" in modes
+    if self.is_tracing:
+      SHARED_TRACEMALLOC.acquire()
+      self.snapshot = tracemalloc.take_snapshot()
+
+  def wrap(self, name: str, callback: Callable) -> Callable:
+    """! Callback profiled under name"""
+    counter = self.counters.setdefault(name, WallCounter())
+    is_wall = "wall" in self.modes
+    is_cprofile = "cprofile" in self.modes
+    is_tracemalloc = "tracemalloc" in self.modes
+
+    def profiled(*args, **kwargs):
+      profile = self.__begin_profile() if is_cprofile else None
+      start = time.perf_counter()
+      try:
+        return callback(*args, **kwargs)
+      finally:
+        duration = time.perf_counter() - start
+        if profile is not None:
+          profile.disable()
+          self.profile_lock.release()
+        if is_wall:
+          with self.lock:
+            counter.add(duration)
+        if is_cprofile:
+          self.__end_window()
+        if is_tracemalloc:
+          self.__take_snapshot()
+
+    profiled.__wrapped__ = callback
+    return profiled
+
+  def __begin_profile(self) -> Optional[cProfile.Profile]:
+    now = time.monotonic()
+    if now < self.next_window or not self.profile_lock.acquire(blocking=False):
+      return None
+    if self.profile is None:
+      self.profile = cProfile.Profile()
+      self.window_end = now + self.window
+    self.profile.enable()
+    return self.profile
+
+  def __end_window(self):
+    if self.profile is None or time.monotonic() < self.window_end:
+      return
+    if not self.profile_lock.acquire(blocking=False):
+      return
+    try:
+      if self.profile is None:
+        return
+      profile, self.profile = self.profile, None
+      self.next_window = self.window_end - self.window + self.period
+    finally:
+      self.profile_lock.release()
+
+    profile.dump_stats(self.__rotate("prof"))
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(self.top)
+    with self.lock:
+      self.last_profile = stream.getvalue()
+
+  def __take_snapshot(self):
+    with self.lock:
+      # Callbacks may still run after close
+      if not self.is_tracing or not tracemalloc.is_tracing():
+        return
+      now = time.monotonic()
+      if now < self.next_snapshot:
+        return
+      self.next_snapshot = now + self.period
+      previous = self.snapshot
+    try:
+      snapshot = tracemalloc.take_snapshot()
+    # Tracing stopped since the check, by close of the last profiler
+    except RuntimeError:
+      return
+    differences = snapshot.compare_to(previous, "lineno")[: self.top]
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Traced {current / 1e6:.2f} MB, peak {peak / 1e6:.2f} MB"]
+    lines.extend(str(difference) for difference in differences)
+    text = "\n".join(lines)
+    with open(self.__rotate("alloc.txt"), "w") as f:
+      f.write(text + "\n")
+    with self.lock:
+      self.snapshot = snapshot
+      self.last_allocations = text
+
+  def __rotate(self, extension: str) -> str:
+    """! Path of a new file, oldest files beyond keep are removed"""
+    pattern = os.path.join(self.directory, f"{self.prefix}_*.{extension}")
+    paths = sorted(glob.glob(pattern))
+    for path in paths[: max(0, len(paths) - self.keep + 1)]:
+      os.remove(path)
+    name = f"{self.prefix}_{time.strftime('%Y%m%d_%H%M%S')}_{time.time_ns()}"
+    return os.path.join(self.directory, f"{name}.{extension}")
+
+  def wall_summary(self) -> List[str]:
+    with self.lock:
+      counters = sorted(
+        self.counters.items(), key=lambda item: item[1].total, reverse=True
+      )
+      return [
+        f"{name}: {c.count} calls, {1e3 * c.total / c.count:.3f} ms mean,"
+        f" {1e3 * c.max:.3f} ms max, {c.total:.3f} s total"
+        for name, c in counters
+        if c.count
+      ]
+
+  def summary(self) -> str:
+    sections = [f"Profile modes: {', '.join(sorted(self.modes))}"]
+    if "wall" in self.modes:
+      sections.append("\n".join(["Wall time of callbacks:"] + self.wall_summary()))
+    with self.lock:
+      if self.last_profile:
+        sections.append("Last cProfile window:\n" + self.last_profile)
+      if self.last_allocations:
+        sections.append("Last tracemalloc difference:\n" + self.last_allocations)
+    return "\n\n".join(sections)
+
+  def close(self):
+    """! Dump wall counters, stop tracing allocations"""
+    if "wall" in self.modes:
+      with open(self.__rotate("wall.txt"), "w") as f:
+        f.write("\n".join(self.wall_summary()) + "\n")
+    with self.lock:
+      is_tracing, self.is_tracing = self.is_tracing, False
+    if is_tracing:
+      SHARED_TRACEMALLOC.release()
+
+
+def callback_name(entity) -> str:
+  """! Name of subscription (topic), service (name) or timer (callback) of a node"""
+  for attribute in ("topic_name", "srv_name"):
+    name = getattr(entity, attribute, None)
+    if isinstance(name, str) and name:
+      return name
+  return getattr(entity.callback, "__qualname__", repr(entity.callback))
+
+
+def attach_profiler(node) -> Optional[CallbackProfiler]:
+  """! Profile callbacks of subscriptions, timers & services of a node
+  Modes are read from profile parameter, or SILO_PROFILE if it is empty. A summary is
+  served by ~/profile_summary (std_srvs/Trigger) and files are closed at shutdown.
+  Callbacks created later are not profiled, call after the node is constructed.
+  Only the profile parameter is declared while disabled, its other parameters are
+  declared once enabled. Nodes with a set parameters callback must accept them.
+  @return None if profiling is disabled
+  """
+  node.declare_parameter("profile", "")
+  spec = node.get_parameter("profile").get_parameter_value().string_value
+  spec = spec or os.environ.get(ENV_VAR, "")
+  if not spec:
+    return None
+  try:
+    modes = parse_modes(spec)
+  except ValueError as e:
+    node.get_logger().error(f"Profiling disabled: {e}")
+    return None
+
+  node.declare_parameter("profile_dir", "~/.ros/profile")
+  # cProfile window of every period (seconds), also period of tracemalloc snapshots
+  node.declare_parameter("profile_window", 5.0)
+  node.declare_parameter("profile_period", 60.0)
+  node.declare_parameter("profile_keep", 5)
+  profiler = CallbackProfiler(
+    modes,
+    node.get_parameter("profile_dir").get_parameter_value().string_value,
+    prefix=node.get_name(),
+    window=node.get_parameter("profile_window").get_parameter_value().double_value,
+    period=node.get_parameter("profile_period").get_parameter_value().double_value,
+    keep=node.get_parameter("profile_keep").get_parameter_value().integer_value,
+  )
+  for entity in [*node.subscriptions, *node.timers, *node.services]:
+    entity.callback = profiler.wrap(callback_name(entity), entity.callback)
+
+  from std_srvs.srv import Trigger
+
+  def serve_summary(request, response):
+    response.success = True
+    response.message = profiler.summary()
+    return response
+
+  node.context.on_shutdown(profiler.close)
+  # Created after wrapping, summaries are not profiled
+  node.profile_summary_srv = node.create_service(
+    Trigger, "~/profile_summary", serve_summary
+  )
+  node.get_logger().info(
+    f"Profiling {', '.join(sorted(modes))} of callbacks to {profiler.directory}"
+  )
+  return profiler
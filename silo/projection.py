@@ -0,0 +1,157 @@
+"""
+Projection of the known silo cylinders into the image for a given map -> base_link
+pose, used to assign detected silo bboxes to absolute silo indices when less than
+5 silos are visible.
+"""
+
+from collections import OrderedDict
+from math import cos, pi, radians, sin
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from silo.geometry import rotation_from_ypr
+
+
+class SiloProjector:
+  def __init__(
+    self,
+    silos_xy: Sequence[Tuple[float, float]],
+    silo_z_min: float,
+    silo_z_max: float,
+    silo_radius: float,
+    translation_base2cam: Sequence[float],
+    ypr_base2cam: Sequence[float],
+    camera_matrix: Sequence[float],
+    image_size: Tuple[int, int],
+    position_resolution: float = 0.05,
+    yaw_resolution: float = 2.0,
+    cache_size: int = 512,
+    samples: int = 8,
+  ):
+    """! Silo projector
+    @param silos_xy x, y of silos w.r.t. map, in absolute index order
+    @param translation_base2cam camera optical frame translation w.r.t. base_link
+    @param ypr_base2cam camera optical frame yaw, pitch, roll (degrees) w.r.t. base_link
+    @param camera_matrix row major 3x3 intrinsics (K)
+    @param image_size width, height of image
+    @param position_resolution pose bucket size in meters
+    @param yaw_resolution pose bucket size of heading in degrees
+    """
+    self.__width, self.__height = image_size
+    self.__position_resolution = position_resolution
+    self.__yaw_resolution = radians(yaw_resolution)
+    self.__cache_size = cache_size
+    self.__cache = OrderedDict()
+    self.__min_depth = 0.05
+
+    k = np.asarray(camera_matrix, dtype=float).reshape(3, 3)
+    self.__fx, self.__fy = k[0, 0], k[1, 1]
+    self.__cx, self.__cy = k[0, 2], k[1, 2]
+
+    # base_link -> camera optical: p_base = R @ p_cam + t
+    self.__r_base2cam = rotation_from_ypr(ypr_base2cam, degrees=True)
+    self.__t_base2cam = np.asarray(translation_base2cam, dtype=float)
+
+    ## Sample silo cylinders as rings of points at bottom and top
+    angles = np.linspace(0.0, 2 * pi, samples, endpoint=False)
+    ring = np.stack(
+      [silo_radius * np.cos(angles), silo_radius * np.sin(angles)], axis=-1
+    )
+    silos_xy = np.asarray(silos_xy, dtype=float)
+    points = np.empty((len(silos_xy), 2 * samples, 3))
+    for i, z in enumerate((silo_z_min, silo_z_max)):
+      points[:, i * samples : (i + 1) * samples, :2] = silos_xy[:, None, :] + ring
+      points[:, i * samples : (i + 1) * samples, 2] = z
+    # Points w.r.t. map, shape: (silos * points, 3)
+    self.__silo_points = points.reshape(-1, 3)
+    self.__silos_num = len(silos_xy)
+    self.__points_per_silo = 2 * samples
+
+  def project(self, x: float, y: float, yaw: float) -> Tuple[np.ndarray, np.ndarray]:
+    """! Projected silo bboxes for a map -> base_link pose (cached per pose bucket)
+    @param x, y position of base_link w.r.t. map
+    @param yaw heading of base_link w.r.t. map in radians
+    @return (silos, 4) XYXY bboxes clipped to image & (silos,) visibility mask
+    """
+    key = (
+      round(x / self.__position_resolution),
+      round(y / self.__position_resolution),
+      round(yaw / self.__yaw_resolution) % round(2 * pi / self.__yaw_resolution),
+    )
+    cached = self.__cache.get(key)
+    if cached is not None:
+      self.__cache.move_to_end(key)
+      return cached
+
+    projection = self.__project(
+      key[0] * self.__position_resolution,
+      key[1] * self.__position_resolution,
+      key[2] * self.__yaw_resolution,
+    )
+    self.__cache[key] = projection
+    if len(self.__cache) > self.__cache_size:
+      self.__cache.popitem(last=False)
+    return projection
+
+  def __project(self, x: float, y: float, yaw: float) -> Tuple[np.ndarray, np.ndarray]:
+    c, s = cos(yaw), sin(yaw)
+    r_map2base = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+    # p_cam = R_bc^T @ (R_mb^T @ (p_map - t_mb) - t_bc)
+    points_base = (self.__silo_points - np.array([x, y, 0.0])) @ r_map2base
+    points_cam = (points_base - self.__t_base2cam) @ self.__r_base2cam
+    points_cam = points_cam.reshape(self.__silos_num, self.__points_per_silo, 3)
+
+    depth = points_cam[..., 2]
+    in_front = np.all(depth > self.__min_depth, axis=1)
+    depth = np.where(depth > self.__min_depth, depth, 1.0)
+    u = self.__fx * points_cam[..., 0] / depth + self.__cx
+    v = self.__fy * points_cam[..., 1] / depth + self.__cy
+
+    bboxes = np.stack([u.min(axis=1), v.min(axis=1), u.max(axis=1), v.max(axis=1)], -1)
+    bboxes[:, [0, 2]] = bboxes[:, [0, 2]].clip(0, self.__width)
+    bboxes[:, [1, 3]] = bboxes[:, [1, 3]].clip(0, self.__height)
+    visible = in_front & (bboxes[:, 2] > bboxes[:, 0]) & (bboxes[:, 3] > bboxes[:, 1])
+    return bboxes, visible
+
+  def assign(
+    self, bboxes_xyxy: np.ndarray, x: float, y: float, yaw: float, min_iou: float = 0.3
+  ) -> np.ndarray:
+    """! Assign detected silo bboxes to absolute silo indices
+    @param bboxes_xyxy (N, 4) detected silo bboxes in XYXY format
+    @param min_iou minimum IoU with projected silo for a match
+    @return (N,) absolute silo indices starting from 1, 0 if unassigned
+    """
+    projected, visible = self.project(x, y, yaw)
+    detected = np.asarray(bboxes_xyxy, dtype=float).reshape(-1, 4)
+    iou = bbox_iou(detected, projected)
+    iou[:, ~visible] = 0.0
+
+    ## Greedy matching in descending order of IoU
+    indexes = np.zeros(len(detected), dtype=int)
+    taken = np.zeros(len(projected), dtype=bool)
+    for flat in np.argsort(-iou, axis=None):
+      det, silo = divmod(int(flat), len(projected))
+      if iou[det, silo] < min_iou:
+        break
+      if indexes[det] != 0 or taken[silo]:
+        continue
+      indexes[det] = silo + 1
+      taken[silo] = True
+    return indexes
+
+
+def bbox_iou(bboxes_a: np.ndarray, bboxes_b: np.ndarray) -> np.ndarray:
+  """! Pairwise IoU of two sets of XYXY bboxes
+  @return (len(bboxes_a), len(bboxes_b)) IoU matrix
+  """
+  a = bboxes_a[:, None, :]
+  b = bboxes_b[None, :, :]
+  inter_w = np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])
+  inter_h = np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])
+  intersection = inter_w.clip(0) * inter_h.clip(0)
+  area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+  area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+  union = area_a + area_b - intersection
+  return np.where(union > 0, intersection / np.where(union > 0, union, 1.0), 0.0)
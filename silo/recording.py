@@ -0,0 +1,313 @@
+"""
+Append-only recording of serialized messages.
+
+A recording is a directory holding:
+- chunk_*.rec -> large append-only files of message payloads back to back, a new chunk
+  is started once a chunk reaches the chunk size
+- index.idx -> one fixed size entry per message (channel, stamp, chunk, offset, size,
+  CRC) appended in order of writing and memory-mapped for reading
+- channels.json -> name & message type of each channel
+
+The reader sorts each channel by stamp once, so seeking to a time is a binary search,
+and yields bundles of the messages of several channels nearest to each message of a
+reference channel.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import threading
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+VERSION = 1
+CHANNELS_FILE = "channels.json"
+INDEX_FILE = "index.idx"
+CHUNK_FORMAT = "chunk_{:05d}.rec"
+
+INDEX_DTYPE = np.dtype(
+  [
+    ("stamp", "<i8"),
+    ("channel", "<u2"),
+    ("reserved", "u1", (2,)),
+    ("chunk", "<u4"),
+    ("offset", "<u8"),
+    ("size", "<u4"),
+    ("crc", "<u4"),
+  ]
+)
+
+
+class Channel(NamedTuple):
+  id: int
+  name: str
+  type: str
+
+
+class Bundle(NamedTuple):
+  # Stamp of message of reference channel in nanoseconds
+  stamp: int
+  # Channel name -> (stamp, payload) of nearest message, None if none within tolerance
+  messages: Dict[str, Optional[Tuple[int, bytes]]]
+
+
+class RecordingWriter:
+  def __init__(
+    self, directory: str, chunk_size: int = 256 * 2**20, buffer_size: int = 2**20
+  ):
+    """! Create recording or append to an existing one
+    @param directory directory of recording
+    @param chunk_size size in bytes after which a new chunk is started
+    @param buffer_size size of write buffers in bytes, larger means fewer syscalls
+    """
+    self.directory = os.path.expanduser(directory)
+    os.makedirs(self.directory, exist_ok=True)
+    self.chunk_size = chunk_size
+    self.buffer_size = buffer_size
+    self.lock = threading.Lock()
+
+    self.channels: Dict[str, Channel] = {}
+    channels_path = os.path.join(self.directory, CHANNELS_FILE)
+    if os.path.exists(channels_path):
+      for channel in _load_channels(channels_path):
+        self.channels[channel.name] = channel
+
+    # Appending always starts a new chunk, existing chunks are never modified
+    self.chunk = len(_chunk_paths(self.directory))
+    self.chunk_file = None
+    self.offset = 0
+    self.index_file = open(
+      os.path.join(self.directory, INDEX_FILE), "ab", buffering=buffer_size
+    )
+    self.__open_chunk()
+
+  def add_channel(self, name: str, type_name: str) -> Channel:
+    """! Register channel or get the existing one
+    @param type_name message type such as "sensor_msgs/msg/Image"
+    """
+    with self.lock:
+      if name in self.channels:
+        return self.channels[name]
+      channel = Channel(len(self.channels), name, type_name)
+      self.channels[name] = channel
+      self.__save_channels()
+      return channel
+
+  def write(self, channel: str, stamp: int, data: bytes):
+    """! Append payload of a message
+    @param channel name of registered channel
+    @param stamp timestamp in nanoseconds
+    """
+    with self.lock:
+      if self.offset > 0 and self.offset + len(data) > self.chunk_size:
+        self.chunk_file.close()
+        self.chunk += 1
+        self.__open_chunk()
+
+      self.chunk_file.write(data)
+      entry = np.zeros(1, dtype=INDEX_DTYPE)
+      entry["stamp"] = stamp
+      entry["channel"] = self.channels[channel].id
+      entry["chunk"] = self.chunk
+      entry["offset"] = self.offset
+      entry["size"] = len(data)
+      entry["crc"] = zlib.crc32(data)
+      self.index_file.write(entry.tobytes())
+      self.offset += len(data)
+
+  def flush(self):
+    """! Write buffers to disk, payloads before index entries"""
+    with self.lock:
+      self.chunk_file.flush()
+      self.index_file.flush()
+
+  def close(self):
+    with self.lock:
+      self.chunk_file.close()
+      self.index_file.close()
+
+  def __open_chunk(self):
+    path = os.path.join(self.directory, CHUNK_FORMAT.format(self.chunk))
+    self.chunk_file = open(path, "ab", buffering=self.buffer_size)
+    self.offset = self.chunk_file.tell()
+
+  def __save_channels(self):
+    path = os.path.join(self.directory, CHANNELS_FILE)
+    channels = sorted(self.channels.values())
+    with open(path + ".tmp", "w") as f:
+      json.dump(
+        {
+          "version": VERSION,
+          "channels": [{"name": c.name, "type": c.type} for c in channels],
+        },
+        f,
+        indent=2,
+      )
+    os.replace(path + ".tmp", path)
+
+
+class RecordingReader:
+  def __init__(self, directory: str):
+    """! Open recording for reading
+    Index entries of payloads missing from chunks (e.g. after a crash) are ignored
+    """
+    self.directory = os.path.expanduser(directory)
+    self.channels: Dict[str, Channel] = {
+      channel.name: channel
+      for channel in _load_channels(os.path.join(self.directory, CHANNELS_FILE))
+    }
+
+    ## Memory map chunks & index
+    self.chunks: List[Optional[mmap.mmap]] = []
+    for path in _chunk_paths(self.directory):
+      with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        self.chunks.append(
+          mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+        )
+    index_path = os.path.join(self.directory, INDEX_FILE)
+    entries = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+    if entries > 0:
+      self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r", shape=(entries,))
+    else:
+      self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    chunk_sizes = np.array([len(chunk) if chunk else 0 for chunk in self.chunks])
+    chunk_sizes = np.append(chunk_sizes, 0)
+    chunks = np.minimum(self.index["chunk"], len(self.chunks))
+    is_complete = self.index["offset"] + self.index["size"] <= chunk_sizes[chunks]
+
+    ## Entries of each channel sorted by stamp
+    self.entries: Dict[str, np.ndarray] = {}
+    self.stamps: Dict[str, np.ndarray] = {}
+    for name, channel in self.channels.items():
+      entries = np.flatnonzero((self.index["channel"] == channel.id) & is_complete)
+      entries = entries[np.argsort(self.index["stamp"][entries], kind="stable")]
+      self.entries[name] = entries
+      self.stamps[name] = np.asarray(self.index["stamp"][entries])
+
+  def __len__(self) -> int:
+    return len(self.index)
+
+  def count(self, channel: str) -> int:
+    return len(self.entries[channel])
+
+  def time_range(self) -> Tuple[int, int]:
+    """! First & last stamp in nanoseconds over all channels"""
+    stamps = [stamps for stamps in self.stamps.values() if len(stamps)]
+    if not stamps:
+      return 0, 0
+    return int(min(s[0] for s in stamps)), int(max(s[-1] for s in stamps))
+
+  def seek(self, channel: str, stamp: int) -> int:
+    """! Position in channel of first message at or after stamp"""
+    return int(np.searchsorted(self.stamps[channel], stamp, side="left"))
+
+  def read(
+    self, channel: str, position: int, verify: bool = False
+  ) -> Tuple[int, bytes]:
+    """! Message at position of channel in order of stamp
+    @return stamp in nanoseconds & payload
+    """
+    entry = self.index[self.entries[channel][position]]
+    offset = int(entry["offset"])
+    data = self.chunks[entry["chunk"]][offset : offset + int(entry["size"])]
+    if verify and zlib.crc32(data) != entry["crc"]:
+      raise ValueError(f"Corrupted message {position} of {channel}")
+    return int(entry["stamp"]), data
+
+  def messages(
+    self, channel: str, start: Optional[int] = None, end: Optional[int] = None
+  ) -> Iterator[Tuple[int, bytes]]:
+    """! Messages of channel in order of stamp within [start, end)"""
+    first = 0 if start is None else self.seek(channel, start)
+    last = self.count(channel) if end is None else self.seek(channel, end)
+    for position in range(first, last):
+      yield self.read(channel, position)
+
+  def nearest(self, channel: str, stamp: int, tolerance: int) -> Optional[int]:
+    """! Position of message of channel nearest to stamp, None if beyond tolerance"""
+    stamps = self.stamps[channel]
+    position = int(np.searchsorted(stamps, stamp))
+    candidates = [p for p in (position - 1, position) if 0 <= p < len(stamps)]
+    if not candidates:
+      return None
+    best = min(candidates, key=lambda p: abs(int(stamps[p]) - stamp))
+    if abs(int(stamps[best]) - stamp) > tolerance:
+      return None
+    return best
+
+  def bundles(
+    self,
+    reference: str,
+    channels: Sequence[str],
+    tolerance: int = 50_000_000,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+  ) -> Iterator[Bundle]:
+    """! Time-aligned messages
+    @param reference channel whose every message starts a bundle
+    @param channels other channels to align to reference
+    @param tolerance maximum difference of stamps in nanoseconds
+    """
+    for stamp, data in self.messages(reference, start, end):
+      messages = {reference: (stamp, data)}
+      for channel in channels:
+        position = self.nearest(channel, stamp, tolerance)
+        messages[channel] = None if position is None else self.read(channel, position)
+      yield Bundle(stamp, messages)
+
+  def deserialize(self, channel: str, data: bytes):
+    """! ROS message from payload, requires a sourced ROS environment"""
+    from rclpy.serialization import deserialize_message
+    from rosidl_runtime_py.utilities import get_message
+
+    return deserialize_message(data, get_message(self.channels[channel].type))
+
+  def close(self):
+    for chunk in self.chunks:
+      if chunk is not None:
+        chunk.close()
+    self.chunks = []
+
+
+def _load_channels(path: str) -> List[Channel]:
+  with open(path) as f:
+    content = json.load(f)
+  if content.get("version") != VERSION:
+    raise ValueError(f"{path} is not a recording of version {VERSION}")
+  return [
+    Channel(i, channel["name"], channel["type"])
+    for i, channel in enumerate(content["channels"])
+  ]
+
+
+def _chunk_paths(directory: str) -> List[str]:
+  paths = []
+  while os.path.exists(os.path.join(directory, CHUNK_FORMAT.format(len(paths)))):
+    paths.append(os.path.join(directory, CHUNK_FORMAT.format(len(paths))))
+  return paths
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Inspect recording")
+  parser.add_argument("directory", help="directory of recording")
+  parser.add_argument("--verify", action="store_true", help="check CRC of messages")
+  args = parser.parse_args(args)
+
+  reader = RecordingReader(args.directory)
+  first, last = reader.time_range()
+  print(f"Messages: {len(reader)} | Duration: {(last - first) / 1e9:.1f}s")
+  for name, channel in reader.channels.items():
+    print(f"  {name} [{channel.type}] -> {reader.count(name)} messages")
+    if args.verify:
+      for position in range(reader.count(name)):
+        reader.read(name, position, verify=True)
+  reader.close()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,391 @@
+"""
+Offline replay of recorded frames through the estimation pipeline, without a ROS graph
+and as fast as possible.
+
+A source is either:
+- a recording of capture_node (silo.recording) -> detections from yolo/tracking, frames
+  from image_raw & poses from /odometry/filtered, deserializing needs a sourced ROS
+  environment
+- a folder of JPEG frames named {sec}_{nanosec}.jpg -> detections by a YOLOv8 model
+
+Every frame goes through the stages of the nodes: decode, detect (JPEG folders only),
+estimate (StateEstimation), hsv (StateEstimationHSV, optional), track
+(AbsoluteStateEstimation) & select (SiloSelection). The report holds per-stage time,
+frames per second and the confirmation latency, i.e. the time from the first frame of
+a new observed state to the frame where the absolute state is confirmed.
+Several sources are replayed in parallel across a process pool.
+"""
+
+import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from silo.absolute_state import AbsoluteStateTracker, Pose
+from silo.consistency import StateConsistency, max_new_balls
+from silo.estimation import Detection, DetectionStateEstimator, detections_from_msgs
+from silo.geometry import optical_axis_heading, yaw_from_quaternion
+from silo.params import load_params_files
+from silo.projection import SiloProjector
+from silo.selection import SiloSelector
+from silo.travel_cost import TravelCost
+
+STAGES = ("decode", "detect", "estimate", "hsv", "track", "select")
+PROJECTION_PARAMS = (
+  "silos_x",
+  "silo_y",
+  "silo_z_min",
+  "silo_z_max",
+  "silo_radius",
+  "base2cam_optical.translation",
+  "base2cam_optical.ypr",
+  "k",
+)
+
+
+@dataclass
+class ReplayConfig:
+  team_color: str = "blue"
+  width: int = 921
+  height: int = 518
+  consistency_threshold: int = 5
+  min_silo_area: int = 1500
+  y_divisions: Sequence[float] = (-0.10, 0.20, 0.60, 0.95)
+  min_projection_iou: float = 0.3
+  # Maximum new balls between confirmed states, 0 for no limit
+  max_new_balls: int = 0
+  # Run HSV estimation on decoded frames as well
+  hsv: bool = False
+  # YOLOv8 weights for folders of JPEG frames
+  model: str = ""
+  # Parameters of config/*.yaml such as silo & camera geometry
+  params: Dict = field(default_factory=dict)
+
+
+class Frame(NamedTuple):
+  # Stamp in nanoseconds
+  stamp: int
+  detections: Optional[List[Detection]]
+  # Encoded image, None if not available
+  image: Optional[bytes]
+  pose: Optional[Pose]
+
+
+class ReplayResult(NamedTuple):
+  source: str
+  frames: int
+  wall_time: float
+  # Stage -> time of each frame in seconds
+  stage_times: Dict[str, List[float]]
+  # Confirmation latency of each change of absolute state in seconds
+  latencies: List[float]
+  # Absolute state after each change
+  states: List[List[str]]
+
+
+class StageTimer:
+  def __init__(self):
+    self.times: Dict[str, List[float]] = defaultdict(list)
+    self.stage = ""
+    self.start = 0.0
+
+  def __call__(self, stage: str) -> "StageTimer":
+    self.stage = stage
+    return self
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+
+  def __exit__(self, *_):
+    self.times[self.stage].append(time.perf_counter() - self.start)
+
+
+def recording_frames(
+  directory: str, timer: StageTimer, with_images: bool
+) -> Iterator[Frame]:
+  """! Frames of a recording of capture_node, one per detections message"""
+  from silo.recording import RecordingReader
+
+  reader = RecordingReader(directory)
+  channels = ["/odometry/filtered"] + (["image_raw"] if with_images else [])
+  for bundle in reader.bundles("yolo/tracking", channels):
+    with timer("decode"):
+      _, data = bundle.messages["yolo/tracking"]
+      detections = detections_from_msgs(
+        reader.deserialize("yolo/tracking", data).detections
+      )
+      pose = None
+      if bundle.messages["/odometry/filtered"] is not None:
+        _, data = bundle.messages["/odometry/filtered"]
+        pose_msg = reader.deserialize("/odometry/filtered", data).pose.pose
+        orientation = pose_msg.orientation
+        pose = (
+          pose_msg.position.x,
+          pose_msg.position.y,
+          yaw_from_quaternion(
+            orientation.x, orientation.y, orientation.z, orientation.w
+          ),
+        )
+      image = None
+      if with_images and bundle.messages["image_raw"] is not None:
+        _, data = bundle.messages["image_raw"]
+        image = bytes(reader.deserialize("image_raw", data).data)
+    yield Frame(bundle.stamp, detections, image, pose)
+  reader.close()
+
+
+def folder_frames(directory: str) -> Iterator[Frame]:
+  """! Frames of a folder of JPEG files named {sec}_{nanosec}.jpg, in order of stamp"""
+  frames = []
+  for name in os.listdir(directory):
+    stem, extension = os.path.splitext(name)
+    sec, _, nanosec = stem.partition("_")
+    if extension.lower() != ".jpg" or not (sec.isdigit() and nanosec.isdigit()):
+      continue
+    frames.append((int(sec) * 10**9 + int(nanosec), os.path.join(directory, name)))
+  for stamp, path in sorted(frames):
+    with open(path, "rb") as file:
+      yield Frame(stamp, None, file.read(), None)
+
+
+class YoloDetector:
+  def __init__(self, model_path: str):
+    # Heavy import only when frames need to be detected
+    from ultralytics import YOLO
+
+    self.model = YOLO(model_path)
+
+  def __call__(self, bgr_img: np.ndarray) -> List[Detection]:
+    result = self.model(bgr_img, verbose=False)[0]
+    return [
+      Detection(result.names[int(cls)], *map(float, xywh))
+      for xywh, cls in zip(result.boxes.xywh.tolist(), result.boxes.cls.tolist())
+    ]
+
+
+def create_projector(config: ReplayConfig) -> Optional[SiloProjector]:
+  params = config.params
+  if any(key not in params for key in PROJECTION_PARAMS):
+    return None
+  silo_y = params["silo_y"] if config.team_color == "blue" else -params["silo_y"]
+  return SiloProjector(
+    silos_xy=[(x, silo_y) for x in params["silos_x"]],
+    silo_z_min=params["silo_z_min"],
+    silo_z_max=params["silo_z_max"],
+    silo_radius=params["silo_radius"],
+    translation_base2cam=params["base2cam_optical.translation"],
+    ypr_base2cam=params["base2cam_optical.ypr"],
+    camera_matrix=params["k"],
+    image_size=(config.width, config.height),
+  )
+
+
+def create_travel_cost(config: ReplayConfig) -> TravelCost:
+  params = config.params
+  silo_y = params.get("silo_y", 0.0)
+  if config.team_color != "blue":
+    silo_y = -silo_y
+  return TravelCost(
+    np.array([(x, silo_y) for x in params.get("silos_x", [0.0] * 5)]),
+    params.get("approach_standoff", 0.5),
+    params.get("linear_speed", 1.5),
+    params.get("angular_speed", 2.0),
+    camera_heading=optical_axis_heading(
+      params.get("base2cam_optical.ypr", [0.0, 0.0, 0.0])
+    ),
+  )
+
+
+def replay(source: str, config: ReplayConfig) -> ReplayResult:
+  """! Replay a recording or a folder of JPEG frames"""
+  team_repr = "B" if config.team_color == "blue" else "R"
+  opponent_repr = "R" if team_repr == "B" else "B"
+  timer = StageTimer()
+
+  detector = None
+  if os.path.isfile(os.path.join(source, "channels.json")):
+    frames = recording_frames(source, timer, with_images=config.hsv)
+  else:
+    if not config.model:
+      raise ValueError(f"{source} is a folder of frames, a YOLOv8 model is required")
+    frames = folder_frames(source)
+    detector = YoloDetector(config.model)
+  if config.hsv or detector is not None:
+    import cv2
+
+  estimator = DetectionStateEstimator(config.team_color, config.width, config.height)
+  hsv_estimator = None
+  if config.hsv:
+    from silo.hsv_estimation import HSVStateEstimator
+
+    hsv_estimator = HSVStateEstimator(
+      config.team_color, config.min_silo_area, config.y_divisions
+    )
+  # Per silo repair never removes balls, only new balls are checked jointly
+  joint_constraints = []
+  if config.max_new_balls > 0:
+    joint_constraints.append(max_new_balls(config.max_new_balls))
+  tracker = AbsoluteStateTracker(
+    team_repr,
+    config.width,
+    consistency_threshold=config.consistency_threshold,
+    projector=create_projector(config),
+    min_projection_iou=config.min_projection_iou,
+    consistency=StateConsistency(joint_constraints),
+  )
+  selector = SiloSelector(
+    team_repr,
+    opponent_repr,
+    create_travel_cost(config),
+    config.params.get("targets_num", 2),
+    commit_horizon=config.params.get("commit_horizon", 0.1),
+  )
+
+  frames_num = 0
+  latencies = []
+  states = []
+  previous_observed = None
+  streak_stamp = 0
+  start = time.perf_counter()
+  for frame in frames:
+    frames_num += 1
+    bgr_img = None
+    if frame.image is not None and (hsv_estimator or detector):
+      with timer("decode"):
+        bgr_img = cv2.imdecode(
+          np.frombuffer(frame.image, dtype=np.uint8), cv2.IMREAD_COLOR
+        )
+
+    detections = frame.detections
+    if detections is None:
+      if bgr_img is None:
+        continue
+      with timer("detect"):
+        detections = detector(bgr_img)
+
+    with timer("estimate"):
+      observations = estimator.estimate(detections)
+    if hsv_estimator is not None and bgr_img is not None:
+      with timer("hsv"):
+        hsv_estimator.estimate(bgr_img, detections)
+    if observations is None:
+      continue
+
+    ## First frame of a streak of same observed states
+    observed = [silo.state for silo in observations]
+    if observed != previous_observed:
+      streak_stamp = frame.stamp
+      previous_observed = observed
+
+    with timer("track"):
+      previous_states = list(tracker.states)
+      is_confirmed = tracker.update(observations, frame.pose)
+    if is_confirmed and tracker.states != previous_states:
+      latencies.append((frame.stamp - streak_stamp) / 1e9)
+      states.append(list(tracker.states))
+
+    if frame.pose is not None:
+      selector.add_pose(frame.stamp / 1e9, *frame.pose)
+    with timer("select"):
+      silos = list(enumerate(tracker.states, start=1))
+      selector.update_score(silos)
+      if selector.has_pose and not selector.is_game_over:
+        selector.select(silos, frame.stamp / 1e9)
+
+  return ReplayResult(
+    source=source,
+    frames=frames_num,
+    wall_time=time.perf_counter() - start,
+    stage_times=dict(timer.times),
+    latencies=latencies,
+    states=states,
+  )
+
+
+def replay_parallel(
+  sources: Sequence[str], config: ReplayConfig, workers: int = 0
+) -> List[ReplayResult]:
+  """! Replay sources across a process pool
+  @param workers number of processes, 0 for number of CPUs, 1 to run in this process
+  """
+  workers = min(workers or os.cpu_count() or 1, len(sources))
+  if workers <= 1:
+    return [replay(source, config) for source in sources]
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    return list(executor.map(replay, sources, [config] * len(sources)))
+
+
+def summarize(results: Sequence[ReplayResult]) -> str:
+  frames = sum(result.frames for result in results)
+  wall_time = sum(result.wall_time for result in results)
+  lines = [
+    f"Frames: {frames} in {wall_time:.2f}s ({frames / max(wall_time, 1e-9):,.1f} FPS)"
+  ]
+
+  lines.append(
+    f"{'stage':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'total s':>9}"
+  )
+  for stage in STAGES:
+    times = np.concatenate(
+      [result.stage_times.get(stage, []) for result in results] + [[]]
+    )
+    if len(times) == 0:
+      continue
+    p50, p95 = np.percentile(times, [50, 95]) * 1e3
+    lines.append(
+      f"{stage:>10} {times.mean() * 1e3:9.3f} {p50:9.3f} {p95:9.3f} {times.sum():9.2f}"
+    )
+
+  latencies = np.concatenate([result.latencies for result in results] + [[]])
+  if len(latencies):
+    p50, p95 = np.percentile(latencies, [50, 95])
+    lines.append(
+      f"Confirmation latency ({len(latencies)} changes): mean {latencies.mean():.3f}s"
+      f" | p50 {p50:.3f}s | p95 {p95:.3f}s"
+    )
+  for result in results:
+    final_state = result.states[-1] if result.states else [""] * 5
+    lines.append(f"{result.source}: {result.frames} frames, final state {final_state}")
+  return "\n".join(lines)
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Replay recordings of silo estimation")
+  parser.add_argument("sources", nargs="+", help="recordings or folders of frames")
+  parser.add_argument("--team-color", choices=("blue", "red"), default="blue")
+  parser.add_argument(
+    "--params-file", action="append", default=[], help="ROS parameter file (repeat)"
+  )
+  parser.add_argument("--model", default="", help="YOLOv8 weights for JPEG folders")
+  parser.add_argument("--hsv", action="store_true", help="run HSV estimation too")
+  parser.add_argument("-j", "--workers", type=int, default=0)
+  args = parser.parse_args(args)
+
+  params = load_params_files(args.params_file)
+  config = ReplayConfig(
+    team_color=args.team_color,
+    width=params.get("width", ReplayConfig.width),
+    height=params.get("height", ReplayConfig.height),
+    consistency_threshold=params.get(
+      "consistency_threshold", ReplayConfig.consistency_threshold
+    ),
+    min_silo_area=params.get("min_silo_area", ReplayConfig.min_silo_area),
+    min_projection_iou=params.get(
+      "min_projection_iou", ReplayConfig.min_projection_iou
+    ),
+    max_new_balls=params.get("max_new_balls", ReplayConfig.max_new_balls),
+    hsv=args.hsv,
+    model=args.model,
+    params=params,
+  )
+  results = replay_parallel(args.sources, config, args.workers)
+  print(summarize(results))
+
+
+if __name__ == "__main__":
+  main()
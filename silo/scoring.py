@@ -0,0 +1,120 @@
+"""
+Score of the match kept up to date from changes of silo states.
+
+Each ball stored is worth 30 points and a team capturing 3 silos wins instantly by
+Mua Vang. A silo is captured when it is full, 2 out of its 3 balls are of the team's
+color and the top ball is of the team's color. Updating a silo only applies the
+difference between its previous and current stack, so the cost is constant per
+changed silo.
+"""
+
+from typing import List, Set
+
+from silo.stacks import (
+  CAPTURED_BY,
+  EMPTY_STACK,
+  INVALID_STACK,
+  MAX_BALLS,
+  STACK_BALLS,
+  STACK_LENGTH,
+  stack_id,
+)
+
+BALL_POINTS = 30
+CAPTURED_SILOS_TO_WIN = 3
+SILOS_NUM = 5
+
+# Fields of score summary
+TEAM_POINTS = 0
+OPPONENT_POINTS = 1
+TEAM_CAPTURED = 2
+OPPONENT_CAPTURED = 3
+# 1 if team won by Mua Vang, -1 if opponent did, 0 otherwise
+MUA_VANG = 4
+IS_GAME_OVER = 5
+SUMMARY_SIZE = 6
+
+
+class Scoreboard:
+  def __init__(
+    self, team_repr: str, opponent_repr: str, ball_points: int = BALL_POINTS
+  ):
+    self.team_repr = team_repr
+    self.opponent_repr = opponent_repr
+    self.ball_points = ball_points
+    self.stacks: List[int] = [EMPTY_STACK] * SILOS_NUM
+    self.team_balls = 0
+    self.opponent_balls = 0
+    self.full_silos = 0
+    self.team_captured_silos: Set[int] = set()
+    self.opponent_captured_silos: Set[int] = set()
+    self.mua_vang = 0
+    self.summary = [0] * SUMMARY_SIZE
+
+  def update(self, index: int, state: str) -> bool:
+    """! Apply state of a silo
+    @param index silo index starting from 1
+    @param state stack of balls in silo
+    @return True if state of silo changed
+    """
+    current = stack_id(state)
+    previous = self.stacks[index - 1]
+    if current == previous or current == INVALID_STACK:
+      return False
+    self.stacks[index - 1] = current
+
+    self.team_balls += (
+      STACK_BALLS[current][self.team_repr] - STACK_BALLS[previous][self.team_repr]
+    )
+    self.opponent_balls += (
+      STACK_BALLS[current][self.opponent_repr]
+      - STACK_BALLS[previous][self.opponent_repr]
+    )
+    self.full_silos += (STACK_LENGTH[current] == MAX_BALLS) - (
+      STACK_LENGTH[previous] == MAX_BALLS
+    )
+
+    self.__uncapture(index, CAPTURED_BY[previous])
+    self.__capture(index, CAPTURED_BY[current])
+
+    ## Mua Vang is decided once and for all
+    if self.mua_vang == 0:
+      if len(self.team_captured_silos) >= CAPTURED_SILOS_TO_WIN:
+        self.mua_vang = 1
+      elif len(self.opponent_captured_silos) >= CAPTURED_SILOS_TO_WIN:
+        self.mua_vang = -1
+
+    self.__update_summary()
+    return True
+
+  @property
+  def team_points(self) -> int:
+    return self.team_balls * self.ball_points
+
+  @property
+  def opponent_points(self) -> int:
+    return self.opponent_balls * self.ball_points
+
+  @property
+  def is_game_over(self) -> bool:
+    return self.mua_vang != 0 or self.full_silos == SILOS_NUM
+
+  def __capture(self, index: int, color: str):
+    if color == self.team_repr:
+      self.team_captured_silos.add(index)
+    elif color == self.opponent_repr:
+      self.opponent_captured_silos.add(index)
+
+  def __uncapture(self, index: int, color: str):
+    if color == self.team_repr:
+      self.team_captured_silos.discard(index)
+    elif color == self.opponent_repr:
+      self.opponent_captured_silos.discard(index)
+
+  def __update_summary(self):
+    self.summary[TEAM_POINTS] = self.team_points
+    self.summary[OPPONENT_POINTS] = self.opponent_points
+    self.summary[TEAM_CAPTURED] = len(self.team_captured_silos)
+    self.summary[OPPONENT_CAPTURED] = len(self.opponent_captured_silos)
+    self.summary[MUA_VANG] = self.mua_vang
+    self.summary[IS_GAME_OVER] = int(self.is_game_over)
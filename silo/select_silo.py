@@ -6,7 +6,16 @@ from nav_msgs.msg import Odometry
 from rclpy.node import Node
 from rclpy.qos import QoSProfile, QoSReliabilityPolicy
 from silo_msgs.msg import SiloArray
-from std_msgs.msg import Bool, UInt8MultiArray
+from std_msgs.msg import Bool, Int32MultiArray, UInt8MultiArray
+
+from silo.game_table import GameTable
+from silo.geometry import optical_axis_heading, yaw_from_quaternion
+from silo.pose_history import PoseHistory
+from silo.profiling import attach_profiler
+from silo.scoring import MUA_VANG
+from silo.selection import SiloSelector
+from silo.trace_collector import create_tracer
+from silo.travel_cost import TravelCost
 
 """
 Priority List:
@@ -21,8 +30,8 @@ Priority List:
 
 class SiloSelection(Node):
   def __init__(self):
-    node_name = "silo_selection"
-    super().__init__("silo_selection")
+    node_name = "silo_selection_node"
+    super().__init__(node_name)
 
     # Declare team color as parameter
     self.declare_parameter("team_color", "blue")
@@ -31,6 +40,23 @@ class SiloSelection(Node):
     self.declare_parameter("silo_z_max", 0.0)
     self.declare_parameter("silo_y", 0.0)
     self.declare_parameter("silo_radius", 0.0)
+    # Number of optimal silos to publish
+    self.declare_parameter("targets_num", 2)
+    # Game value table solved offline by silo.game_table, empty to use priority only
+    self.declare_parameter("game_table_path", "")
+    # Time-to-align model of silos
+    self.declare_parameter("approach_standoff", 0.5)
+    self.declare_parameter("linear_speed", 1.5)
+    self.declare_parameter("angular_speed", 2.0)
+    self.declare_parameter("cost_position_epsilon", 0.02)
+    self.declare_parameter("cost_yaw_epsilon", 2.0)
+    # Camera optical frame w.r.t. base_link, camera faces the silo when aligned
+    self.declare_parameter("base2cam_optical.ypr", [0.0, 0.0, 0.0])
+    # Silos are ranked from the pose extrapolated to now + commit_horizon (seconds)
+    self.declare_parameter("commit_horizon", 0.1)
+    self.declare_parameter("max_extrapolation", 0.5)
+    # Publish spans of callbacks for trace_collector_node
+    self.declare_parameter("trace", False)
 
     # Timer to publish two best silos
     self.create_timer(0.05, self.timer_callback)
@@ -54,6 +80,9 @@ class SiloSelection(Node):
       UInt8MultiArray, "/silo_number", 10
     )
     self.game_over_pub = self.create_publisher(Bool, "/is_game_over", 10)
+    # [team points, opponent points, team captured, opponent captured, mua vang,
+    # is game over], published when score changes
+    self.score_pub = self.create_publisher(Int32MultiArray, "/silo_score", 10)
 
     # Get team color as object variable for silo selection
     self.team_color = (
@@ -72,6 +101,9 @@ class SiloSelection(Node):
     self.silo_radius = (
       self.get_parameter("silo_radius").get_parameter_value().double_value
     )
+    self.targets_num = (
+      self.get_parameter("targets_num").get_parameter_value().integer_value
+    )
 
     # Get x,y of silos
     self.silos_xy = [(x, self.silo_y) for x in self.silos_x]
@@ -83,33 +115,41 @@ class SiloSelection(Node):
       self.TEAM_REPR, self.OPPONENT_REPR = self.OPPONENT_REPR, self.TEAM_REPR
       self.silos_xy = [(x, -self.silo_y) for x in self.silos_x]
 
+    self.silos_xy = np.array(self.silos_xy)
+
     # Initialize optimal silos as zero index
-    self.optimal_silos: List[int] = [0] * 2
+    self.optimal_silos: List[int] = [0] * self.targets_num
     self.silo_numbers_msg = UInt8MultiArray()
     self.received_msg = None
 
-    # Initialize list of lists for priority
-    self.priority_list = [[] for _ in range(6)]
-    self.get_logger().info(f"{node_name} node started")
+    self.get_logger().info(f"{node_name} started")
 
-    # list to indicate full silos state
-    self.full_silos_index = set()
-    self.team_captured_silos = set()
-    self.opponent_captured_silos = set()
     self.game_over_state = Bool()
 
-    # Priority order
-    self.priority_order = [
-      [self.TEAM_REPR + self.OPPONENT_REPR, self.OPPONENT_REPR + self.TEAM_REPR],
-      [self.TEAM_REPR * 2],
-      [self.OPPONENT_REPR * 2],
-      [""],
-      [self.TEAM_REPR],
-      [self.OPPONENT_REPR],
-    ]
-
-    # baselink translation w.r.t. map
-    self.translation_map2base = None
+    self.selector = SiloSelector(
+      self.TEAM_REPR,
+      self.OPPONENT_REPR,
+      self.create_travel_cost(),
+      self.targets_num,
+      game_table=self.load_game_table(),
+      commit_horizon=self.get_parameter("commit_horizon")
+      .get_parameter_value()
+      .double_value,
+      # Recent baselink poses w.r.t. map from odometry
+      pose_history=PoseHistory(
+        max_extrapolation=self.get_parameter("max_extrapolation")
+        .get_parameter_value()
+        .double_value
+      ),
+    )
+    self.scoreboard = self.selector.scoreboard
+    self.team_captured_silos = self.scoreboard.team_captured_silos
+    self.opponent_captured_silos = self.scoreboard.opponent_captured_silos
+    self.full_silos_index = self.selector.full_silos
+    self.score_msg = Int32MultiArray()
+    self.tracer = create_tracer(
+      self, self.get_parameter("trace").get_parameter_value().bool_value
+    )
 
   def timer_callback(self):
     self.publish_silo_numbers_msg()
@@ -121,91 +161,79 @@ class SiloSelection(Node):
     return
 
   def baselink_pose_callback(self, pose_msg: Odometry):
-    self.translation_map2base = np.zeros(3)
-    self.translation_map2base[0] = pose_msg.pose.pose.position.x
-    self.translation_map2base[1] = pose_msg.pose.pose.position.y
-    self.translation_map2base[2] = pose_msg.pose.pose.position.z
+    pose = pose_msg.pose.pose
+    twist = pose_msg.twist.twist
+    stamp = pose_msg.header.stamp
+    self.selector.add_pose(
+      stamp.sec + stamp.nanosec * 1e-9,
+      pose.position.x,
+      pose.position.y,
+      yaw_from_quaternion(
+        pose.orientation.x, pose.orientation.y, pose.orientation.z, pose.orientation.w
+      ),
+      twist.linear.x,
+      twist.linear.y,
+      twist.angular.z,
+    )
 
   def state_received_callback(self, state_msg: SiloArray):
-    if self.translation_map2base is None:
-      # self.get_logger().info("Waiting for baselink pose")
-      return
-
-    if len(self.full_silos_index) == 5:
-      self.update_game_over_state(True)
-      self.publish_game_over_state()
-      return
-
-    self.received_msg = state_msg
-
-    ## Assign priority to each silo
-    # Put index in respective index of priority_list
-    self.set_priority_list(state_msg.silos)
-
-    ## Iterate through priority list
-    # Select nearest silo index in first non-empty list inaside priority list
-    self.update_target()
-
-  def set_priority_list(self, silo_array):
-    # reinitalize priority list
-    self.priority_list = [[] for _ in range(6)]
-    # update priority list
-    for silo in silo_array:
-      if (
-        silo.state == self.TEAM_REPR + self.OPPONENT_REPR
-        or silo.state == self.OPPONENT_REPR + self.TEAM_REPR
-      ):
-        self.priority_list[0].append(silo.index)
-      elif silo.state == self.TEAM_REPR * 2:
-        self.priority_list[1].append(silo.index)
-      elif silo.state == self.OPPONENT_REPR * 2:
-        self.priority_list[2].append(silo.index)
-      elif silo.state == "":
-        self.priority_list[3].append(silo.index)
-      elif silo.state == self.TEAM_REPR:
-        self.priority_list[4].append(silo.index)
-      elif silo.state == self.OPPONENT_REPR:
-        self.priority_list[5].append(silo.index)
-      else:
-        self.full_silos_index.add(silo.index)
-
-  def update_target(self):
-    second_priority_list = self.priority_list
-    self.optimal_silos = [0] * 2
-
-    ## Get best option from first priority list
-    for i, silos in enumerate(self.priority_list):
-      if len(silos) == 0:
-        continue
-      optimal_silo_index = self.get_optimal_silo_index(silos)
-      self.optimal_silos[0] = optimal_silo_index
-      second_priority_list[i].remove(optimal_silo_index)
-      break
-
-    ## Get best option from second priority list
-    for i, silos in enumerate(second_priority_list):
-      if len(silos) == 0:
-        continue
-      optimal_silo_index = self.get_optimal_silo_index(silos)
-      self.optimal_silos[1] = optimal_silo_index
-      break
-
-    ## Update silo_numbers_msg
-    self.silo_numbers_msg.data = self.optimal_silos
-
-  def get_optimal_silo_index(self, silo_indexes):
-    ## Iterate over silo_indexes
-    ## Select silo_index with minimum distance w.r.t. baselink
-    silos_distance: List[float] = [
-      self.get_distance(silo_index) for silo_index in silo_indexes
-    ]
-    optimal_silo_index = silo_indexes[silos_distance.index(min(silos_distance))]
-    return optimal_silo_index
-
-  def get_distance(self, silo_index):
-    del_x = self.silos_xy[silo_index - 1][0] - self.translation_map2base[0]
-    del_y = self.silos_xy[silo_index - 1][1] - self.translation_map2base[1]
-    return np.sqrt(del_x**2 + del_y**2)
+    with self.tracer.span("selection"):
+      if not self.selector.has_pose:
+        # self.get_logger().info("Waiting for baselink pose")
+        return
+
+      silos = [(silo.index, silo.state) for silo in state_msg.silos]
+
+      ## Update score, match is over once Mua Vang is decided or all silos are full
+      if self.selector.update_score(silos):
+        self.publish_score()
+      if self.selector.is_game_over:
+        self.update_game_over_state(True)
+        self.publish_game_over_state()
+        return
+
+      self.received_msg = state_msg
+
+      ## Rank silos by priority, then by time to align in front of silo
+      self.optimal_silos = self.selector.select(
+        silos, self.get_clock().now().nanoseconds * 1e-9
+      )
+      self.silo_numbers_msg.data = self.optimal_silos
+
+  def create_travel_cost(self) -> TravelCost:
+    return TravelCost(
+      self.silos_xy,
+      self.get_parameter("approach_standoff").get_parameter_value().double_value,
+      self.get_parameter("linear_speed").get_parameter_value().double_value,
+      self.get_parameter("angular_speed").get_parameter_value().double_value,
+      self.get_parameter("cost_position_epsilon").get_parameter_value().double_value,
+      np.radians(
+        self.get_parameter("cost_yaw_epsilon").get_parameter_value().double_value
+      ),
+      optical_axis_heading(
+        self.get_parameter("base2cam_optical.ypr")
+        .get_parameter_value()
+        .double_array_value
+      ),
+    )
+
+  def load_game_table(self):
+    game_table_path = (
+      self.get_parameter("game_table_path").get_parameter_value().string_value
+    )
+    if not game_table_path:
+      return None
+    try:
+      game_table = GameTable(game_table_path, self.TEAM_REPR)
+    except (OSError, ValueError) as e:
+      self.get_logger().error(f"Game table not loaded, using priority only: {e}")
+      return None
+    self.get_logger().info(f"Game table loaded from {game_table_path}")
+    return game_table
+
+  def publish_score(self):
+    self.score_msg.data = self.scoreboard.summary
+    self.score_pub.publish(self.score_msg)
 
   def update_game_over_state(self, is_game_over: bool):
     self.game_over_state.data = is_game_over
@@ -213,7 +241,14 @@ class SiloSelection(Node):
 
   def publish_game_over_state(self):
     self.game_over_pub.publish(self.game_over_state)
-    self.get_logger().info("Game Over... All silos are full")
+    match self.scoreboard.summary[MUA_VANG]:
+      case 1:
+        reason = "Mua Vang by team"
+      case -1:
+        reason = "Mua Vang by opponent"
+      case _:
+        reason = "All silos are full"
+    self.get_logger().info(f"Game Over... {reason}", throttle_duration_sec=5.0)
     return
 
 
@@ -221,6 +256,7 @@ def main(args=None):
   rclpy.init(args=args)
 
   state_estimation_node = SiloSelection()
+  attach_profiler(state_estimation_node)
 
   rclpy.spin(state_estimation_node)
 
@@ -0,0 +1,119 @@
+"""
+Selection of the silos to store a ball in.
+
+Silos are ranked by the value of the game table when one is loaded, then by priority
+of their stack, then by time to align in front of them from the pose extrapolated to
+the time of commitment. The score is updated from every change of silo states and the
+match is over once Mua Vang is decided or all silos are full.
+"""
+
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from silo.game_table import SILOS_NUM, VALUE, GameTable
+from silo.pose_history import PoseHistory
+from silo.priority import build_priority_table, rank_silos
+from silo.scoring import Scoreboard
+from silo.travel_cost import TravelCost
+
+
+class SiloSelector:
+  def __init__(
+    self,
+    team_repr: str,
+    opponent_repr: str,
+    travel_cost: TravelCost,
+    targets_num: int = 2,
+    game_table: Optional[GameTable] = None,
+    commit_horizon: float = 0.1,
+    pose_history: Optional[PoseHistory] = None,
+  ):
+    """! Selector of best silos
+    @param travel_cost time-to-align model of silos
+    @param targets_num number of silos to select
+    @param game_table game value table, None to use priority only
+    @param commit_horizon silos are ranked from the pose extrapolated to now + horizon
+    @param pose_history recent poses of base_link w.r.t. map
+    """
+    self.travel_cost = travel_cost
+    self.targets_num = targets_num
+    self.game_table = game_table
+    self.commit_horizon = commit_horizon
+    self.pose_history = pose_history or PoseHistory()
+
+    # Priority of every possible silo state
+    self.priority_table = build_priority_table(team_repr, opponent_repr)
+    # Score updated from changes of silo states
+    self.scoreboard = Scoreboard(team_repr, opponent_repr)
+
+    # Indexes of best silos, 0 if none
+    self.targets: List[int] = [0] * targets_num
+    self.full_silos = set()
+    # x, y, yaw of base_link w.r.t. map when committing to a silo, written in place
+    self.pose = np.zeros(3)
+    self.states = [""] * SILOS_NUM
+
+  @property
+  def has_pose(self) -> bool:
+    return len(self.pose_history) > 0
+
+  @property
+  def is_game_over(self) -> bool:
+    return self.scoreboard.is_game_over
+
+  def add_pose(
+    self,
+    stamp: float,
+    x: float,
+    y: float,
+    yaw: float,
+    vx: float = 0.0,
+    vy: float = 0.0,
+    yaw_rate: float = 0.0,
+  ) -> bool:
+    """! Add pose of base_link w.r.t. map
+    @return False if pose is older than latest pose
+    """
+    return self.pose_history.append(stamp, x, y, yaw, vx, vy, yaw_rate)
+
+  def update_score(self, silos: Iterable[Tuple[int, str]]) -> bool:
+    """! Update score from (index, state) of silos
+    @return True if score changed
+    """
+    changed = False
+    for index, state in silos:
+      changed |= self.scoreboard.update(index, state)
+    return changed
+
+  def select(self, silos: Sequence[Tuple[int, str]], now: float) -> List[int]:
+    """! Best silos from (index, state) of silos
+    @param now current time in seconds
+    @return indexes of best silos in ranked order, padded with 0
+    """
+    self.pose_history.pose_at(now + self.commit_horizon, out=self.pose)
+    ranked_silos, full_silos = rank_silos(
+      silos,
+      self.travel_cost.costs(self.pose),
+      self.priority_table,
+      self.targets_num,
+      values=self.get_values(silos),
+    )
+    self.full_silos.update(full_silos)
+
+    self.targets = [0] * self.targets_num
+    for i, (_, _, silo_index) in enumerate(ranked_silos):
+      self.targets[i] = silo_index
+    return self.targets
+
+  def get_values(self, silos: Sequence[Tuple[int, str]]) -> Optional[np.ndarray]:
+    ## Value of storing ball in each silo from game table
+    if self.game_table is None or len(silos) != SILOS_NUM:
+      return None
+    for index, state in silos:
+      self.states[index - 1] = state
+    values = self.game_table.lookup(self.states)
+    # No value once game is over
+    if values is None or np.isnan(values[:, VALUE]).all():
+      return None
+    return values[:, VALUE]
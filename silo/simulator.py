@@ -0,0 +1,379 @@
+"""
+Monte Carlo simulator of a match for benchmarking silo selection policies.
+
+Both robots repeatedly pick up a ball at their pickup zone, choose a silo with their
+policy, drive to it and store the ball. Travel time to a silo is the time to align of
+silo.travel_cost (turn, drive to the approach point, turn to face the silo), back to
+the pickup zone it is the turn & drive, both scaled by a random factor.
+A robot reaching a silo which became full in the meantime chooses again from there.
+The match ends by Mua Vang (3 captured silos), when all silos are full or on timeout.
+Teams swap pickup zones every other game, so that the advantage of a side, as from
+silos at equal cost ranked by index, cancels out.
+
+Policies are callables (silos_state, pose) -> silo index (1 to 5, 0 for none), pose
+being x, y, yaw of the robot, created from a spec:
+- priority -> SiloSelector of silo_selection_node, by priority then time to align
+- table:<path> -> same with game value table from silo.game_table
+- random -> any silo which is not full
+- <module>:<factory> -> factory(team_repr, config, rng) returning a policy
+"""
+
+import argparse
+import heapq
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from math import atan2, hypot, pi
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from silo.game_table import GameTable
+from silo.geometry import optical_axis_heading, wrap_angle
+from silo.params import load_params_files
+from silo.selection import SiloSelector
+from silo.stacks import CAPTURED_BY, MAX_BALLS, STACK_ID
+from silo.travel_cost import TravelCost
+
+Position = Tuple[float, float]
+# x, y, yaw w.r.t. map
+Pose = Tuple[float, float, float]
+Policy = Callable[[List[str], Pose], int]
+
+TEAM_REPR = "B"
+OPPONENT_REPR = "R"
+CAPTURED_SILOS_TO_WIN = 3
+
+DECIDE = 0
+ARRIVE = 1
+
+
+@dataclass
+class SimulationConfig:
+  silos_x: Sequence[float] = (1.5, 0.75, 0.0, -0.75, -1.5)
+  silo_y: float = -4.289
+  team_pickup: Position = (1.0, -1.0)
+  opponent_pickup: Position = (-1.0, -1.0)
+  # Heading of robots at start in radians, camera facing the silos
+  start_yaw: float = pi / 2
+  # Robot speed in m/s & rad/s
+  speed: float = 1.5
+  angular_speed: float = 2.0
+  # Balls are stored from approach_standoff (m) in front of silo, camera facing it
+  approach_standoff: float = 0.5
+  camera_heading: float = pi
+  # Time to pick up and to store a ball in seconds
+  pickup_time: float = 3.0
+  store_time: float = 1.5
+  # Travel and handling times are scaled by a uniform factor in [1 - noise, 1 + noise]
+  time_noise: float = 0.2
+  match_time: float = 180.0
+  ball_points: int = 30
+  silos_xy: List[Position] = field(init=False)
+
+  def __post_init__(self):
+    self.silos_xy = [(x, self.silo_y) for x in self.silos_x]
+
+
+class GameResult(NamedTuple):
+  # 1 if team won, -1 if opponent won, 0 for draw
+  winner: int
+  # 1 if team won by Mua Vang, -1 if opponent did, 0 otherwise
+  mua_vang: int
+  team_points: int
+  opponent_points: int
+  team_captured: int
+  opponent_captured: int
+  decisions: int
+  duration: float
+
+
+def make_travel_cost(config: SimulationConfig) -> TravelCost:
+  return TravelCost(
+    np.array(config.silos_xy),
+    config.approach_standoff,
+    config.speed,
+    config.angular_speed,
+    camera_heading=config.camera_heading,
+  )
+
+
+class PriorityPolicy:
+  def __init__(
+    self,
+    team_repr: str,
+    config: SimulationConfig,
+    game_table: Optional[GameTable] = None,
+  ):
+    """! Silo selection of silo_selection_node from pose of robot"""
+    opponent_repr = OPPONENT_REPR if team_repr == TEAM_REPR else TEAM_REPR
+    self.selector = SiloSelector(
+      team_repr,
+      opponent_repr,
+      make_travel_cost(config),
+      targets_num=1,
+      game_table=game_table,
+      commit_horizon=0.0,
+    )
+    # Decisions are stamped in sequence, poses are never extrapolated
+    self.stamp = 0.0
+
+  def __call__(self, silos: List[str], pose: Pose) -> int:
+    self.stamp += 1.0
+    self.selector.add_pose(self.stamp, *pose)
+    return self.selector.select(list(enumerate(silos, start=1)), self.stamp)[0]
+
+
+class GameTablePolicy(PriorityPolicy):
+  def __init__(self, team_repr: str, config: SimulationConfig, path: str):
+    super().__init__(team_repr, config, GameTable(path, team_repr))
+
+
+class RandomPolicy:
+  def __init__(self, rng: random.Random):
+    self.rng = rng
+
+  def __call__(self, silos: List[str], pose: Pose) -> int:
+    available = [i for i, state in enumerate(silos, start=1) if len(state) < MAX_BALLS]
+    if not available:
+      return 0
+    return self.rng.choice(available)
+
+
+def make_policy(
+  spec: str, team_repr: str, config: SimulationConfig, rng: random.Random
+) -> Policy:
+  name, _, argument = spec.partition(":")
+  match name:
+    case "priority":
+      return PriorityPolicy(team_repr, config)
+    case "table":
+      return GameTablePolicy(team_repr, config, argument)
+    case "random":
+      return RandomPolicy(rng)
+  factory = getattr(importlib.import_module(name), argument)
+  return factory(team_repr, config, rng)
+
+
+def captured_silos(silos: List[str], color: str) -> int:
+  return sum(CAPTURED_BY[STACK_ID[state]] == color for state in silos)
+
+
+def play(
+  config: SimulationConfig,
+  team_policy: Policy,
+  opponent_policy: Policy,
+  rng: random.Random,
+  swap_sides: bool = False,
+) -> GameResult:
+  """! Simulate one match
+  @param swap_sides whether team starts from pickup zone of opponent & vice versa
+  @return result of match from team's view
+  """
+  silos = [""] * len(config.silos_xy)
+  pickups = [config.team_pickup, config.opponent_pickup]
+  if swap_sides:
+    pickups.reverse()
+  robots = [
+    (TEAM_REPR, team_policy, pickups[0]),
+    (OPPONENT_REPR, opponent_policy, pickups[1]),
+  ]
+  balls = [0, 0]
+  decisions = 0
+  mua_vang = 0
+  now = 0.0
+  travel_cost = make_travel_cost(config)
+  approach_yaw = travel_cost.approach_yaw
+
+  def noisy(duration: float) -> float:
+    return duration * rng.uniform(1 - config.time_noise, 1 + config.time_noise)
+
+  # (time, sequence, robot, event, data), data is pose on DECIDE, silo on ARRIVE
+  events = []
+  for robot, (_, _, pickup) in enumerate(robots):
+    pose = (*pickup, config.start_yaw)
+    heapq.heappush(events, (noisy(config.pickup_time), robot, robot, DECIDE, pose))
+  sequence = len(robots)
+
+  while events:
+    now, _, robot, event, data = heapq.heappop(events)
+    if now > config.match_time:
+      now = config.match_time
+      break
+    color, policy, pickup = robots[robot]
+
+    if event == DECIDE:
+      silo_index = policy(silos, data)
+      decisions += 1
+      if silo_index == 0:
+        continue
+      travel = noisy(float(travel_cost.costs(np.array(data))[silo_index - 1]))
+      heapq.heappush(events, (now + travel, sequence, robot, ARRIVE, silo_index))
+      sequence += 1
+      continue
+
+    ## Robot arrived at silo, aligned at its approach point
+    approach_xy = travel_cost.approach_xy[data - 1]
+    if len(silos[data - 1]) >= MAX_BALLS:
+      pose = (*approach_xy, approach_yaw)
+      heapq.heappush(events, (now, sequence, robot, DECIDE, pose))
+      sequence += 1
+      continue
+    silos[data - 1] += color
+    balls[robot] += 1
+
+    if captured_silos(silos, color) >= CAPTURED_SILOS_TO_WIN:
+      mua_vang = 1 if robot == 0 else -1
+      break
+    if all(len(state) >= MAX_BALLS for state in silos):
+      break
+
+    ## Turn towards pickup zone & drive there
+    dx, dy = pickup[0] - approach_xy[0], pickup[1] - approach_xy[1]
+    bearing = atan2(dy, dx)
+    travel = (
+      hypot(dx, dy) / config.speed
+      + abs(wrap_angle(bearing - approach_yaw)) / config.angular_speed
+    )
+    ready = now + noisy(config.store_time + travel + config.pickup_time)
+    heapq.heappush(events, (ready, sequence, robot, DECIDE, (*pickup, bearing)))
+    sequence += 1
+
+  team_points = balls[0] * config.ball_points
+  opponent_points = balls[1] * config.ball_points
+  if mua_vang != 0:
+    winner = mua_vang
+  else:
+    winner = (team_points > opponent_points) - (team_points < opponent_points)
+  return GameResult(
+    winner=winner,
+    mua_vang=mua_vang,
+    team_points=team_points,
+    opponent_points=opponent_points,
+    team_captured=captured_silos(silos, TEAM_REPR),
+    opponent_captured=captured_silos(silos, OPPONENT_REPR),
+    decisions=decisions,
+    duration=now,
+  )
+
+
+def simulate(
+  config: SimulationConfig,
+  team_policy: str,
+  opponent_policy: str,
+  games: int,
+  seed: int,
+) -> List[GameResult]:
+  """! Simulate matches between two policies given by spec"""
+  rng = random.Random(seed)
+  team = make_policy(team_policy, TEAM_REPR, config, rng)
+  opponent = make_policy(opponent_policy, OPPONENT_REPR, config, rng)
+  return [
+    play(config, team, opponent, rng, swap_sides=game % 2 == 1) for game in range(games)
+  ]
+
+
+def simulate_parallel(
+  config: SimulationConfig,
+  team_policy: str,
+  opponent_policy: str,
+  games: int,
+  seed: int = 0,
+  workers: int = 0,
+) -> List[GameResult]:
+  """! Simulate matches across a process pool
+  @param workers number of processes, 0 for number of CPUs, 1 to run in this process
+  """
+  workers = workers or os.cpu_count() or 1
+  if workers == 1:
+    return simulate(config, team_policy, opponent_policy, games, seed)
+
+  chunks = [games // workers + (i < games % workers) for i in range(workers)]
+  results = []
+  with ProcessPoolExecutor(max_workers=workers) as executor:
+    futures = [
+      executor.submit(
+        simulate, config, team_policy, opponent_policy, chunk, seed * workers + i
+      )
+      for i, chunk in enumerate(chunks)
+      if chunk > 0
+    ]
+    for future in futures:
+      results.extend(future.result())
+  return results
+
+
+def summarize(results: List[GameResult], elapsed: float) -> str:
+  games = len(results)
+  decisions = sum(result.decisions for result in results)
+
+  def rate(condition) -> float:
+    return sum(1 for result in results if condition(result)) / games
+
+  def mean(attribute) -> float:
+    return sum(getattr(result, attribute) for result in results) / games
+
+  return "\n".join(
+    [
+      f"Games: {games} in {elapsed:.2f}s ({games / elapsed:,.0f} games/s)",
+      f"Decisions: {decisions} ({decisions / elapsed:,.0f} decisions/s)",
+      f"Win rate: {rate(lambda r: r.winner > 0):.3f} | "
+      f"Draw rate: {rate(lambda r: r.winner == 0):.3f} | "
+      f"Loss rate: {rate(lambda r: r.winner < 0):.3f}",
+      f"Mua Vang -> team: {rate(lambda r: r.mua_vang > 0):.3f} | "
+      f"opponent: {rate(lambda r: r.mua_vang < 0):.3f}",
+      f"Points -> team: {mean('team_points'):.1f} | "
+      f"opponent: {mean('opponent_points'):.1f}",
+      f"Captured silos -> team: {mean('team_captured'):.2f} | "
+      f"opponent: {mean('opponent_captured'):.2f}",
+      f"Match duration: {mean('duration'):.1f}s",
+    ]
+  )
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Simulate matches of silo policies")
+  parser.add_argument("--team", default="priority", help="policy spec of team")
+  parser.add_argument("--opponent", default="random", help="policy spec of opponent")
+  parser.add_argument("-n", "--games", type=int, default=10000)
+  parser.add_argument("-j", "--workers", type=int, default=0)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument(
+    "--params-file",
+    action="append",
+    default=[],
+    help="ROS parameter file with silos_x, silo_y, approach_standoff, angular_speed &"
+    " base2cam_optical.ypr (repeat)",
+  )
+  parser.add_argument("--speed", type=float, default=SimulationConfig.speed)
+  parser.add_argument("--time-noise", type=float, default=SimulationConfig.time_noise)
+  parser.add_argument("--match-time", type=float, default=SimulationConfig.match_time)
+  args = parser.parse_args(args)
+
+  params = load_params_files(args.params_file)
+  silo_params = {
+    key: params[key]
+    for key in ("silos_x", "silo_y", "approach_standoff", "angular_speed")
+    if key in params
+  }
+  if "base2cam_optical.ypr" in params:
+    silo_params["camera_heading"] = optical_axis_heading(params["base2cam_optical.ypr"])
+  config = SimulationConfig(
+    speed=args.speed,
+    time_noise=args.time_noise,
+    match_time=args.match_time,
+    **silo_params,
+  )
+  start = time.perf_counter()
+  results = simulate_parallel(
+    config, args.team, args.opponent, args.games, args.seed, args.workers
+  )
+  print(f"{args.team} vs {args.opponent}")
+  print(summarize(results, time.perf_counter() - start))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,73 @@
+"""
+Enumeration of every possible stack of balls inside a silo.
+
+A silo holds at most 3 balls, so with 2 colors there are only 15 stacks
+("", "R", "B", "RR", ..., "BBB"). Stacks are identified by their position in STACKS
+so that per-silo checks become table lookups instead of string operations.
+"""
+
+from itertools import product
+from typing import Dict, Tuple
+
+BALL_COLORS = ("R", "B")
+MAX_BALLS = 3
+INVALID_STACK = -1
+
+
+def _enumerate_stacks() -> Tuple[str, ...]:
+  stacks = []
+  for length in range(MAX_BALLS + 1):
+    stacks.extend("".join(balls) for balls in product(BALL_COLORS, repeat=length))
+  return tuple(stacks)
+
+
+STACKS: Tuple[str, ...] = _enumerate_stacks()
+STACKS_NUM = len(STACKS)
+STACK_ID: Dict[str, int] = {stack: i for i, stack in enumerate(STACKS)}
+EMPTY_STACK = STACK_ID[""]
+
+# Number of balls in each stack
+STACK_LENGTH: Tuple[int, ...] = tuple(len(stack) for stack in STACKS)
+
+# STACK_BALLS[stack][color]: number of balls of color in stack
+STACK_BALLS: Tuple[Dict[str, int], ...] = tuple(
+  {color: stack.count(color) for color in BALL_COLORS} for stack in STACKS
+)
+
+# IS_LEGAL_TRANSITION[previous][next]: balls are only ever added on top
+IS_LEGAL_TRANSITION: Tuple[Tuple[bool, ...], ...] = tuple(
+  tuple(next_stack.startswith(stack) for next_stack in STACKS) for stack in STACKS
+)
+
+# PUSH_BALL[stack][color]: stack after storing a ball of color, INVALID_STACK if full
+PUSH_BALL: Tuple[Dict[str, int], ...] = tuple(
+  {
+    color: STACK_ID[stack + color] if len(stack) < MAX_BALLS else INVALID_STACK
+    for color in BALL_COLORS
+  }
+  for stack in STACKS
+)
+
+
+def _captured_by(stack: str) -> str:
+  ## Full silo with 2 out of 3 balls and top ball of same color
+  if len(stack) < MAX_BALLS:
+    return ""
+  top_color = stack[-1]
+  if stack.count(top_color) >= 2:
+    return top_color
+  return ""
+
+
+# Color of team which captured the stack, "" if not captured
+CAPTURED_BY: Tuple[str, ...] = tuple(_captured_by(stack) for stack in STACKS)
+
+# Id of stack with colors of balls swapped, to look up stacks from other team's view
+SWAPPED_STACK: Tuple[int, ...] = tuple(
+  STACK_ID[stack.translate(str.maketrans("RB", "BR"))] for stack in STACKS
+)
+
+
+def stack_id(stack: str) -> int:
+  """Id of stack in STACKS, INVALID_STACK if stack is not possible"""
+  return STACK_ID.get(stack, INVALID_STACK)
@@ -0,0 +1,210 @@
+"""
+Crash-safe journal of the absolute state of silos.
+
+The journal is a fixed size file of fixed size records used as a ring buffer and
+accessed through a memory map. Every record holds a sequence number, a timestamp
+(nanoseconds), the stack id of each silo and a CRC. The header keeps the slot of
+the last appended record, so the last valid state is recovered without scanning.
+"""
+
+import argparse
+import os
+import zlib
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from silo.stacks import STACK_ID, STACKS
+
+MAGIC = b"SILOJRNL"
+VERSION = 1
+SILOS_NUM = 5
+
+HEADER_DTYPE = np.dtype(
+  [
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("capacity", "<u4"),
+    ("last_slot", "<u4"),
+    ("last_seq", "<u8"),
+    ("reserved", "u1", (32,)),
+  ]
+)
+RECORD_DTYPE = np.dtype(
+  [
+    ("seq", "<u8"),
+    ("stamp", "<i8"),
+    ("stacks", "u1", (SILOS_NUM,)),
+    ("reserved", "u1", (7,)),
+    ("crc", "<u4"),
+  ]
+)
+CRC_OFFSET = RECORD_DTYPE.fields["crc"][1]
+
+
+class JournalRecord(NamedTuple):
+  seq: int
+  stamp: int
+  states: List[str]
+
+
+class StateJournal:
+  def __init__(self, path: str, capacity: int = 4096, sync: bool = False):
+    """! Open or create journal
+    @param path path of journal file
+    @param capacity number of records kept before oldest ones are overwritten
+    @param sync flush memory map to disk on every append
+    """
+    self.path = os.path.expanduser(path)
+    self.sync = sync
+
+    if not os.path.exists(self.path):
+      self.__create(capacity)
+
+    self.header = np.memmap(self.path, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+    if (
+      self.header["magic"][0] != MAGIC
+      or self.header["version"][0] != VERSION
+      or self.header["record_size"][0] != RECORD_DTYPE.itemsize
+    ):
+      raise ValueError(f"{self.path} is not a silo state journal")
+
+    self.capacity = int(self.header["capacity"][0])
+    self.records = np.memmap(
+      self.path,
+      dtype=RECORD_DTYPE,
+      mode="r+",
+      offset=HEADER_DTYPE.itemsize,
+      shape=(self.capacity,),
+    )
+    self.last_seq = 0
+    last = self.last()
+    if last is not None:
+      self.last_seq = last.seq
+
+  def __create(self, capacity: int):
+    directory = os.path.dirname(self.path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["capacity"] = capacity
+    with open(self.path, "wb") as f:
+      f.write(header.tobytes())
+      f.truncate(HEADER_DTYPE.itemsize + capacity * RECORD_DTYPE.itemsize)
+
+  def append(self, stamp: int, states: Sequence[str]) -> int:
+    """! Append state of silos
+    @param stamp timestamp in nanoseconds
+    @param states state of each silo
+    @return sequence number of appended record
+    """
+    seq = self.last_seq + 1
+    slot = (seq - 1) % self.capacity
+
+    record = np.zeros(1, dtype=RECORD_DTYPE)
+    record["seq"] = seq
+    record["stamp"] = stamp
+    record["stacks"] = [STACK_ID[state] for state in states]
+    record["crc"] = zlib.crc32(record.tobytes()[:CRC_OFFSET])
+    self.records[slot] = record[0]
+
+    # Header is updated after the record so that it never points to a partial record
+    self.header["last_slot"] = slot
+    self.header["last_seq"] = seq
+    if self.sync:
+      self.records.flush()
+      self.header.flush()
+
+    self.last_seq = seq
+    return seq
+
+  def is_valid(self, slot: int) -> bool:
+    record = self.records[slot : slot + 1]
+    return record["seq"][0] != 0 and record["crc"][0] == zlib.crc32(
+      record.tobytes()[:CRC_OFFSET]
+    )
+
+  def last(self) -> Optional[JournalRecord]:
+    """Last valid record, None if journal is empty"""
+    slot = int(self.header["last_slot"][0])
+    seq = int(self.header["last_seq"][0])
+
+    if seq == 0 or self.records["seq"][slot] != seq or not self.is_valid(slot):
+      return self.__scan_last()
+
+    # A record may have been written without the header update before a crash
+    next_slot = (slot + 1) % self.capacity
+    while self.records["seq"][next_slot] == seq + 1 and self.is_valid(next_slot):
+      slot, seq = next_slot, seq + 1
+      next_slot = (slot + 1) % self.capacity
+    return self.__record(slot)
+
+  def __scan_last(self) -> Optional[JournalRecord]:
+    for slot in np.argsort(self.records["seq"])[::-1]:
+      if self.records["seq"][slot] == 0:
+        break
+      if self.is_valid(slot):
+        return self.__record(slot)
+    return None
+
+  def __record(self, slot: int) -> JournalRecord:
+    record = self.records[slot]
+    return JournalRecord(
+      seq=int(record["seq"]),
+      stamp=int(record["stamp"]),
+      states=[STACKS[i] for i in record["stacks"]],
+    )
+
+  def history(self) -> List[JournalRecord]:
+    """All valid records in order of sequence number"""
+    slots = np.argsort(self.records["seq"])
+    return [
+      self.__record(slot)
+      for slot in slots
+      if self.records["seq"][slot] != 0 and self.is_valid(slot)
+    ]
+
+  def state_at(self, stamp: int) -> Optional[List[str]]:
+    """! State of silos at a time
+    @param stamp timestamp in nanoseconds
+    @return state of each silo, None if no record before stamp
+    """
+    history = self.history()
+    stamps = np.array([record.stamp for record in history], dtype=np.int64)
+    index = int(np.searchsorted(stamps, stamp, side="right")) - 1
+    if index < 0:
+      return None
+    return history[index].states
+
+  def close(self):
+    self.records.flush()
+    self.header.flush()
+    del self.records
+    del self.header
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Inspect silo state journal")
+  parser.add_argument("path", help="path of journal file")
+  parser.add_argument(
+    "--at", type=float, default=None, help="print state at time (seconds)"
+  )
+  args = parser.parse_args(args)
+
+  journal = StateJournal(args.path)
+  if args.at is not None:
+    print(journal.state_at(int(args.at * 1e9)))
+    return
+  for record in journal.history():
+    states = " | ".join(
+      f"Silo{i + 1}: {state}" for i, state in enumerate(record.states)
+    )
+    print(f"{record.seq:>6} {record.stamp / 1e9:.3f} {states}")
+
+
+if __name__ == "__main__":
+  main()
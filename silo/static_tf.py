@@ -0,0 +1,92 @@
+from typing import Optional
+
+import rclpy
+from geometry_msgs.msg import TransformStamped
+from rclpy.node import Node
+from tf2_ros.static_transform_broadcaster import StaticTransformBroadcaster
+
+from silo.geometry import quaternion_from_ypr
+from silo.profiling import attach_profiler
+
+
+class StaticTransformPublisher(Node):
+  def __init__(self):
+    super().__init__("static_tf_node")
+
+    # Names of transforms, each one given by <name>.parent_frame, <name>.child_frame,
+    # <name>.translation (m) & <name>.ypr (degrees, intrinsic ZYX)
+    self.declare_parameter("transforms", [""])
+    names = [
+      name
+      for name in self.get_parameter("transforms")
+      .get_parameter_value()
+      .string_array_value
+      if name
+    ]
+
+    self.tf_static_broadcaster = StaticTransformBroadcaster(self)
+    transforms = [self.make_transform(name) for name in names]
+    transforms = [transform for transform in transforms if transform is not None]
+
+    # Publish static transforms once at startup, in a single message
+    self.tf_static_broadcaster.sendTransform(transforms)
+    for transform in transforms:
+      self.get_logger().info(
+        f"Static transform {transform.header.frame_id} -> {transform.child_frame_id}"
+        " published"
+      )
+
+  def make_transform(self, name: str) -> Optional[TransformStamped]:
+    """! Transform of parameters under name, None if its frames are missing"""
+    self.declare_parameter(f"{name}.parent_frame", "")
+    self.declare_parameter(f"{name}.child_frame", "")
+    self.declare_parameter(f"{name}.translation", [0.0, 0.0, 0.0])
+    self.declare_parameter(f"{name}.ypr", [0.0, 0.0, 0.0])
+
+    parent_frame = (
+      self.get_parameter(f"{name}.parent_frame").get_parameter_value().string_value
+    )
+    child_frame = (
+      self.get_parameter(f"{name}.child_frame").get_parameter_value().string_value
+    )
+    if not parent_frame or not child_frame:
+      self.get_logger().error(f"Frames of static transform {name} are missing")
+      return None
+    translation = (
+      self.get_parameter(f"{name}.translation").get_parameter_value().double_array_value
+    )
+    ypr = self.get_parameter(f"{name}.ypr").get_parameter_value().double_array_value
+
+    t = TransformStamped()
+    t.header.stamp = self.get_clock().now().to_msg()
+    t.header.frame_id = parent_frame
+    t.child_frame_id = child_frame
+
+    t.transform.translation.x = float(translation[0])
+    t.transform.translation.y = float(translation[1])
+    t.transform.translation.z = float(translation[2])
+
+    (
+      t.transform.rotation.x,
+      t.transform.rotation.y,
+      t.transform.rotation.z,
+      t.transform.rotation.w,
+    ) = quaternion_from_ypr(ypr, degrees=True)
+    return t
+
+
+def main(args=None):
+  rclpy.init(args=args)
+  node = StaticTransformPublisher()
+  attach_profiler(node)
+  try:
+    rclpy.spin(node)
+  except KeyboardInterrupt:
+    pass
+
+  node.destroy_node()
+  rclpy.try_shutdown()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,269 @@
+"""
+Whether a ball is at the top of the silo in front of the camera.
+
+A top check is a callable from a BGR image to the result, backends are:
+- hsv -> matches the top ROI of the image against the dilated masks of red & blue
+- yolo, onnxruntime, opencv -> look for a ball detection whose top edge is close to
+  the top of the image, inferring only on the padded top ROI at a small fixed size.
+  yolo runs the PyTorch model through ultralytics, onnxruntime & opencv run the
+  exported ONNX model on CPU (silo.yolo_onnx). Inference libraries are only imported
+  when the backend is created, annotated crops are saved by a background writer
+"""
+
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+from silo.disk_writer import DiskWriter
+from silo.hsv_estimation import (
+  DILATION_ITERATIONS,
+  DILATION_KERNEL,
+  HSVRanges,
+  compute_match_percent,
+  get_mask,
+  preprocess_mask,
+)
+
+# Result of a check -> (ball at top, color of ball or None)
+TopCheckResult = Tuple[bool, Optional[str]]
+TopCheck = Callable[[np.ndarray], TopCheckResult]
+
+
+def check_on_top(
+  boxes_xyxy: Sequence[Sequence[float]], max_top_y: float = 50
+) -> Tuple[bool, Optional[int]]:
+  """! First box whose top edge is within max_top_y pixels of top of image
+  @return whether such a box exists & its index
+  """
+  for i, xyxy in enumerate(boxes_xyxy):
+    if xyxy[1] <= max_top_y:
+      return True, i
+  return False, None
+
+
+class HSVTopCheck:
+  def __init__(
+    self,
+    ranges: HSVRanges,
+    top_roi: Sequence[int],
+    match_fraction: float = 0.5,
+    dilation_kernel: int = DILATION_KERNEL,
+    dilation_iterations: int = DILATION_ITERATIONS,
+  ):
+    """! Top check by color
+    @param ranges HSV ranges of "red" & "blue"
+    @param top_roi x1, y1, x2, y2 of top of silo in image
+    @param match_fraction fraction of ROI matching a color for a ball to be at top
+    @param dilation_kernel size of elliptic kernel dilating masks, see
+    hsv_estimation.scaled_dilation for images at reduced scale
+    @param dilation_iterations number of dilations of masks
+    """
+    self.ranges = ranges
+    self.top_roi = tuple(int(i) for i in top_roi)
+    self.match_fraction = match_fraction
+    self.dilation = (dilation_kernel, dilation_iterations)
+
+  def __call__(self, bgr_img: np.ndarray) -> TopCheckResult:
+    hsv_img = cv2.cvtColor(bgr_img, cv2.COLOR_BGR2HSV)
+
+    red_mask = preprocess_mask(get_mask(hsv_img, "red", self.ranges), *self.dilation)
+    blue_mask = preprocess_mask(get_mask(hsv_img, "blue", self.ranges), *self.dilation)
+
+    red_match_percent = compute_match_percent(hsv_img, self.top_roi, red_mask)
+    blue_match_percent = compute_match_percent(hsv_img, self.top_roi, blue_mask)
+
+    if (red_match_percent > self.match_fraction) or (
+      blue_match_percent > self.match_fraction
+    ):
+      if red_match_percent > blue_match_percent:
+        return True, "red"
+      return True, "blue"
+    return False, None
+
+
+def padded_roi(
+  roi: Sequence[int], padding: int, image_size: Tuple[int, int]
+) -> Tuple[int, int, int, int]:
+  """! ROI grown by padding & clipped to image, whole image if ROI is empty
+  @param roi x1, y1, x2, y2
+  @param image_size width, height
+  """
+  width, height = image_size
+  x1, y1, x2, y2 = roi
+  if x2 <= x1 or y2 <= y1:
+    return 0, 0, width, height
+  return (
+    max(0, x1 - padding),
+    max(0, y1 - padding),
+    min(width, x2 + padding),
+    min(height, y2 + padding),
+  )
+
+
+def encode_debug_img(payload) -> bytes:
+  """! JPEG of crop annotated with (xyxy, class name) of detections"""
+  img, detections = payload
+  for xyxy, class_name in detections:
+    x1, y1, x2, y2 = (int(v) for v in xyxy)
+    cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    cv2.putText(
+      img, class_name, (x1, max(0, y1 - 5)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0)
+    )
+  is_encoded, buffer = cv2.imencode(".jpg", img)
+  if not is_encoded:
+    raise ValueError("Image not encoded")
+  return buffer.tobytes()
+
+
+class ModelTopCheck(ABC):
+  def __init__(
+    self,
+    top_roi: Sequence[int] = (0, 0, 0, 0),
+    roi_padding: int = 32,
+    input_size: int = 320,
+    max_top_y: float = 50,
+    debug_writer: Optional[DiskWriter] = None,
+    debug_img_dir: str = "",
+  ):
+    """! Top check by object detection inside the top ROI
+    @param top_roi x1, y1, x2, y2 of top of silo in image, empty for whole image
+    @param roi_padding pixels added around top_roi before cropping
+    @param input_size inference size of the crop in pixels
+    @param max_top_y ball is at top if its top edge is within this many pixels of top
+    of image
+    @param debug_writer writer of annotated crops (encode_debug_img), None to not save
+    them
+    @param debug_img_dir directory of annotated crops
+    """
+    self.top_roi = tuple(int(i) for i in top_roi)
+    self.roi_padding = roi_padding
+    self.input_size = input_size
+    self.max_top_y = max_top_y
+    self.debug_writer = debug_writer
+    self.debug_img_dir = debug_img_dir
+
+  @abstractmethod
+  def detect(self, bgr_img: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+    """! (N, 4) xyxy boxes in pixels of image & class names of detections"""
+
+  def warmup(self):
+    """! First inference allocates buffers (& CUDA context), pay it at startup"""
+    x1, y1, x2, y2 = self.top_roi
+    if x2 <= x1 or y2 <= y1:
+      x1, y1, x2, y2 = 0, 0, self.input_size, self.input_size
+    self.detect(np.zeros((y2 - y1, x2 - x1, 3), dtype=np.uint8))
+
+  def __call__(self, bgr_img: np.ndarray) -> TopCheckResult:
+    x1, y1, x2, y2 = padded_roi(
+      self.top_roi, self.roi_padding, (bgr_img.shape[1], bgr_img.shape[0])
+    )
+    crop = bgr_img[y1:y2, x1:x2]
+    boxes, class_names = self.detect(crop)
+    if self.debug_writer is not None:
+      self.debug_writer.submit(
+        os.path.join(self.debug_img_dir, f"{time.time():.3f}.jpg"),
+        (crop.copy(), list(zip(boxes.tolist(), class_names))),
+      )
+
+    ## Boxes of crop w.r.t. whole image
+    boxes[:, [0, 2]] += x1
+    boxes[:, [1, 3]] += y1
+    is_on_top, index = check_on_top(boxes, self.max_top_y)
+    if index is None:
+      return is_on_top, None
+    return is_on_top, class_names[index]
+
+
+class YoloTopCheck(ModelTopCheck):
+  def __init__(
+    self,
+    model: str,
+    device: str = "cuda:0",
+    threshold: float = 0.7,
+    warmup: bool = True,
+    **kwargs,
+  ):
+    """! Top check by ultralytics (PyTorch) model
+    @param model path of YOLOv8 weights
+    @param threshold minimum confidence of detections
+    @param warmup whether to run an inference on a blank crop at construction
+    @param kwargs arguments of ModelTopCheck
+    """
+    super().__init__(**kwargs)
+    from ultralytics import YOLO
+
+    self.yolo = YOLO(model)
+    self.device = device
+    self.threshold = threshold
+    if warmup:
+      self.warmup()
+
+  def detect(self, bgr_img: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+    results = self.yolo.predict(
+      source=bgr_img,
+      verbose=False,
+      stream=False,
+      conf=self.threshold,
+      device=self.device,
+      imgsz=self.input_size,
+    )[0].cpu()
+    class_names = [self.yolo.names[int(c)] for c in results.boxes.cls.numpy()]
+    return results.boxes.xyxy.numpy(), class_names
+
+
+class OnnxTopCheck(ModelTopCheck):
+  def __init__(
+    self,
+    model: str,
+    runtime: str = "onnxruntime",
+    threshold: float = 0.7,
+    threads: int = 0,
+    class_names: Sequence[str] = (),
+    warmup: bool = True,
+    **kwargs,
+  ):
+    """! Top check by ONNX model on CPU
+    @param model path of ONNX model exported at input_size, may be INT8 quantized
+    @param runtime one of yolo_onnx.RUNTIMES
+    @param threshold minimum confidence of detections
+    @param threads number of CPU threads of inference, 0 for default of runtime
+    @param class_names names of classes, read from model metadata if empty
+    @param warmup whether to run an inference on a blank crop at construction
+    @param kwargs arguments of ModelTopCheck
+    """
+    super().__init__(**kwargs)
+    from silo.yolo_onnx import YoloOnnx
+
+    self.model = YoloOnnx(
+      model,
+      self.input_size,
+      threshold,
+      runtime=runtime,
+      threads=threads,
+      class_names=class_names,
+    )
+    if warmup:
+      self.warmup()
+
+  def detect(self, bgr_img: np.ndarray) -> Tuple[np.ndarray, List[str]]:
+    boxes, _, class_ids = self.model.predict(bgr_img)
+    return boxes, [self.model.class_name(int(c)) for c in class_ids]
+
+
+def make_top_check(backend: str, **kwargs) -> TopCheck:
+  """! Top check of backend
+  @param backend "hsv", "yolo" (ultralytics), "onnxruntime" or "opencv" (cv2.dnn)
+  @param kwargs arguments of HSVTopCheck, YoloTopCheck or OnnxTopCheck
+  """
+  match backend:
+    case "hsv":
+      return HSVTopCheck(**kwargs)
+    case "yolo":
+      return YoloTopCheck(**kwargs)
+    case "onnxruntime" | "opencv":
+      return OnnxTopCheck(runtime=backend, **kwargs)
+  raise ValueError(f"Unknown top check backend: {backend}")
@@ -0,0 +1,130 @@
+"""
+Top check evaluated continuously in the background.
+
+Frames are handed to the worker as they are received and only the newest pending frame
+is kept, so a slow check skips frames instead of queueing them. Frames may be handed
+still encoded, then only the frames which are checked get decoded. Requests are answered
+from the cached result of the latest evaluated frame. When that result is older than
+the staleness bound, every request waits for the same in-flight evaluation instead of
+running the check again.
+"""
+
+import threading
+import time
+from typing import Callable, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+
+class TopCheckStatus(NamedTuple):
+  # Stamp of evaluated frame in nanoseconds
+  stamp: int
+  is_on_top: bool
+  color: Optional[str]
+  # Time taken by decoding & check in seconds
+  duration: float
+
+
+class TopCheckWorker:
+  def __init__(
+    self,
+    top_check: Callable[[np.ndarray], Tuple[bool, Optional[str]]],
+    every_n: int = 1,
+    on_result: Optional[Callable[[TopCheckStatus], None]] = None,
+    decode: Optional[Callable[[bytes], np.ndarray]] = None,
+  ):
+    """! Background evaluation of top check
+    @param top_check check of a BGR image, see silo.top_check
+    @param every_n evaluate every nth submitted frame
+    @param on_result called in worker thread with each new result
+    @param decode decoder of frames submitted as bytes, see silo.jpeg_decode
+    """
+    self.top_check = top_check
+    self.decode = decode
+    self.every_n = max(1, every_n)
+    self.on_result = on_result
+
+    self.condition = threading.Condition()
+    self.frames = 0
+    # Newest frame not evaluated yet, (bgr image or encoded bytes, stamp)
+    self.pending: Optional[tuple] = None
+    self.status: Optional[TopCheckStatus] = None
+    self.failed = 0
+    self.last_error = ""
+    self.is_closed = False
+
+    self.thread = threading.Thread(target=self.__work, name="top_check", daemon=True)
+    self.thread.start()
+
+  def submit(self, frame: Union[np.ndarray, bytes], stamp: int):
+    """! Frame to evaluate, replaces any pending frame
+    @param frame BGR image, or encoded image if worker has a decoder
+    @param stamp stamp of frame in nanoseconds
+    """
+    with self.condition:
+      self.frames += 1
+      if (self.frames - 1) % self.every_n != 0:
+        return
+      self.pending = (frame, stamp)
+      self.condition.notify_all()
+
+  def latest(self) -> Optional[TopCheckStatus]:
+    """! Result of latest evaluated frame, None if no frame was evaluated"""
+    with self.condition:
+      return self.status
+
+  def result(
+    self, now: int, max_age: int, timeout: float = 0.0
+  ) -> Optional[TopCheckStatus]:
+    """! Latest result of a frame at most max_age old
+    @param now current time in nanoseconds
+    @param max_age maximum age of evaluated frame in nanoseconds
+    @param timeout seconds to wait for the evaluation of a pending recent frame
+    @return None if no recent result is available within timeout
+    """
+
+    def is_fresh() -> bool:
+      return self.status is not None and now - self.status.stamp <= max_age
+
+    with self.condition:
+      if not is_fresh() and timeout > 0:
+        self.condition.wait_for(lambda: is_fresh() or self.is_closed, timeout)
+      return self.status if is_fresh() else None
+
+  def close(self, timeout: float = 1.0):
+    with self.condition:
+      self.is_closed = True
+      self.condition.notify_all()
+    self.thread.join(timeout)
+
+  def __work(self):
+    while True:
+      with self.condition:
+        self.condition.wait_for(lambda: self.pending is not None or self.is_closed)
+        if self.is_closed:
+          return
+        frame, stamp = self.pending
+        self.pending = None
+
+      start = time.perf_counter()
+      try:
+        if isinstance(frame, bytes):
+          frame = self.decode(frame)
+          if frame is None:
+            raise ValueError("Frame not decoded")
+        is_on_top, color = self.top_check(frame)
+      # Failure of a frame must not stop the worker
+      except Exception as e:
+        with self.condition:
+          self.failed += 1
+          self.last_error = str(e)
+        continue
+      status = TopCheckStatus(stamp, is_on_top, color, time.perf_counter() - start)
+
+      with self.condition:
+        # Result of an older frame never replaces a newer one
+        if self.status is None or stamp >= self.status.stamp:
+          self.status = status
+        self.condition.notify_all()
+      if self.on_result is not None:
+        self.on_result(status)
@@ -0,0 +1,142 @@
+import os
+from typing import List
+
+import rclpy
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from rclpy.node import Node
+from std_srvs.srv import Trigger
+
+from silo.profiling import attach_profiler
+from silo.tracing import (
+  PERCENTILES,
+  Span,
+  StageStats,
+  Tracer,
+  TraceStats,
+  decode_span,
+  encode_span,
+)
+
+TRACE_TOPIC = "/trace"
+
+
+def create_tracer(node: Node, enabled: bool) -> Tracer:
+  """! Tracer publishing spans of node on TRACE_TOPIC, disabled tracer if not enabled"""
+  if not enabled:
+    return Tracer(None)
+  publisher = node.create_publisher(DiagnosticArray, TRACE_TOPIC, 10)
+
+  def publish(spans: List[Span]):
+    status = DiagnosticStatus(
+      level=DiagnosticStatus.OK,
+      name=node.get_fully_qualified_name(),
+      values=[KeyValue(key=key, value=value) for key, value in map(encode_span, spans)],
+    )
+    msg = DiagnosticArray(status=[status])
+    msg.header.stamp = node.get_clock().now().to_msg()
+    publisher.publish(msg)
+
+  return Tracer(publish)
+
+
+def describe_stage(stats: StageStats) -> str:
+  return " | ".join(
+    f"p{p} {duration:.1f}/{age:.1f} ms"
+    for p, duration, age in zip(PERCENTILES, stats.duration, stats.age)
+  )
+
+
+class TraceCollector(Node):
+  def __init__(self):
+    super().__init__("trace_collector_node")
+
+    # Recent spans kept per node & stage
+    self.declare_parameter("window", 1000)
+    self.declare_parameter("publish_period", 1.0)
+    self.declare_parameter("csv_path", "~/.ros/silo_trace.csv")
+
+    self.stats = TraceStats(
+      self.get_parameter("window").get_parameter_value().integer_value
+    )
+    self.csv_path = os.path.expanduser(
+      self.get_parameter("csv_path").get_parameter_value().string_value
+    )
+
+    self.trace_subscriber = self.create_subscription(
+      DiagnosticArray, TRACE_TOPIC, self.trace_callback, 100
+    )
+    self.diagnostics_pub = self.create_publisher(DiagnosticArray, "/diagnostics", 10)
+    self.create_timer(
+      self.get_parameter("publish_period").get_parameter_value().double_value,
+      self.publish_stats,
+    )
+    self.srv = self.create_service(
+      srv_type=Trigger, srv_name="~/dump_csv", callback=self.dump_csv
+    )
+    self.get_logger().info("Trace collector node started.")
+
+  def trace_callback(self, msg: DiagnosticArray):
+    for status in msg.status:
+      for key_value in status.values:
+        try:
+          span = decode_span(key_value.key, key_value.value)
+        except ValueError:
+          self.get_logger().warn(
+            f"Invalid span from {status.name}: {key_value.value}",
+            throttle_duration_sec=5.0,
+          )
+          continue
+        self.stats.add(status.name, span)
+
+  def publish_stats(self):
+    stage_stats = self.stats.summary()
+    if not stage_stats:
+      return
+    msg = DiagnosticArray()
+    msg.header.stamp = self.get_clock().now().to_msg()
+    for stats in stage_stats:
+      values = [KeyValue(key="count", value=str(stats.count))]
+      for metric, metric_values in (("duration", stats.duration), ("age", stats.age)):
+        values.extend(
+          KeyValue(key=f"{metric}_p{p}_ms", value=f"{value:.2f}")
+          for p, value in zip(PERCENTILES, metric_values)
+        )
+      msg.status.append(
+        DiagnosticStatus(
+          level=DiagnosticStatus.OK,
+          name=f"silo trace: {stats.name}",
+          hardware_id="silo",
+          message=describe_stage(stats),
+          values=values,
+        )
+      )
+    self.diagnostics_pub.publish(msg)
+
+  def dump_csv(
+    self, request: Trigger.Request, response: Trigger.Response
+  ) -> Trigger.Response:
+    try:
+      rows = self.stats.write_csv(self.csv_path)
+    except OSError as e:
+      response.success = False
+      response.message = f"Trace not written: {e}"
+      return response
+    response.success = True
+    response.message = f"{rows} spans written to {self.csv_path}"
+    return response
+
+
+def main(args=None):
+  rclpy.init(args=args)
+
+  trace_collector_node = TraceCollector()
+  attach_profiler(trace_collector_node)
+
+  rclpy.spin(trace_collector_node)
+
+  trace_collector_node.destroy_node()
+  rclpy.shutdown()
+
+
+if __name__ == "__main__":
+  main()
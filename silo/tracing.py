@@ -0,0 +1,208 @@
+"""
+Lightweight tracing of the silo pipeline.
+
+Each node records a span per callback: the stage it ran, the stamp of the input it
+consumed, and the wall times of entry & exit. Spans are buffered and published in
+batches, then aggregated by the collector into per-stage percentiles of:
+- duration -> exit - entry, time spent in the stage
+- age -> exit - stamp, time since the frame was received, i.e. latency accumulated
+  up to the end of the stage
+
+Messages between estimation, absolute state & selection carry no stamp, so those stages
+record a stamp of 0 and inherit the frame stamp of the latest span of their upstream
+stage which exited before they were entered.
+"""
+
+import csv
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Stage -> stage whose output it consumes, for stages receiving messages without stamp
+UPSTREAM = {
+  "absolute_state": "estimation",
+  "selection": "absolute_state",
+}
+PERCENTILES = (50, 95, 99)
+
+
+class Span(NamedTuple):
+  stage: str
+  # Stamp of consumed input in nanoseconds, 0 if unknown
+  stamp: int
+  # Wall times in nanoseconds
+  entry: int
+  exit: int
+
+
+def encode_span(span: Span) -> Tuple[str, str]:
+  """! Key & value of span in a diagnostic status"""
+  return span.stage, f"{span.stamp} {span.entry} {span.exit}"
+
+
+def decode_span(key: str, value: str) -> Span:
+  stamp, entry, exit = (int(v) for v in value.split())
+  return Span(key, stamp, entry, exit)
+
+
+class Tracer:
+  def __init__(
+    self,
+    publish: Optional[Callable[[List[Span]], None]],
+    flush_period: float = 1.0,
+    max_spans: int = 256,
+  ):
+    """! Buffer of spans published in batches
+    Batches are flushed when recording, so nodes which never spin can trace as well.
+    @param publish called with each batch of spans, None to disable tracing
+    @param flush_period seconds between batches
+    @param max_spans batch is flushed early once it has this many spans
+    """
+    self.publish = publish
+    self.flush_period = flush_period
+    self.max_spans = max_spans
+    self.lock = threading.Lock()
+    self.spans: List[Span] = []
+    self.last_flush = time.monotonic()
+
+  @property
+  def enabled(self) -> bool:
+    return self.publish is not None
+
+  def record(self, stage: str, stamp: int, entry: int, exit: Optional[int] = None):
+    """! Span of stage, exit defaults to now"""
+    if self.publish is None:
+      return
+    span = Span(stage, stamp, entry, time.time_ns() if exit is None else exit)
+    with self.lock:
+      self.spans.append(span)
+      if (
+        len(self.spans) < self.max_spans
+        and time.monotonic() - self.last_flush < self.flush_period
+      ):
+        return
+      spans, self.spans = self.spans, []
+      self.last_flush = time.monotonic()
+    self.publish(spans)
+
+  def span(self, stage: str, stamp: int = 0):
+    """! Context recording a span of stage around its body"""
+    if self.publish is None:
+      return nullcontext()
+    return self.__span(stage, stamp)
+
+  @contextmanager
+  def __span(self, stage: str, stamp: int):
+    entry = time.time_ns()
+    try:
+      yield
+    finally:
+      self.record(stage, stamp, entry)
+
+  def flush(self):
+    with self.lock:
+      spans, self.spans = self.spans, []
+      self.last_flush = time.monotonic()
+    if spans and self.publish is not None:
+      self.publish(spans)
+
+
+class StageStats(NamedTuple):
+  # Name of node & stage
+  name: str
+  count: int
+  # Percentiles in milliseconds, NaN without spans
+  duration: Tuple[float, ...]
+  age: Tuple[float, ...]
+
+
+class TraceStats:
+  def __init__(self, window: int = 1000, upstream: Optional[Dict[str, str]] = None):
+    """! Recent spans of every node & stage
+    @param window number of recent spans kept per node & stage
+    @param upstream stage -> upstream stage to take stamps from, see UPSTREAM
+    """
+    self.upstream = UPSTREAM if upstream is None else upstream
+    self.spans: Dict[Tuple[str, str], Deque[Span]] = defaultdict(
+      lambda: deque(maxlen=window)
+    )
+
+  def add(self, node: str, span: Span):
+    self.spans[(node, span.stage)].append(span)
+
+  def resolved(self) -> Dict[Tuple[str, str], np.ndarray]:
+    """! (N, 3) stamp, entry, exit of spans of each node & stage, sorted by exit
+    Unknown stamps are taken from upstream stage, or left 0 if it has no earlier span.
+    """
+    arrays = {}
+    for key, spans in self.spans.items():
+      array = np.array([span[1:] for span in spans], dtype=np.int64).reshape(-1, 3)
+      arrays[key] = array[np.argsort(array[:, 2], kind="stable")]
+
+    by_stage: Dict[str, List[np.ndarray]] = defaultdict(list)
+    for (_, stage), array in arrays.items():
+      by_stage[stage].append(array)
+    done = set()
+
+    def resolve(stage: str, visiting: Tuple[str, ...] = ()):
+      if stage in done or stage in visiting:
+        return
+      upstream = self.upstream.get(stage)
+      if upstream is not None and upstream in by_stage:
+        resolve(upstream, visiting + (stage,))
+        source = np.concatenate(by_stage[upstream])
+        source = source[np.argsort(source[:, 2], kind="stable")]
+        for array in by_stage[stage]:
+          unknown = array[:, 0] == 0
+          index = np.searchsorted(source[:, 2], array[unknown, 1], side="right") - 1
+          stamps = np.where(index >= 0, source[np.maximum(index, 0), 0], 0)
+          array[unknown, 0] = stamps
+      done.add(stage)
+
+    for stage in list(by_stage):
+      resolve(stage)
+    return arrays
+
+  def summary(self) -> List[StageStats]:
+    stats = []
+    for (node, stage), array in sorted(self.resolved().items()):
+      durations = (array[:, 2] - array[:, 1]) / 1e6
+      ages = (array[array[:, 0] > 0, 2] - array[array[:, 0] > 0, 0]) / 1e6
+      stats.append(
+        StageStats(
+          f"{node}/{stage}",
+          len(array),
+          percentiles(durations),
+          percentiles(ages),
+        )
+      )
+    return stats
+
+  def write_csv(self, path: str) -> int:
+    """! Write recent spans with resolved stamps as CSV
+    @return number of spans written
+    """
+    rows = 0
+    with open(path, "w", newline="") as f:
+      writer = csv.writer(f)
+      writer.writerow(("node", "stage", "stamp", "entry", "exit"))
+      for (node, stage), array in sorted(self.resolved().items()):
+        for stamp, entry, exit in array.tolist():
+          writer.writerow((node, stage, stamp, entry, exit))
+          rows += 1
+    return rows
+
+
+def percentiles(values: np.ndarray) -> Tuple[float, ...]:
+  if len(values) == 0:
+    return (float("nan"),) * len(PERCENTILES)
+  return tuple(np.percentile(values, PERCENTILES).tolist())
+
+
+def stamp_to_ns(stamp) -> int:
+  """! Nanoseconds of a builtin_interfaces/Time stamp"""
+  return stamp.sec * 1_000_000_000 + stamp.nanosec
@@ -0,0 +1,91 @@
+"""
+Time for the robot to get aligned in front of each silo.
+
+The robot stores a ball from the approach point, at a standoff distance in front of
+the silo, with its camera facing the silo wall. To get there it turns from its heading
+to the bearing of the approach point, drives to it, then turns to the approach heading,
+so silos at equal distance are ranked by how much the robot has to turn for them. Once
+at the approach point, only the last turn is left.
+Costs of all silos are computed in one vectorized step into preallocated buffers and
+reused until the pose moves beyond an epsilon.
+"""
+
+from math import hypot
+
+import numpy as np
+
+from silo.geometry import wrap_angle
+
+
+class TravelCost:
+  def __init__(
+    self,
+    silos_xy: np.ndarray,
+    approach_standoff: float,
+    linear_speed: float,
+    angular_speed: float,
+    position_epsilon: float = 0.02,
+    yaw_epsilon: float = np.radians(2.0),
+    camera_heading: float = 0.0,
+  ):
+    """! Time-to-align model of silos
+    @param silos_xy (5, 2) x, y of silos w.r.t. map
+    @param approach_standoff distance of approach point from center of silo in meters
+    @param linear_speed average speed of base in m/s
+    @param angular_speed average angular speed of base in rad/s
+    @param position_epsilon displacement in meters below which costs are reused
+    @param yaw_epsilon rotation in radians below which costs are reused
+    @param camera_heading heading of camera w.r.t. base_link in radians, see
+    geometry.optical_axis_heading
+    """
+    silos_xy = np.asarray(silos_xy, dtype=float)
+    # Silo wall is at y of silos, camera faces it from the field side
+    wall_heading = np.pi / 2 if silos_xy[0, 1] > 0 else -np.pi / 2
+    self.approach_yaw = float(wrap_angle(wall_heading - camera_heading))
+    self.approach_xy = silos_xy.copy()
+    self.approach_xy[:, 1] -= approach_standoff * np.sin(wall_heading)
+
+    self.linear_speed = linear_speed
+    self.angular_speed = angular_speed
+    self.position_epsilon = position_epsilon
+    self.yaw_epsilon = yaw_epsilon
+
+    ## Preallocated buffers
+    self.pose = np.zeros(3)
+    self.is_valid = False
+    self.dx = np.zeros(len(silos_xy))
+    self.dy = np.zeros(len(silos_xy))
+    self.distance = np.zeros(len(silos_xy))
+    self.bearing = np.zeros(len(silos_xy))
+    self.turn = np.zeros(len(silos_xy))
+    self.cost = np.zeros(len(silos_xy))
+
+  def costs(self, pose: np.ndarray) -> np.ndarray:
+    """! Time to align in front of each silo
+    @param pose x, y, yaw of base w.r.t. map
+    @return (5,) time in seconds, indexed by silo index - 1
+    """
+    if (
+      self.is_valid
+      and hypot(pose[0] - self.pose[0], pose[1] - self.pose[1]) <= self.position_epsilon
+      and abs(wrap_angle(pose[2] - self.pose[2])) <= self.yaw_epsilon
+    ):
+      return self.cost
+
+    self.pose[:] = pose
+    self.is_valid = True
+    np.subtract(self.approach_xy[:, 0], pose[0], out=self.dx)
+    np.subtract(self.approach_xy[:, 1], pose[1], out=self.dy)
+    np.hypot(self.dx, self.dy, out=self.distance)
+    np.arctan2(self.dy, self.dx, out=self.bearing)
+
+    ## Turn to bearing of approach point, then from it to approach heading
+    self.turn[:] = np.abs(wrap_angle(self.bearing - pose[2]))
+    self.turn += np.abs(wrap_angle(self.approach_yaw - self.bearing))
+    # Bearing is undefined at the approach point, only the turn in place is left
+    in_place = abs(wrap_angle(self.approach_yaw - pose[2]))
+    np.copyto(self.turn, in_place, where=self.distance <= self.position_epsilon)
+
+    np.divide(self.distance, self.linear_speed, out=self.cost)
+    self.cost += self.turn / self.angular_speed
+    return self.cost
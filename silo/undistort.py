@@ -0,0 +1,233 @@
+"""
+Compensation of lens distortion (plumb_bob) of the camera.
+
+Two modes, both keep the camera matrix so that undistorted pixels stay comparable with
+the distorted ones near the center of the image:
+- frame -> maps of initUndistortRectifyMap are computed once for the image size and
+  every frame is remapped
+- points -> undistorted position of every node of a pixel grid is computed once, then
+  points (e.g. corners of bounding boxes) are undistorted by bilinear interpolation in
+  that grid, without touching pixels
+
+The radial model of a calibration with a negative k3 folds back beyond some radius,
+points can only be undistorted inside of it. A calibration whose invertible radius
+does not cover the image is refused by PointUndistorter.
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from silo.estimation import Detection
+
+
+def radial_inverse(dist_coeffs: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+  """! Undistorted & distorted normalized radii on the monotonic range of radial model
+  @return increasing radii, distorted radii, the last one is the largest invertible
+  """
+  k1, k2, _, _, k3 = (list(dist_coeffs) + [0.0] * 5)[:5]
+  radii = np.linspace(0.0, 3.0, 3001)
+  r2 = radii * radii
+  distorted_radii = radii * (1 + r2 * (k1 + r2 * (k2 + r2 * k3)))
+  decreasing = np.flatnonzero(np.diff(distorted_radii) <= 0)
+  end = decreasing[0] + 1 if len(decreasing) else len(radii)
+  return radii[:end], distorted_radii[:end]
+
+
+def distort_points(
+  points: np.ndarray, camera_matrix: Sequence[float], dist_coeffs: Sequence[float]
+) -> np.ndarray:
+  """! Distorted pixel coordinates of (N, 2) undistorted ones by plumb_bob model"""
+  k = np.asarray(camera_matrix, dtype=float).reshape(3, 3)
+  k1, k2, p1, p2, k3 = (list(dist_coeffs) + [0.0] * 5)[:5]
+  fx, fy, cx, cy = k[0, 0], k[1, 1], k[0, 2], k[1, 2]
+  x = (points[:, 0] - cx) / fx
+  y = (points[:, 1] - cy) / fy
+  r2 = x * x + y * y
+  radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+  xd = x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x)
+  yd = y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y
+  return np.column_stack((xd * fx + cx, yd * fy + cy))
+
+
+def undistort_points(
+  points: np.ndarray,
+  camera_matrix: Sequence[float],
+  dist_coeffs: Sequence[float],
+  iterations: int = 5,
+) -> np.ndarray:
+  """! Undistorted pixel coordinates by inversion of plumb_bob model
+  The radial model is inverted on its monotonic range, then Newton iterations correct
+  for tangential distortion. Points distorted beyond the largest invertible radius are
+  clamped to it and do not round-trip, with a negative k3 this radius may lie inside
+  the image, see PointUndistorter.
+  @param points (N, 2) distorted pixel coordinates
+  @param camera_matrix row-major 3x3 camera matrix
+  @param dist_coeffs k1, k2, p1, p2, k3
+  @return (N, 2) undistorted pixel coordinates
+  """
+  k = np.asarray(camera_matrix, dtype=float).reshape(3, 3)
+  k1, k2, p1, p2, k3 = (list(dist_coeffs) + [0.0] * 5)[:5]
+  fx, fy, cx, cy = k[0, 0], k[1, 1], k[0, 2], k[1, 2]
+
+  ## Radial inverse on monotonic range of distorted radius
+  radii, distorted_radii = radial_inverse(dist_coeffs)
+
+  x0 = (points[:, 0] - cx) / fx
+  y0 = (points[:, 1] - cy) / fy
+  rho = np.hypot(x0, y0)
+  clamped_rho = np.minimum(rho, distorted_radii[-1])
+  x0 = np.where(rho > 0, x0 * clamped_rho / np.maximum(rho, 1e-12), x0)
+  y0 = np.where(rho > 0, y0 * clamped_rho / np.maximum(rho, 1e-12), y0)
+  scale = np.interp(clamped_rho, distorted_radii, radii) / np.maximum(
+    clamped_rho, 1e-12
+  )
+  x = np.where(rho > 0, x0 * scale, x0)
+  y = np.where(rho > 0, y0 * scale, y0)
+
+  def residual(x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    r2 = x * x + y * y
+    radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+    return (
+      x * radial + 2 * p1 * x * y + p2 * (r2 + 2 * x * x) - x0,
+      y * radial + p1 * (r2 + 2 * y * y) + 2 * p2 * x * y - y0,
+    )
+
+  ## Newton iterations on full model
+  radial_x, radial_y = x, y
+  with np.errstate(all="ignore"):
+    for _ in range(iterations):
+      r2 = x * x + y * y
+      radial = 1 + r2 * (k1 + r2 * (k2 + r2 * k3))
+      d_radial = k1 + r2 * (2 * k2 + 3 * k3 * r2)
+      ex, ey = residual(x, y)
+      jxx = radial + 2 * x * x * d_radial + 2 * p1 * y + 6 * p2 * x
+      jxy = 2 * x * y * d_radial + 2 * p1 * x + 2 * p2 * y
+      jyy = radial + 2 * y * y * d_radial + 6 * p1 * y + 2 * p2 * x
+      determinant = jxx * jyy - jxy * jxy
+      x = x - (jyy * ex - jxy * ey) / determinant
+      y = y - (jxx * ey - jxy * ex) / determinant
+
+    # Keep radial inverse where Newton left the invertible range or got worse
+    is_worse = ~(np.hypot(x, y) <= radii[-1]) | (
+      np.hypot(*residual(x, y)) > np.hypot(*residual(radial_x, radial_y))
+    )
+  x = np.where(is_worse, radial_x, x)
+  y = np.where(is_worse, radial_y, y)
+  return np.column_stack((x * fx + cx, y * fy + cy))
+
+
+class PointUndistorter:
+  def __init__(
+    self,
+    camera_matrix: Sequence[float],
+    dist_coeffs: Sequence[float],
+    image_size: Tuple[int, int],
+    grid_step: int = 8,
+  ):
+    """! Lookup table of undistorted positions of a pixel grid
+    @param camera_matrix row-major 3x3 camera matrix
+    @param dist_coeffs k1, k2, p1, p2, k3
+    @param image_size width, height
+    @param grid_step spacing of grid nodes in pixels
+    @throw ValueError if radial model is not invertible over the whole image
+    """
+    width, height = image_size
+    self.grid_step = grid_step
+    grid_x = np.arange(0, width + grid_step, grid_step, dtype=float)
+    grid_y = np.arange(0, height + grid_step, grid_step, dtype=float)
+    self.max_x = grid_x[-1]
+    self.max_y = grid_y[-1]
+    nodes = np.stack(np.meshgrid(grid_x, grid_y), axis=-1).reshape(-1, 2)
+
+    ## Clamped nodes would squash every box beyond the invertible radius
+    k = np.asarray(camera_matrix, dtype=float).reshape(3, 3)
+    rho = np.hypot((nodes[:, 0] - k[0, 2]) / k[0, 0], (nodes[:, 1] - k[1, 2]) / k[1, 1])
+    max_rho = radial_inverse(dist_coeffs)[1][-1]
+    outside = np.mean(rho > max_rho)
+    if outside > 0:
+      raise ValueError(
+        f"Distortion is only invertible up to normalized radius {max_rho:.3f}, "
+        f"{outside:.0%} of the {width}x{height} image is beyond it"
+      )
+    # (rows, cols, 2) undistorted x, y of each node
+    self.lut = undistort_points(nodes, camera_matrix, dist_coeffs).reshape(
+      len(grid_y), len(grid_x), 2
+    )
+
+  def undistort_points(self, points: np.ndarray) -> np.ndarray:
+    """! (N, 2) undistorted pixel coordinates of (N, 2) points inside image"""
+    x = np.clip(points[:, 0], 0, self.max_x) / self.grid_step
+    y = np.clip(points[:, 1], 0, self.max_y) / self.grid_step
+    col = np.minimum(x.astype(int), self.lut.shape[1] - 2)
+    row = np.minimum(y.astype(int), self.lut.shape[0] - 2)
+    tx = (x - col)[:, None]
+    ty = (y - row)[:, None]
+
+    top = self.lut[row, col] * (1 - tx) + self.lut[row, col + 1] * tx
+    bottom = self.lut[row + 1, col] * (1 - tx) + self.lut[row + 1, col + 1] * tx
+    return top * (1 - ty) + bottom * ty
+
+  def undistort_detections(self, detections: Sequence[Detection]) -> List[Detection]:
+    """! Detections with axis-aligned bounding boxes of undistorted corners"""
+    if not detections:
+      return []
+    boxes = np.array([(d.x, d.y, d.width, d.height) for d in detections], dtype=float)
+    half_w = boxes[:, 2] / 2
+    half_h = boxes[:, 3] / 2
+    corners = np.stack(
+      (
+        np.column_stack((boxes[:, 0] - half_w, boxes[:, 1] - half_h)),
+        np.column_stack((boxes[:, 0] + half_w, boxes[:, 1] - half_h)),
+        np.column_stack((boxes[:, 0] - half_w, boxes[:, 1] + half_h)),
+        np.column_stack((boxes[:, 0] + half_w, boxes[:, 1] + half_h)),
+      ),
+      axis=1,
+    )
+    corners = self.undistort_points(corners.reshape(-1, 2)).reshape(-1, 4, 2)
+    low = corners.min(axis=1)
+    high = corners.max(axis=1)
+    center = ((low + high) / 2).tolist()
+    size = (high - low).tolist()
+    return [
+      Detection(detection.class_name, *center[i], *size[i])
+      for i, detection in enumerate(detections)
+    ]
+
+
+class FrameUndistorter:
+  def __init__(
+    self,
+    camera_matrix: Sequence[float],
+    dist_coeffs: Sequence[float],
+    image_size: Tuple[int, int],
+  ):
+    """! Remapping of whole frames, maps are computed once
+    @param camera_matrix row-major 3x3 camera matrix
+    @param dist_coeffs k1, k2, p1, p2, k3
+    @param image_size width, height of frames
+    """
+    import cv2
+
+    self.image_size = tuple(image_size)
+    k = np.asarray(camera_matrix, dtype=float).reshape(3, 3)
+    # Fixed point maps are faster to remap with than float maps
+    self.map1, self.map2 = cv2.initUndistortRectifyMap(
+      k,
+      np.asarray(dist_coeffs, dtype=float),
+      None,
+      k,
+      self.image_size,
+      cv2.CV_16SC2,
+    )
+    self.interpolation = cv2.INTER_LINEAR
+    self.remap = cv2.remap
+
+  def __call__(self, bgr_img: np.ndarray) -> np.ndarray:
+    """! Undistorted frame, frame must be of image_size"""
+    if (bgr_img.shape[1], bgr_img.shape[0]) != self.image_size:
+      raise ValueError(
+        f"Frame of size {bgr_img.shape[1]}x{bgr_img.shape[0]} can't be undistorted"
+        f" with maps of size {self.image_size[0]}x{self.image_size[1]}"
+      )
+    return self.remap(bgr_img, self.map1, self.map2, self.interpolation)
@@ -0,0 +1,169 @@
+"""
+CPU inference of YOLOv8 detection models exported to ONNX, without torch.
+
+Export a model with `yolo export model=check_top.pt format=onnx imgsz=320`. The model
+is run by a persistent session of either:
+- onnxruntime -> fastest on CPU, reads class names from the metadata of the export
+- opencv -> cv2.dnn, no extra dependency, class names must be given
+
+Weights can be quantized to INT8 with `python3 -m silo.yolo_onnx in.onnx out.onnx`
+(dynamic quantization through onnxruntime), the quantized model is loaded the same way.
+"""
+
+import argparse
+import ast
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+RUNTIMES = ("onnxruntime", "opencv")
+
+
+def letterbox(
+  bgr_img: np.ndarray, size: int, out: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+  """! Resize keeping aspect ratio & pad to a square
+  @param out (size, size, 3) buffer to write into
+  @return padded image, scale & (x, y) padding in pixels
+  """
+  height, width = bgr_img.shape[:2]
+  scale = min(size / width, size / height)
+  resized_width, resized_height = round(width * scale), round(height * scale)
+  pad_x, pad_y = (size - resized_width) // 2, (size - resized_height) // 2
+
+  if out is None:
+    out = np.empty((size, size, 3), dtype=np.uint8)
+  out[:] = 114
+  out[pad_y : pad_y + resized_height, pad_x : pad_x + resized_width] = cv2.resize(
+    bgr_img, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR
+  )
+  return out, scale, (pad_x, pad_y)
+
+
+class YoloOnnx:
+  def __init__(
+    self,
+    model: str,
+    input_size: int = 320,
+    threshold: float = 0.5,
+    iou_threshold: float = 0.45,
+    runtime: str = "onnxruntime",
+    threads: int = 0,
+    class_names: Sequence[str] = (),
+  ):
+    """! Persistent inference session
+    @param model path of ONNX model, exported at input_size
+    @param threshold minimum confidence of detections
+    @param iou_threshold IoU above which overlapping detections are suppressed
+    @param runtime one of RUNTIMES
+    @param threads number of CPU threads of inference, 0 for default of runtime
+    @param class_names names of classes, read from model metadata if empty
+    """
+    if runtime not in RUNTIMES:
+      raise ValueError(f"Unknown runtime: {runtime}")
+    self.input_size = input_size
+    self.threshold = threshold
+    self.iou_threshold = iou_threshold
+    self.runtime = runtime
+    self.names = list(class_names)
+
+    if runtime == "onnxruntime":
+      import onnxruntime
+
+      options = onnxruntime.SessionOptions()
+      options.graph_optimization_level = (
+        onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+      )
+      options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+      options.intra_op_num_threads = threads
+      options.inter_op_num_threads = 1
+      self.session = onnxruntime.InferenceSession(
+        model, options, providers=["CPUExecutionProvider"]
+      )
+      self.input_name = self.session.get_inputs()[0].name
+      if not self.names:
+        self.names = self.read_names(self.session.get_modelmeta().custom_metadata_map)
+    else:
+      if threads > 0:
+        cv2.setNumThreads(threads)
+      self.net = cv2.dnn.readNetFromONNX(model)
+      self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+      self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    ## Preallocated input buffers
+    self.letterboxed = np.empty((input_size, input_size, 3), dtype=np.uint8)
+    self.blob = np.empty((1, 3, input_size, input_size), dtype=np.float32)
+
+  @staticmethod
+  def read_names(metadata) -> List[str]:
+    """! Class names from metadata of an ultralytics export"""
+    if "names" not in metadata:
+      return []
+    names = ast.literal_eval(metadata["names"])
+    return [names[i] for i in sorted(names)]
+
+  def class_name(self, class_id: int) -> str:
+    return self.names[class_id] if class_id < len(self.names) else str(class_id)
+
+  def predict(self, bgr_img: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """! Detections in image
+    @return (N, 4) xyxy boxes in pixels of image, (N,) confidences & (N,) class ids
+    """
+    _, scale, (pad_x, pad_y) = letterbox(bgr_img, self.input_size, self.letterboxed)
+    ## HWC BGR uint8 -> NCHW RGB float in [0, 1]
+    np.divide(self.letterboxed[:, :, ::-1].transpose(2, 0, 1), 255.0, out=self.blob[0])
+
+    if self.runtime == "onnxruntime":
+      output = self.session.run(None, {self.input_name: self.blob})[0]
+    else:
+      self.net.setInput(self.blob)
+      output = self.net.forward()
+
+    ## (1, 4 + classes, anchors) -> best class of each anchor
+    predictions = output[0].T
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    confidences = class_scores[np.arange(len(class_ids)), class_ids]
+    keep = confidences >= self.threshold
+    predictions, class_ids, confidences = (
+      predictions[keep],
+      class_ids[keep],
+      confidences[keep],
+    )
+    if len(predictions) == 0:
+      return np.zeros((0, 4), dtype=np.float32), confidences, class_ids
+
+    ## cx, cy, w, h in input -> x, y, w, h in image
+    boxes_xywh = predictions[:, :4].copy()
+    boxes_xywh[:, 0] -= boxes_xywh[:, 2] / 2 + pad_x
+    boxes_xywh[:, 1] -= boxes_xywh[:, 3] / 2 + pad_y
+    boxes_xywh /= scale
+
+    indices = cv2.dnn.NMSBoxesBatched(
+      boxes_xywh.tolist(),
+      confidences.tolist(),
+      class_ids.tolist(),
+      self.threshold,
+      self.iou_threshold,
+    )
+    indices = np.asarray(indices, dtype=int).reshape(-1)
+    boxes_xyxy = boxes_xywh[indices]
+    boxes_xyxy[:, 2:] += boxes_xyxy[:, :2]
+    return boxes_xyxy, confidences[indices], class_ids[indices]
+
+
+def main(args=None):
+  parser = argparse.ArgumentParser(description="Quantize weights of model to INT8")
+  parser.add_argument("model", help="ONNX model")
+  parser.add_argument("output", help="quantized ONNX model")
+  args = parser.parse_args(args)
+
+  from onnxruntime.quantization import QuantType, quantize_dynamic
+
+  quantize_dynamic(args.model, args.output, weight_type=QuantType.QUInt8)
+  print(f"Quantized model saved to {args.output}")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,96 @@
+from itertools import product
+
+import pytest
+
+from silo.priority import FULL_PRIORITY, build_priority_table, rank_silos
+from silo.stacks import STACKS
+
+TEAMS = [("B", "R"), ("R", "B")]
+DISTANCES = {
+  "distinct": [2.5, 1.0, 3.0, 0.5, 2.0],
+  "equal": [1.0] * 5,
+}
+
+
+def reference_targets(states, distances, team_repr, opponent_repr):
+  """Two stage if/elif priority buckets formerly in SiloSelection"""
+  priority_list = [[] for _ in range(6)]
+  full_silos = set()
+  for index, state in enumerate(states, start=1):
+    if state == team_repr + opponent_repr or state == opponent_repr + team_repr:
+      priority_list[0].append(index)
+    elif state == team_repr * 2:
+      priority_list[1].append(index)
+    elif state == opponent_repr * 2:
+      priority_list[2].append(index)
+    elif state == "":
+      priority_list[3].append(index)
+    elif state == team_repr:
+      priority_list[4].append(index)
+    elif state == opponent_repr:
+      priority_list[5].append(index)
+    else:
+      full_silos.add(index)
+
+  def nearest(indexes):
+    silos_distance = [distances[index - 1] for index in indexes]
+    return indexes[silos_distance.index(min(silos_distance))]
+
+  optimal_silos = [0] * 2
+  for silos in priority_list:
+    if silos:
+      optimal_silos[0] = nearest(silos)
+      silos.remove(optimal_silos[0])
+      break
+  for silos in priority_list:
+    if silos:
+      optimal_silos[1] = nearest(silos)
+      break
+  return optimal_silos, full_silos
+
+
+@pytest.mark.parametrize("team_repr, opponent_repr", TEAMS)
+def test_priority_table_covers_all_stacks(team_repr, opponent_repr):
+  table = build_priority_table(team_repr, opponent_repr)
+  assert set(table) == set(STACKS)
+  for stack, priority in table.items():
+    assert (priority == FULL_PRIORITY) == (len(stack) == 3)
+
+
+@pytest.mark.parametrize("distances", DISTANCES.values(), ids=DISTANCES.keys())
+@pytest.mark.parametrize("team_repr, opponent_repr", TEAMS)
+def test_rank_silos_matches_reference_for_all_states(
+  team_repr, opponent_repr, distances
+):
+  table = build_priority_table(team_repr, opponent_repr)
+  for states in product(STACKS, repeat=5):
+    ranked, full_silos = rank_silos(enumerate(states, start=1), distances, table, 2)
+    targets = [index for _, _, index in ranked] + [0] * (2 - len(ranked))
+
+    expected_targets, expected_full_silos = reference_targets(
+      states, distances, team_repr, opponent_repr
+    )
+    assert targets == expected_targets, states
+    assert set(full_silos) == expected_full_silos, states
+
+
+def test_rank_silos_top_k_is_sorted_by_priority_then_distance():
+  table = build_priority_table("B", "R")
+  states = ["R", "", "BR", "BB", "RR"]
+  distances = [1.0, 2.0, 3.0, 0.5, 0.2]
+
+  ranked, full_silos = rank_silos(enumerate(states, start=1), distances, table, 5)
+
+  assert [index for _, _, index in ranked] == [3, 4, 5, 2, 1]
+  assert [priority for priority, _, _ in ranked] == [0, 1, 2, 3, 5]
+  assert full_silos == []
+
+
+def test_rank_silos_with_all_silos_full():
+  table = build_priority_table("R", "B")
+  states = ["RRR", "BBB", "RBR", "BRB", "RRB"]
+
+  ranked, full_silos = rank_silos(enumerate(states, start=1), [1.0] * 5, table, 2)
+
+  assert ranked == []
+  assert full_silos == [1, 2, 3, 4, 5]
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from silo.priority import build_priority_table, rank_silos
+from silo.travel_cost import TravelCost
+
+SILOS_XY = np.array([(x, -4.289) for x in (1.5, 0.75, 0.0, -0.75, -1.5)])
+
+
+def travel_cost():
+  # Camera looks along -x of base_link, as in config/base2cam.yaml
+  return TravelCost(SILOS_XY, 0.5, 1.5, 2.0, camera_heading=np.pi)
+
+
+@pytest.mark.parametrize("yaw, nearest", [(0.0, 2), (np.pi, 4)])
+def test_silos_at_equal_distance_are_ranked_by_heading(yaw, nearest):
+  # Silos 2 & 4 are at the same distance from a pose in front of silo 3
+  pose = np.array([0.0, -2.0, yaw])
+  costs = travel_cost().costs(pose)
+  assert costs[1] != pytest.approx(costs[3])
+
+  silos = [(1, "RRR"), (2, ""), (3, "RRR"), (4, ""), (5, "RRR")]
+  ranked, _ = rank_silos(silos, costs, build_priority_table("B", "R"))
+  assert ranked[0][2] == nearest
+
+
+def test_aligned_at_approach_point_costs_nothing():
+  # Approach heading faces the camera to the wall
+  costs = travel_cost().costs(np.array([0.0, -3.789, np.pi / 2]))
+  assert costs[2] == pytest.approx(0.0, abs=1e-6)
+  assert np.argmin(costs) == 2
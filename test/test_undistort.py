@@ -0,0 +1,65 @@
+import os
+
+import numpy as np
+import pytest
+
+from silo.params import load_params_files
+from silo.undistort import (
+  PointUndistorter,
+  distort_points,
+  radial_inverse,
+  undistort_points,
+)
+
+CAMERA_INFO = os.path.join(
+  os.path.dirname(__file__), "..", "config", "camera_info.yaml"
+)
+
+
+@pytest.fixture(scope="module")
+def calibration():
+  params = load_params_files([CAMERA_INFO])
+  return params["k"], params["d"], (params["width"], params["height"])
+
+
+def pixel_grid(image_size, step=4):
+  width, height = image_size
+  grid = np.meshgrid(np.arange(0, width + 1, step), np.arange(0, height + 1, step))
+  return np.stack(grid, axis=-1).reshape(-1, 2).astype(float)
+
+
+def normalized_radius(points, k):
+  k = np.asarray(k, dtype=float).reshape(3, 3)
+  return np.hypot(
+    (points[:, 0] - k[0, 2]) / k[0, 0], (points[:, 1] - k[1, 2]) / k[1, 1]
+  )
+
+
+def test_shipped_calibration_round_trips_inside_invertible_radius(calibration):
+  k, d, image_size = calibration
+  pixels = pixel_grid(image_size)
+  # Margin for tangential distortion, which the radial limit ignores
+  inside = normalized_radius(pixels, k) < radial_inverse(d)[1][-1] - 0.01
+  assert inside.any()
+
+  round_trip = distort_points(undistort_points(pixels[inside], k, d), k, d)
+  np.testing.assert_allclose(round_trip, pixels[inside], atol=0.05)
+
+
+def test_shipped_calibration_is_refused_beyond_invertible_radius(calibration):
+  k, d, image_size = calibration
+  # Radial model of shipped calibration folds back inside the image
+  assert (normalized_radius(pixel_grid(image_size), k) > radial_inverse(d)[1][-1]).any()
+  with pytest.raises(ValueError):
+    PointUndistorter(k, d, image_size)
+
+
+def test_lookup_table_round_trips_whole_image(calibration):
+  k, _, image_size = calibration
+  # Mild distortion, invertible over the whole image
+  d = [0.05, -0.1, 0.003, 0.00015, 0.0]
+  undistorter = PointUndistorter(k, d, image_size)
+  pixels = pixel_grid(image_size)
+
+  round_trip = distort_points(undistorter.undistort_points(pixels), k, d)
+  np.testing.assert_allclose(round_trip, pixels, atol=0.5)